@@ -1,21 +1,129 @@
-from django.contrib import admin
+from django import forms
+from django.contrib import admin, messages
+from django.contrib.admin.helpers import ActionForm
+from django.core.paginator import Paginator
+from django.db.models import QuerySet
+from django.utils.functional import cached_property
 
+from referrals.choices import BulkActionChoices
+from referrals.config import config
 from referrals.models import ReferralProgram, PayoutMethod, Referral, Promoter, PromoterCommission, \
-    PromoterPayout
+    PromoterPayout, ReferralProgramLevel, ReferralProgramTier, BulkActionJob, FxRate
+from referrals.repositories import promoter_repository
+from referrals.repositories.base_repository import BaseRepository
+from referrals.services.bulk_action_service import bulk_action_service
+from referrals.services.fx_rate_service import fx_rate_service
+
+
+class EstimatedCountPaginator(Paginator):
+    """
+    Paginator that uses the table statistics instead of an exact `COUNT(*)` for unfiltered changelists of
+    tables with more than `ADMIN_ESTIMATED_COUNT_THRESHOLD` rows. Filtered changelists are counted exactly.
+    """
+
+    @cached_property
+    def count(self) -> int:
+        queryset = self.object_list
+        if isinstance(queryset, QuerySet) and not queryset.query.where:
+            estimate = BaseRepository(queryset.model).get_estimated_count(using=queryset.db)
+            if estimate is not None and estimate >= config.ADMIN_ESTIMATED_COUNT_THRESHOLD:
+                return estimate
+        return super().count
+
+
+class AmountRangeFilter(admin.SimpleListFilter):
+    title = "amount"
+    parameter_name = "amount_range"
+    ranges = {
+        "0-10": ("Less than 10", None, 10),
+        "10-100": ("10 to 100", 10, 100),
+        "100-1000": ("100 to 1000", 100, 1000),
+        "1000-": ("1000 or more", 1000, None),
+    }
+
+    def lookups(self, request, model_admin):
+        return [(value, label) for value, (label, _, _) in self.ranges.items()]
+
+    def queryset(self, request, queryset):
+        if self.value() not in self.ranges:
+            return queryset
+        _, amount_from, amount_to = self.ranges[self.value()]
+        if amount_from is not None:
+            queryset = queryset.filter(amount__gte=amount_from)
+        if amount_to is not None:
+            queryset = queryset.filter(amount__lt=amount_to)
+        return queryset
+
+
+class LargeTableAdmin(admin.ModelAdmin):
+    """
+    Base changelist settings for tables with millions of rows: estimated counts instead of `COUNT(*)`, no
+    second unfiltered count next to filtered results and no facet counts (on Django versions that have them).
+    """
+
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+    if hasattr(admin, "ShowFacets"):  # Django >= 5.0
+        show_facets = admin.ShowFacets.NEVER
+
+
+class BulkActionMixin:
+    """
+    Runs admin bulk actions through `bulk_action_service`: small selections right away, large ones as a
+    background job.
+    """
+
+    def submit_bulk_action(self, request, queryset, action: str, **params) -> None:
+        object_ids = list(queryset.order_by("pk").values_list("pk", flat=True))
+        changed, job = bulk_action_service.submit(action, object_ids, requested_by=request.user, **params)
+        if job:
+            self.message_user(
+                request,
+                f"{len(object_ids)} objects selected, the action was queued as bulk action job #{job.id}.",
+                messages.INFO,
+            )
+        else:
+            self.message_user(request, f"{changed} of {len(object_ids)} selected objects changed.", messages.SUCCESS)
+
+
+class FailureReasonActionForm(ActionForm):
+    failure_reason = forms.CharField(required=False, label="Failure reason")
+
+
+class ReferralProgramLevelInline(admin.TabularInline):
+    model = ReferralProgramLevel
+    extra = 0
+
+
+class ReferralProgramTierInline(admin.TabularInline):
+    model = ReferralProgramTier
+    extra = 0
 
 
 @admin.register(ReferralProgram)
 class ReferralProgramAdmin(admin.ModelAdmin):
-    list_display = ("name", "commission_rate", "is_active", "id")
+    list_display = ("name", "commission_rate", "is_active", "is_default", "id")
+    inlines = (ReferralProgramLevelInline, ReferralProgramTierInline)
 
 
 @admin.register(PayoutMethod)
 class PayoutMethodAdmin(admin.ModelAdmin):
-    list_display = ("method", "payment_address")
+    list_display = ("method", "payment_address", "currency")
+
+
+@admin.register(FxRate)
+class FxRateAdmin(admin.ModelAdmin):
+    list_display = ("currency", "rate", "updated")
+    search_fields = ("currency",)
+
+    def save_model(self, request, obj, form, change):
+        super().save_model(request, obj, form, change)
+        fx_rate_service.invalidate()
 
 
 @admin.register(Referral)
-class ReferralAdmin(admin.ModelAdmin):
+class ReferralAdmin(BulkActionMixin, LargeTableAdmin):
+    actions = ("flag_selected", "clear_selected_flags")
     autocomplete_fields = (
         "user",
         "promoter",
@@ -26,27 +134,96 @@ class ReferralAdmin(admin.ModelAdmin):
         "promoter",
         "invitation_method",
         "status",
+        "is_flagged",
+        "flag_reason",
+        "created",
     )
-    search_fields = ("id",)
-    list_filter = ("status", "invitation_method", "id")
+    list_select_related = ("user", "promoter__user")
+    search_fields = ("=id", "=user__email")
+    list_filter = ("status", "invitation_method", "is_flagged", "flag_reason",
+                   ("created", admin.DateFieldListFilter))
+    readonly_fields = ("is_flagged", "flag_reason")
+
+    @admin.action(description="Flag selected referrals as fraudulent")
+    def flag_selected(self, request, queryset):
+        self.submit_bulk_action(request, queryset, BulkActionChoices.FLAG_REFERRALS)
+
+    @admin.action(description="Clear the fraud flags of selected referrals")
+    def clear_selected_flags(self, request, queryset):
+        self.submit_bulk_action(request, queryset, BulkActionChoices.CLEAR_REFERRAL_FLAGS)
 
 
 @admin.register(Promoter)
-class PromoterAdmin(admin.ModelAdmin):
+class PromoterAdmin(BulkActionMixin, LargeTableAdmin):
+    actions = ("pay_selected_promoters",)
     autocomplete_fields = ("user",)
-    search_fields = ("user__email",)
-    list_display = ("referral_link", "referral_token", "user", "id")
+    search_fields = ("=user__email",)
+    list_display = ("referral_link", "referral_token", "user", "id", "program", "referrals_count", "total_earned",
+                    "total_paid", "balance")
+    list_filter = ("program",)
+    list_select_related = ("user", "program")
+    readonly_fields = ("active_referrals_count", "tier_commission_rate")
+
+    def get_queryset(self, request):
+        queryset = super().get_queryset(request)
+        return promoter_repository.annotate_referrals_count(promoter_repository.annotate_balances(queryset))
+
+    @admin.display(ordering="referrals_count", description="Referrals")
+    def referrals_count(self, obj):
+        return obj.referrals_count
+
+    @admin.display(ordering="total_earned", description="Total earned")
+    def total_earned(self, obj):
+        return obj.total_earned
+
+    @admin.display(ordering="total_paid", description="Total paid")
+    def total_paid(self, obj):
+        return obj.total_paid
+
+    @admin.display(ordering="balance", description="Balance")
+    def balance(self, obj):
+        return obj.balance
+
+    @admin.action(description="Pay selected promoters")
+    def pay_selected_promoters(self, request, queryset):
+        self.submit_bulk_action(request, queryset, BulkActionChoices.PAY_PROMOTERS)
 
 
 @admin.register(PromoterCommission)
-class PromoterCommissionAdmin(admin.ModelAdmin):
-    search_fields = ("promoter__user__email",)
-    list_display = ("promoter", "referral", "amount", "status")
-    list_filter = ("status", "amount")
+class PromoterCommissionAdmin(BulkActionMixin, LargeTableAdmin):
+    action_form = FailureReasonActionForm
+    actions = ("mark_failed_with_reason", "retry_failed")
+    autocomplete_fields = ("promoter", "referral")
+    search_fields = ("=promoter__user__email",)
+    list_display = ("promoter", "referral", "amount", "currency", "original_amount", "status", "level", "created")
+    list_select_related = ("promoter__user", "referral")
+    list_filter = ("status", AmountRangeFilter, "level", ("created", admin.DateFieldListFilter))
+
+    @admin.action(description="Mark selected matured commissions failed with reason")
+    def mark_failed_with_reason(self, request, queryset):
+        failure_reason = request.POST.get("failure_reason", "").strip()
+        if not failure_reason:
+            self.message_user(request, "Enter a failure reason to mark commissions failed.", messages.ERROR)
+            return
+        self.submit_bulk_action(request, queryset, BulkActionChoices.FAIL_COMMISSIONS, failure_reason=failure_reason)
+
+    @admin.action(description="Retry selected failed commissions")
+    def retry_failed(self, request, queryset):
+        self.submit_bulk_action(request, queryset, BulkActionChoices.RETRY_COMMISSIONS)
 
 
 @admin.register(PromoterPayout)
-class PromoterPayoutsAdmin(admin.ModelAdmin):
-    search_fields = ("promoter_user_email",)
-    list_display = ("promoter", "amount", "payout_method", "created")
-    list_filter = ("payout_method",)
+class PromoterPayoutsAdmin(LargeTableAdmin):
+    autocomplete_fields = ("promoter",)
+    search_fields = ("=promoter__user__email",)
+    list_display = ("promoter", "amount", "currency", "target_amount", "payout_method", "created")
+    list_select_related = ("promoter__user",)
+    list_filter = ("payout_method", ("created", admin.DateFieldListFilter))
+
+
+@admin.register(BulkActionJob)
+class BulkActionJobAdmin(admin.ModelAdmin):
+    list_display = ("id", "action", "status", "processed", "requested_by", "created", "updated")
+    list_filter = ("action", "status")
+    list_select_related = ("requested_by",)
+    readonly_fields = ("action", "object_ids", "params", "status", "processed", "error", "requested_by")
@@ -0,0 +1,160 @@
+import logging
+import platform
+import time
+from datetime import datetime, timezone
+from typing import Callable, Optional
+
+import django
+import numpy as np
+from django.contrib.auth.models import User
+from django.db import connection, transaction
+from django.db.models import Count
+from rest_framework.test import APIRequestFactory, force_authenticate
+
+from referrals.models import Promoter, PromoterCommission, Referral
+from referrals.services.promoter_payout_service import promoter_payout_service
+from referrals.views import ReferralProgramViewSet
+
+logger = logging.getLogger(__name__)
+
+PERCENTILES = (50, 95, 99)
+
+
+class BenchmarkRunner:
+    """
+    Runs latency benchmarks of the main referral paths against the configured database.
+
+    Every scenario runs in a transaction that is rolled back afterwards, so benchmarks can be repeated on the
+    same data set. Views are called directly through `APIRequestFactory`, which measures the view, serializer
+    and database time without the middleware stack.
+    """
+
+    def __init__(self, iterations: int = 50, payout_iterations: int = 3, promoter: Optional[Promoter] = None):
+        self.iterations = iterations
+        self.payout_iterations = payout_iterations
+        self.factory = APIRequestFactory()
+        self.promoter = promoter or self._get_busiest_promoter()
+        if self.promoter is None:
+            raise ValueError("There are no promoters to benchmark, generate data first.")
+
+    @staticmethod
+    def _get_busiest_promoter() -> Optional[Promoter]:
+        promoter_id = (
+            Referral.objects.values("promoter_id").annotate(referrals=Count("id")).order_by("-referrals")
+            .values_list("promoter_id", flat=True).first()
+        )
+        if promoter_id is None:
+            return Promoter.objects.select_related("user").first()
+        return Promoter.objects.select_related("user").get(pk=promoter_id)
+
+    def _call_view(self, method: str, actions: dict, path: str = "/", data: Optional[dict] = None,
+                   user: Optional[User] = None):
+        request = getattr(self.factory, method)(path, data, format="json" if method == "post" else None)
+        force_authenticate(request, user=user or self.promoter.user)
+        response = ReferralProgramViewSet.as_view(actions)(request)
+        response.render()
+        if response.status_code >= 400:
+            raise RuntimeError(f"{path} returned {response.status_code}: {response.content[:200]}")
+        return response
+
+    def _get_scenarios(self) -> dict[str, tuple[Callable[[int], object], int]]:
+        referrals_count = Referral.objects.filter(promoter=self.promoter).count()
+        last_page = max(referrals_count // 10, 1)
+
+        return {
+            "list_referrals_first_page": (
+                lambda _: self._call_view("get", {"get": "list"}, data={"page": 1, "page_size": 10}), self.iterations
+            ),
+            "list_referrals_last_page": (
+                lambda _: self._call_view("get", {"get": "list"}, data={"page": last_page, "page_size": 10}),
+                self.iterations,
+            ),
+            "retrieve_promoter": (
+                lambda _: self._call_view("get", {"get": "retrieve_promoter"}), self.iterations
+            ),
+            "promoter_recent_earnings": (
+                lambda _: self._call_view("get", {"get": "promoter_recent_earnings"}), self.iterations
+            ),
+            "increment_link_clicked": (
+                lambda _: self._call_view("post", {"post": "increment_link_clicked"},
+                                          data={"referral_token": self.promoter.referral_token}),
+                self.iterations,
+            ),
+            "create_referral": (self._create_referral, self.iterations),
+            "wise_payout_run": (
+                lambda _: promoter_payout_service.send_wise_csv_for_promoters_payouts(), self.payout_iterations
+            ),
+        }
+
+    def _create_referral(self, iteration: int):
+        user = self._referral_users[iteration]
+        return self._call_view(
+            "post", {"post": "create"},
+            data={"email": user.email, "referral_token": self.promoter.referral_token},
+            user=user,
+        )
+
+    def _prepare(self, name: str):
+        if name == "create_referral":
+            prefix = f"benchmark-{int(time.time() * 1000)}"
+            User.objects.bulk_create([
+                User(username=f"{prefix}-{index}", email=f"{prefix}-{index}@example.com", password="!")
+                for index in range(self.iterations)
+            ])
+            self._referral_users = list(User.objects.filter(username__startswith=f"{prefix}-").order_by("id"))
+
+    def run_scenario(self, name: str, func: Callable[[int], object], iterations: int) -> dict:
+        durations = np.empty(iterations, dtype=np.float64)
+        with transaction.atomic():
+            self._prepare(name)
+            for iteration in range(iterations):
+                started = time.perf_counter()
+                func(iteration)
+                durations[iteration] = time.perf_counter() - started
+            transaction.set_rollback(True)
+
+        total = float(durations.sum())
+        result = {
+            "iterations": iterations,
+            "mean_ms": round(float(durations.mean()) * 1000, 3),
+            "min_ms": round(float(durations.min()) * 1000, 3),
+            "max_ms": round(float(durations.max()) * 1000, 3),
+            "throughput_per_s": round(iterations / total, 2) if total else None,
+        }
+        for percentile, value in zip(PERCENTILES, np.percentile(durations, PERCENTILES)):
+            result[f"p{percentile}_ms"] = round(float(value) * 1000, 3)
+        logger.info(f"Benchmark {name}: {result}")
+        return result
+
+    def run(self, scenarios: Optional[list[str]] = None) -> dict:
+        """
+        Runs the benchmark scenarios and returns a JSON-serializable report.
+
+        Args:
+            scenarios (Optional[list[str]]): Names of the scenarios to run, all scenarios by default.
+
+        Returns:
+            dict: The environment metadata, the data set size and the latency statistics per scenario.
+        """
+        available = self._get_scenarios()
+        selected = scenarios or list(available)
+        unknown = set(selected) - set(available)
+        if unknown:
+            raise ValueError(f"Unknown benchmark scenarios: {', '.join(sorted(unknown))}")
+
+        return {
+            "meta": {
+                "timestamp": datetime.now(timezone.utc).isoformat(),
+                "database": connection.vendor,
+                "python": platform.python_version(),
+                "django": django.get_version(),
+                "promoter_id": self.promoter.id,
+            },
+            "dataset": {
+                "users": User.objects.count(),
+                "promoters": Promoter.objects.count(),
+                "referrals": Referral.objects.count(),
+                "commissions": PromoterCommission.objects.count(),
+            },
+            "scenarios": {name: self.run_scenario(name, *available[name]) for name in selected},
+        }
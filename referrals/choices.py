@@ -14,6 +14,63 @@ class InvitationMethodChoices(models.TextChoices):
 
 class PromoterCommissionStatusChoices(models.TextChoices):
     PENDING = "pending"
+    MATURED = "matured"
     PAID = "paid"
     FAILED = "failed"
     REFUND = "refund"
+    FLAGGED = "flagged"
+
+
+class ExportDatasetChoices(models.TextChoices):
+    COMMISSIONS = "commissions"
+    PAYOUTS = "payouts"
+    REFERRALS = "referrals"
+
+
+class ExportFormatChoices(models.TextChoices):
+    CSV = "csv"
+    JSONL = "jsonl"
+
+
+class BulkActionChoices(models.TextChoices):
+    PAY_PROMOTERS = "pay_promoters"
+    FAIL_COMMISSIONS = "fail_commissions"
+    RETRY_COMMISSIONS = "retry_commissions"
+    SYNC_PROGRAM = "sync_program"
+    FLAG_REFERRALS = "flag_referrals"
+    CLEAR_REFERRAL_FLAGS = "clear_referral_flags"
+
+
+class BulkActionJobStatusChoices(models.TextChoices):
+    PENDING = "pending"
+    RUNNING = "running"
+    DONE = "done"
+    FAILED = "failed"
+
+
+class FingerprintKindChoices(models.TextChoices):
+    IP = "ip"
+    DEVICE = "device"
+    PAYMENT = "payment"
+
+
+class FingerprintEventChoices(models.TextChoices):
+    PROMOTER = "promoter"
+    CLICK = "click"
+    SIGNUP = "signup"
+    PAYMENT = "payment"
+
+
+class FraudFlagReasonChoices(models.TextChoices):
+    SELF_REFERRAL = "self_referral"
+    DUPLICATE_ACCOUNT = "duplicate_account"
+    FINGERPRINT_CLUSTER = "fingerprint_cluster"
+    MANUAL = "manual"
+
+
+class OutboxEventTypeChoices(models.TextChoices):
+    REFERRAL_SIGNUP = "referral.signup"
+    REFERRAL_ACTIVE = "referral.active"
+    REFERRAL_REFUND = "referral.refund"
+    COMMISSION_CREATED = "commission.created"
+    PAYOUT_CREATED = "payout.created"
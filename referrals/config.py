@@ -8,6 +8,24 @@ load_dotenv()
 class Config:
     BASE_REFERRAL_LINK = os.getenv('BASE_REFERRAL_LINK')
     BASE_EMAIL = os.getenv('BASE_EMAIL')
+    QUERY_INSTRUMENTATION_ENABLED = os.getenv('QUERY_INSTRUMENTATION_ENABLED', 'false').lower() == 'true'
+    QUERY_DEBUG_HEADER_ENABLED = os.getenv('QUERY_DEBUG_HEADER_ENABLED', 'false').lower() == 'true'
+    METRICS_ENABLED = os.getenv('METRICS_ENABLED', 'false').lower() == 'true'
+    READ_REPLICA_DB_ALIAS = os.getenv('READ_REPLICA_DB_ALIAS')
+    STICKY_PRIMARY_SECONDS = float(os.getenv('STICKY_PRIMARY_SECONDS', '0'))
+    REFERRAL_TREE_MAX_DEPTH = int(os.getenv('REFERRAL_TREE_MAX_DEPTH', '10'))
+    REFERRAL_TOKEN_KEYS = os.getenv('REFERRAL_TOKEN_KEYS')
+    ACCEPT_LEGACY_REFERRAL_TOKENS = os.getenv('ACCEPT_LEGACY_REFERRAL_TOKENS', 'true').lower() == 'true'
+    ADMIN_ESTIMATED_COUNT_THRESHOLD = int(os.getenv('ADMIN_ESTIMATED_COUNT_THRESHOLD', '100000'))
+    ADMIN_BULK_ACTION_SYNC_LIMIT = int(os.getenv('ADMIN_BULK_ACTION_SYNC_LIMIT', '1000'))
+    PROMOTER_SUMMARY_CACHE_SECONDS = int(os.getenv('PROMOTER_SUMMARY_CACHE_SECONDS', '60'))
+    REFERRAL_PROGRAM_CACHE_SECONDS = int(os.getenv('REFERRAL_PROGRAM_CACHE_SECONDS', '300'))
+    OUTBOX_ENABLED = os.getenv('OUTBOX_ENABLED', 'false').lower() == 'true'
+    BASE_CURRENCY = os.getenv('BASE_CURRENCY', 'USD').upper()
+    FX_RATES_CACHE_SECONDS = int(os.getenv('FX_RATES_CACHE_SECONDS', '300'))
+    FRAUD_DETECTION_ENABLED = os.getenv('FRAUD_DETECTION_ENABLED', 'false').lower() == 'true'
+    FRAUD_IP_HEADER = os.getenv('FRAUD_IP_HEADER', 'REMOTE_ADDR')
+    FRAUD_CLUSTER_MIN_ACCOUNTS = int(os.getenv('FRAUD_CLUSTER_MIN_ACCOUNTS', '3'))
 
 
 config = Config()
@@ -0,0 +1,125 @@
+import functools
+import time
+from contextvars import ContextVar
+from typing import Optional
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS
+
+from referrals.config import config
+
+_replica_reads: ContextVar[bool] = ContextVar("referrals_replica_reads", default=False)
+_primary_forced: ContextVar[bool] = ContextVar("referrals_primary_forced", default=False)
+_last_write_at: ContextVar[Optional[float]] = ContextVar("referrals_last_write_at", default=None)
+
+
+def get_replica_alias() -> Optional[str]:
+    """
+    Returns the configured read replica alias, or None if no replica is configured in `DATABASES`.
+    """
+    alias = config.READ_REPLICA_DB_ALIAS
+    if alias and alias in settings.DATABASES:
+        return alias
+    return None
+
+
+def is_primary_sticky() -> bool:
+    """
+    Whether a write happened in the current context within the last `STICKY_PRIMARY_SECONDS`.
+    """
+    last_write_at = _last_write_at.get()
+    return (
+        config.STICKY_PRIMARY_SECONDS > 0
+        and last_write_at is not None
+        and time.monotonic() - last_write_at < config.STICKY_PRIMARY_SECONDS
+    )
+
+
+def get_read_db_alias() -> str:
+    """
+    Returns the database alias read-only queries should use: the replica, unless no replica is configured,
+    the primary is forced with `use_primary` or the sticky primary window after a write is still open.
+    """
+    replica = get_replica_alias()
+    if replica is None or _primary_forced.get() or is_primary_sticky():
+        return DEFAULT_DB_ALIAS
+    return replica
+
+
+class _ContextFlag:
+    """
+    Sets a boolean context variable inside a `with` block or a decorated function.
+
+    Every `with` block and every call of a decorated function gets its own token, so one instance can be shared
+    by concurrent requests.
+    """
+
+    def __init__(self, var: ContextVar):
+        self.var = var
+        self._token = None
+
+    def __enter__(self):
+        self._token = self.var.set(True)
+        return self
+
+    def __exit__(self, *exc):
+        self.var.reset(self._token)
+        return False
+
+    def __call__(self, func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with _ContextFlag(self.var):
+                return func(*args, **kwargs)
+
+        return wrapper
+
+
+def read_replica() -> _ContextFlag:
+    """
+    Context manager and decorator that routes the reads inside it to the read replica.
+
+    Example:
+        @read_replica()
+        def promoter_payment_history(self, request, *args, **kwargs):
+            ...
+    """
+    return _ContextFlag(_replica_reads)
+
+
+def use_primary() -> _ContextFlag:
+    """
+    Context manager and decorator that keeps all reads inside it on the primary, for read-after-write paths.
+    """
+    return _ContextFlag(_primary_forced)
+
+
+class ReadReplicaRouter:
+    """
+    Database router that sends reads made inside `read_replica()` to the `READ_REPLICA_DB_ALIAS` database and
+    every write to the primary.
+
+    Each write opens a sticky primary window of `STICKY_PRIMARY_SECONDS` for the current context (request or
+    thread), so reads that follow a write don't hit a replica that may not have caught up yet.
+    """
+
+    def db_for_read(self, model, **hints) -> Optional[str]:
+        if not _replica_reads.get():
+            return None
+        return get_read_db_alias()
+
+    def db_for_write(self, model, **hints) -> Optional[str]:
+        _last_write_at.set(time.monotonic())
+
+        # Objects read from the replica must still be saved to the primary.
+        instance = hints.get("instance")
+        replica = get_replica_alias()
+        if replica and instance is not None and instance._state.db == replica:
+            return DEFAULT_DB_ALIAS
+        return None
+
+    def allow_relation(self, obj1, obj2, **hints) -> Optional[bool]:
+        databases = {DEFAULT_DB_ALIAS, get_replica_alias()}
+        if obj1._state.db in databases and obj2._state.db in databases:
+            return True
+        return None
@@ -0,0 +1,244 @@
+import functools
+import logging
+import threading
+import time
+from bisect import bisect_left
+from contextlib import ExitStack, contextmanager
+from typing import Callable, Iterator, Optional, Sequence
+
+from django.db import connections
+
+from referrals.config import config
+
+logger = logging.getLogger(__name__)
+
+QUERY_DEBUG_HEADER = "X-Referrals-Queries"
+PROMETHEUS_CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+class QueryStats:
+    """
+    Counts and times the database queries executed while it is installed as an execute wrapper.
+    """
+
+    def __init__(self, label: Optional[str] = None):
+        self.label = label
+        self.count = 0
+        self.duration = 0.0
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.duration += time.perf_counter() - started
+            self.count += 1
+
+    def as_header(self) -> str:
+        return f"count={self.count}; duration_ms={self.duration * 1000:.2f}"
+
+    def __repr__(self):
+        return f"<QueryStats {self.label}: {self.count} queries in {self.duration * 1000:.2f}ms>"
+
+
+@contextmanager
+def track_queries(label: Optional[str] = None) -> Iterator[QueryStats]:
+    """
+    Counts and times the queries executed on all database connections inside the block.
+
+    Example:
+        with track_queries("payouts") as stats:
+            promoter_payout_service.send_wise_csv_for_promoters_payouts()
+        print(stats.count, stats.duration)
+    """
+    stats = QueryStats(label)
+    with ExitStack() as stack:
+        for connection in connections.all():
+            stack.enter_context(connection.execute_wrapper(stats))
+        yield stats
+
+
+def log_query_stats(stats: QueryStats) -> None:
+    logger.info(f"{stats.label}: {stats.count} queries in {stats.duration * 1000:.2f}ms")
+
+
+class Histogram:
+    """
+    A cumulative Prometheus-style histogram with fixed upper bounds.
+    """
+
+    def __init__(self, buckets: Sequence[float] = DEFAULT_BUCKETS):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def cumulative_counts(self) -> list[tuple[str, int]]:
+        bounds = [_format_number(bound) for bound in self.buckets] + ["+Inf"]
+        cumulative, total = [], 0
+        for bound, count in zip(bounds, self.counts):
+            total += count
+            cumulative.append((bound, total))
+        return cumulative
+
+
+class MetricsRegistry:
+    """
+    In-process registry of latency histograms and query counters, rendered in the Prometheus text format.
+
+    Metrics are kept per process, so with several worker processes every worker reports its own series and
+    Prometheus aggregates them per scrape target.
+    """
+
+    DESCRIPTIONS = {
+        "referrals_view_duration_seconds": "Total time spent in referral API actions.",
+        "referrals_view_db_duration_seconds": "Time spent in database queries by referral API actions.",
+        "referrals_view_python_duration_seconds": "Time spent outside database queries by referral API actions.",
+        "referrals_view_queries_total": "Number of database queries executed by referral API actions.",
+        "referrals_service_duration_seconds": "Total time spent in referral service methods.",
+        "referrals_service_db_duration_seconds": "Time spent in database queries by referral service methods.",
+        "referrals_service_python_duration_seconds": "Time spent outside database queries by referral service methods.",
+        "referrals_service_queries_total": "Number of database queries executed by referral service methods.",
+    }
+
+    def __init__(self, buckets: Sequence[float] = DEFAULT_BUCKETS):
+        self.buckets = tuple(buckets)
+        self._lock = threading.Lock()
+        self._histograms: dict[str, dict[tuple, Histogram]] = {}
+        self._counters: dict[str, dict[tuple, float]] = {}
+
+    def observe(self, name: str, labels: dict, value: float) -> None:
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            series = self._histograms.setdefault(name, {})
+            histogram = series.get(key)
+            if histogram is None:
+                histogram = series[key] = Histogram(self.buckets)
+            histogram.observe(value)
+
+    def increment(self, name: str, labels: dict, value: float = 1) -> None:
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            series = self._counters.setdefault(name, {})
+            series[key] = series.get(key, 0) + value
+
+    def observe_call(self, kind: str, label_name: str, label: str, duration: float, stats: QueryStats) -> None:
+        """
+        Records the total, database and Python time and the query count of a single view or service call.
+        """
+        labels = {label_name: label}
+        self.observe(f"referrals_{kind}_duration_seconds", labels, duration)
+        self.observe(f"referrals_{kind}_db_duration_seconds", labels, stats.duration)
+        self.observe(f"referrals_{kind}_python_duration_seconds", labels, max(duration - stats.duration, 0.0))
+        self.increment(f"referrals_{kind}_queries_total", labels, stats.count)
+
+    def get_histogram(self, name: str, **labels) -> Optional[Histogram]:
+        with self._lock:
+            return self._histograms.get(name, {}).get(tuple(sorted(labels.items())))
+
+    def reset(self) -> None:
+        with self._lock:
+            self._histograms.clear()
+            self._counters.clear()
+
+    def render(self) -> str:
+        """
+        Renders all metrics in the Prometheus text exposition format.
+        """
+        lines = []
+        with self._lock:
+            for name in sorted(self._histograms):
+                lines += self._header(name, "histogram")
+                for key, histogram in sorted(self._histograms[name].items()):
+                    for bound, count in histogram.cumulative_counts():
+                        lines.append(f"{name}_bucket{_format_labels(key + (('le', bound),))} {count}")
+                    lines.append(f"{name}_sum{_format_labels(key)} {_format_number(histogram.sum)}")
+                    lines.append(f"{name}_count{_format_labels(key)} {histogram.count}")
+            for name in sorted(self._counters):
+                lines += self._header(name, "counter")
+                for key, value in sorted(self._counters[name].items()):
+                    lines.append(f"{name}{_format_labels(key)} {_format_number(value)}")
+        return "\n".join(lines) + "\n" if lines else ""
+
+    def _header(self, name: str, metric_type: str) -> list[str]:
+        return [f"# HELP {name} {self.DESCRIPTIONS.get(name, name)}", f"# TYPE {name} {metric_type}"]
+
+
+def _format_number(value: float) -> str:
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+
+def _escape_label_value(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(labels: tuple) -> str:
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape_label_value(str(value))}"' for name, value in labels) + "}"
+
+
+metrics_registry = MetricsRegistry()
+
+
+def instrument(func: Callable) -> Callable:
+    """
+    Decorator that logs the number and duration of the queries executed by a service method and, when
+    `METRICS_ENABLED` is set, records its latency in the metrics registry.
+
+    The checks are done on every call, so instrumentation can be toggled at runtime and costs two attribute
+    lookups when disabled.
+    """
+    label = func.__qualname__
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        if not (config.QUERY_INSTRUMENTATION_ENABLED or config.METRICS_ENABLED):
+            return func(*args, **kwargs)
+
+        started = time.perf_counter()
+        with track_queries(label) as stats:
+            result = func(*args, **kwargs)
+        duration = time.perf_counter() - started
+
+        if config.QUERY_INSTRUMENTATION_ENABLED:
+            log_query_stats(stats)
+        if config.METRICS_ENABLED:
+            metrics_registry.observe_call("service", "method", label, duration, stats)
+        return result
+
+    return wrapper
+
+
+class QueryInstrumentationMixin:
+    """
+    View mixin that logs the queries executed per view action, reports them in the `X-Referrals-Queries`
+    response header when `QUERY_DEBUG_HEADER_ENABLED` is set and records the action latency in the metrics
+    registry when `METRICS_ENABLED` is set.
+    """
+
+    def dispatch(self, request, *args, **kwargs):
+        if not (config.QUERY_INSTRUMENTATION_ENABLED or config.METRICS_ENABLED):
+            return super().dispatch(request, *args, **kwargs)
+
+        started = time.perf_counter()
+        with track_queries() as stats:
+            response = super().dispatch(request, *args, **kwargs)
+        duration = time.perf_counter() - started
+
+        action_name = getattr(self, 'action', None) or request.method.lower()
+        stats.label = f"{self.__class__.__name__}.{action_name}"
+        if config.QUERY_INSTRUMENTATION_ENABLED:
+            log_query_stats(stats)
+            if config.QUERY_DEBUG_HEADER_ENABLED:
+                response[QUERY_DEBUG_HEADER] = stats.as_header()
+        if config.METRICS_ENABLED:
+            metrics_registry.observe_call("view", "action", action_name, duration, stats)
+        return response
@@ -0,0 +1,65 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+
+from referrals.benchmarks import BenchmarkRunner
+from referrals.models import Promoter
+
+
+class Command(BaseCommand):
+    help = "Benchmark the referral endpoints and payout runs and report p50/p95/p99 latency as JSON"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--iterations',
+            type=int,
+            default=50,
+            help='Number of iterations per scenario (default: 50)',
+        )
+        parser.add_argument(
+            '--payout-iterations',
+            type=int,
+            default=3,
+            help='Number of iterations of the Wise payout run (default: 3)',
+        )
+        parser.add_argument(
+            '--promoter-id',
+            type=int,
+            help='Promoter to benchmark with (default: the promoter with the most referrals)',
+        )
+        parser.add_argument(
+            '--scenario',
+            action='append',
+            dest='scenarios',
+            help='Scenario to run, can be repeated (default: all scenarios)',
+        )
+        parser.add_argument(
+            '--output',
+            type=str,
+            help='Path of the JSON report (default: stdout)',
+        )
+
+    def handle(self, *args, **options):
+        promoter = None
+        if options['promoter_id']:
+            promoter = Promoter.objects.select_related('user').filter(pk=options['promoter_id']).first()
+            if not promoter:
+                raise CommandError(f'Promoter {options["promoter_id"]} does not exist.')
+
+        try:
+            runner = BenchmarkRunner(
+                iterations=options['iterations'],
+                payout_iterations=options['payout_iterations'],
+                promoter=promoter,
+            )
+            report = runner.run(options['scenarios'])
+        except ValueError as e:
+            raise CommandError(str(e))
+
+        report_json = json.dumps(report, indent=2)
+        if options['output']:
+            with open(options['output'], 'w') as file:
+                file.write(report_json)
+            self.stdout.write(self.style.SUCCESS(f'Benchmark report written to "{options["output"]}".'))
+        else:
+            self.stdout.write(report_json)
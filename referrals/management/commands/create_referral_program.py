@@ -1,8 +1,9 @@
 from decimal import Decimal
 
 from django.core.management.base import BaseCommand
+from django.db import transaction
 
-from referrals.models import ReferralProgram
+from referrals.models import ReferralProgram, ReferralProgramLevel
 
 
 class Command(BaseCommand):
@@ -27,6 +28,24 @@ class Command(BaseCommand):
             default=Decimal('0.00'),
             help='Minimum withdrawal balance for the referral program (default: 0.00)',
         )
+        parser.add_argument(
+            '--hold-days',
+            type=int,
+            default=0,
+            help='Days commissions are held as pending before they can be paid out (default: 0)',
+        )
+        parser.add_argument(
+            '--default',
+            action='store_true',
+            help='Make this the default program, used by promoters without an assigned program',
+        )
+        parser.add_argument(
+            '--level-rate',
+            action='append',
+            default=[],
+            dest='level_rates',
+            help='Commission rate of an upline level as LEVEL=RATE, can be repeated (e.g., --level-rate 2=3.00)',
+        )
 
     def handle(self, *args, **options):
         name = options['name']
@@ -36,14 +55,39 @@ class Command(BaseCommand):
         if commission_rate <= Decimal('0.00'):
             self.stderr.write(self.style.ERROR('Commission rate must be greater than 0.00'))
             return
+        if options['hold_days'] < 0:
+            self.stderr.write(self.style.ERROR('Hold days must not be negative'))
+            return
 
-        referral_program = ReferralProgram(
-            name=name,
-            commission_rate=commission_rate,
-            min_withdrawal_balance=min_withdrawal_balance
-        )
+        level_rates = {}
+        for level_rate in options['level_rates']:
+            level, _, rate = level_rate.partition('=')
+            try:
+                level, rate = int(level), Decimal(rate)
+            except (ValueError, ArithmeticError):
+                self.stderr.write(self.style.ERROR(f'Invalid level rate "{level_rate}", expected LEVEL=RATE'))
+                return
+            if level < 2 or rate <= Decimal('0.00'):
+                self.stderr.write(self.style.ERROR('Level rates need a level of at least 2 and a rate above 0.00'))
+                return
+            level_rates[level] = rate
+
+        with transaction.atomic():
+            referral_program = ReferralProgram(
+                name=name,
+                commission_rate=commission_rate,
+                min_withdrawal_balance=min_withdrawal_balance,
+                commission_hold_days=options['hold_days'],
+                is_default=options['default'],
+            )
 
-        referral_program.save()
+            referral_program.save()
+            ReferralProgramLevel.objects.bulk_create([
+                ReferralProgramLevel(program=referral_program, level=level, commission_rate=rate)
+                for level, rate in sorted(level_rates.items())
+            ])
+            # bulk_create bypasses ReferralProgramLevel.save(), which refreshes the cached level rates.
+            ReferralProgram.invalidate_cache()
 
         self.stdout.write(self.style.SUCCESS(
             f'Referral program "{name}" created successfully with a commission rate of {commission_rate}% and a minimum withdrawal balance of {min_withdrawal_balance}.'
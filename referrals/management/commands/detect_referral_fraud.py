@@ -0,0 +1,41 @@
+import csv
+
+from django.core.management.base import BaseCommand
+
+from referrals.services.fraud_service import fraud_service
+
+
+class Command(BaseCommand):
+    help = "Flag referred accounts that share device or payment fingerprints and report suspicious promoters"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--days',
+            type=int,
+            default=30,
+            help='Number of days of fingerprints considered (default: 30)',
+        )
+        parser.add_argument(
+            '--min-accounts',
+            type=int,
+            help='Number of accounts sharing a fingerprint that makes a cluster (default: FRAUD_CLUSTER_MIN_ACCOUNTS)',
+        )
+        parser.add_argument(
+            '--output',
+            type=str,
+            help='Path of the CSV report of suspicious promoters (default: print a summary only)',
+        )
+
+    def handle(self, *args, **options):
+        result = fraud_service.flag_clusters(days=options['days'], min_accounts=options['min_accounts'])
+
+        if options['output']:
+            with open(options['output'], 'w', newline='') as file:
+                writer = csv.writer(file)
+                writer.writerow(['promoter_id', 'clustered_accounts'])
+                writer.writerows(result['promoters'])
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Found {result['clustered_accounts']} clustered accounts of {len(result['promoters'])} promoters, "
+            f"flagged {result['flagged']} referrals."
+        ))
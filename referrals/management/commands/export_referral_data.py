@@ -0,0 +1,82 @@
+import sys
+from datetime import date
+
+from django.core.management.base import BaseCommand, CommandError
+
+from referrals.choices import ExportDatasetChoices, ExportFormatChoices
+from referrals.services.export_service import export_service
+
+
+class Command(BaseCommand):
+    help = "Stream an accounting export of commissions, payouts or referrals to a CSV or JSONL file"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--dataset',
+            type=str,
+            required=True,
+            choices=ExportDatasetChoices.values,
+            help='Dataset to export',
+        )
+        parser.add_argument(
+            '--file-format',
+            type=str,
+            default=ExportFormatChoices.CSV.value,
+            choices=ExportFormatChoices.values,
+            help='Output format (default: csv)',
+        )
+        parser.add_argument(
+            '--output',
+            type=str,
+            help='Path of the output file (default: stdout)',
+        )
+        parser.add_argument(
+            '--gzip',
+            action='store_true',
+            help='Compress the output with gzip',
+        )
+        parser.add_argument(
+            '--date-from',
+            type=date.fromisoformat,
+            help='Only export rows created on or after this date (YYYY-MM-DD)',
+        )
+        parser.add_argument(
+            '--date-to',
+            type=date.fromisoformat,
+            help='Only export rows created on or before this date (YYYY-MM-DD)',
+        )
+        parser.add_argument(
+            '--status',
+            type=str,
+            help='Only export rows with this status (commissions and referrals only)',
+        )
+        parser.add_argument(
+            '--chunk-size',
+            type=int,
+            default=2000,
+            help='Number of rows fetched from the database at a time (default: 2000)',
+        )
+
+    def handle(self, *args, **options):
+        export_kwargs = dict(
+            file_format=options['file_format'],
+            compress=options['gzip'],
+            date_from=options['date_from'],
+            date_to=options['date_to'],
+            status=options['status'],
+            chunk_size=options['chunk_size'],
+        )
+
+        try:
+            if options['output']:
+                with open(options['output'], 'wb') as file:
+                    written = export_service.write_to_file(file, options['dataset'], **export_kwargs)
+            else:
+                written = export_service.write_to_file(sys.stdout.buffer, options['dataset'], **export_kwargs)
+        except ValueError as e:
+            raise CommandError(str(e))
+
+        if options['output']:
+            self.stdout.write(self.style.SUCCESS(
+                f'Exported {options["dataset"]} to "{options["output"]}" ({written} bytes).'
+            ))
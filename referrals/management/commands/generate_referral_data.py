@@ -0,0 +1,197 @@
+import time
+from decimal import Decimal
+
+import numpy as np
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+
+from referrals.choices import InvitationMethodChoices, PromoterCommissionStatusChoices, ReferralStateChoices
+from referrals.config import config
+from referrals.models import PayoutMethod, Promoter, PromoterCommission, PromoterPayout, Referral, ReferralProgram
+from referrals.services.referral_service import referral_service
+
+REFERRAL_STATUSES = [ReferralStateChoices.SIGNUP, ReferralStateChoices.ACTIVE, ReferralStateChoices.REFUND]
+REFERRAL_STATUS_WEIGHTS = [0.6, 0.35, 0.05]
+INVITATION_METHODS = [InvitationMethodChoices.LINK, InvitationMethodChoices.EMAIL]
+COMMISSION_STATUSES = [PromoterCommissionStatusChoices.PENDING, PromoterCommissionStatusChoices.PAID]
+WISE_PAYOUT_METHOD_SHARE = 0.9  # the other promoters have no payout method, like promoters that never set one up
+
+
+class Command(BaseCommand):
+    help = "Fill the database with synthetic users, promoters, referrals, commissions and payouts for benchmarking"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=10_000, help='Number of users (default: 10000)')
+        parser.add_argument('--promoters', type=int, default=1_000, help='Number of promoters (default: 1000)')
+        parser.add_argument('--referrals', type=int, default=5_000, help='Number of referrals (default: 5000)')
+        parser.add_argument('--commissions', type=int, default=20_000, help='Number of commissions (default: 20000)')
+        parser.add_argument('--payouts', type=int, default=1_000, help='Number of payouts (default: 1000)')
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=10_000,
+            help='Number of rows inserted per statement (default: 10000)',
+        )
+        parser.add_argument('--seed', type=int, default=42, help='Random seed (default: 42)')
+
+    def handle(self, *args, **options):
+        users, promoters, referrals = options['users'], options['promoters'], options['referrals']
+        if promoters > users or referrals > users:
+            raise CommandError('There must be at least as many users as promoters and as referrals.')
+        if referrals and not promoters:
+            raise CommandError('Referrals need at least one promoter.')
+        if (options['commissions'] and not referrals) or (options['payouts'] and not promoters):
+            raise CommandError('Commissions need referrals and payouts need promoters.')
+
+        self.rng = np.random.default_rng(options['seed'])
+        self.batch_size = options['batch_size']
+        self.prefix = f"synthetic-{int(time.time())}"
+        self.program = ReferralProgram.get_active_referral_program() or ReferralProgram.objects.create(
+            name=f"{self.prefix}-program", commission_rate=Decimal("10.00")
+        )
+
+        user_ids = self._create_users(users)
+        promoter_ids = self._create_promoters(user_ids[:promoters])
+        referral_ids, referral_promoter_ids = self._create_referrals(
+            user_ids[users - referrals:], promoter_ids, user_ids[:promoters]
+        )
+        self._create_commissions(options['commissions'], referral_ids, referral_promoter_ids)
+        self._create_payouts(options['payouts'], promoter_ids)
+
+        self.stdout.write(self.style.SUCCESS(f'Synthetic data "{self.prefix}" created successfully.'))
+
+    def _insert(self, label, total, build_batch):
+        """Builds and inserts `total` rows in batches, reporting the throughput."""
+        started = time.monotonic()
+        for offset in range(0, total, self.batch_size):
+            objs, model = build_batch(offset, min(offset + self.batch_size, total))
+            model.objects.bulk_create(objs, batch_size=self.batch_size)
+
+            inserted = min(offset + self.batch_size, total)
+            rate = inserted / max(time.monotonic() - started, 1e-9)
+            self.stdout.write(f'{label}: {inserted}/{total} ({rate:,.0f} rows/s)')
+
+    def _create_users(self, total):
+        password = "!"  # unusable password, hashing real passwords would dominate the run time
+
+        def build_batch(start, end):
+            return [
+                User(username=f"{self.prefix}-{index}", email=f"{self.prefix}-{index}@example.com", password=password)
+                for index in range(start, end)
+            ], User
+
+        self._insert('users', total, build_batch)
+        return np.fromiter(
+            User.objects.filter(username__startswith=f"{self.prefix}-").order_by("id").values_list("id", flat=True)
+            .iterator(chunk_size=self.batch_size),
+            dtype=np.int64,
+        )
+
+    def _create_payout_methods(self, total):
+        """Creates wise payout methods for a `WISE_PAYOUT_METHOD_SHARE` of the promoters and returns their ids."""
+        with_payout_method = self.rng.random(total) < WISE_PAYOUT_METHOD_SHARE
+        promoter_indexes = np.flatnonzero(with_payout_method)
+
+        def build_batch(start, end):
+            return [
+                PayoutMethod(method="wise", payment_address=f"{self.prefix}-{index}@example.com")
+                for index in promoter_indexes[start:end]
+            ], PayoutMethod
+
+        self._insert('payout methods', len(promoter_indexes), build_batch)
+        payout_method_ids = np.zeros(total, dtype=np.int64)
+        payout_method_ids[promoter_indexes] = np.fromiter(
+            PayoutMethod.objects.filter(payment_address__startswith=f"{self.prefix}-").order_by("id")
+            .values_list("id", flat=True).iterator(chunk_size=self.batch_size),
+            dtype=np.int64,
+            count=len(promoter_indexes),
+        )
+        return payout_method_ids
+
+    def _create_promoters(self, user_ids):
+        payout_method_ids = self._create_payout_methods(len(user_ids))
+
+        def build_batch(start, end):
+            promoters = []
+            for index in range(start, end):
+                referral_token = f"{self.prefix}-{index}"
+                promoters.append(Promoter(
+                    user_id=int(user_ids[index]),
+                    active_payout_method_id=int(payout_method_ids[index]) or None,
+                    referral_token=referral_token,
+                    referral_link=referral_service.generate_referral_link(config.BASE_REFERRAL_LINK or "",
+                                                                          referral_token),
+                    link_clicked=int(self.rng.integers(0, 1000)),
+                    min_withdrawal_balance=self.program.min_withdrawal_balance,
+                ))
+            return promoters, Promoter
+
+        self._insert('promoters', len(user_ids), build_batch)
+        return np.fromiter(
+            Promoter.objects.filter(user__username__startswith=f"{self.prefix}-").order_by("user_id")
+            .values_list("id", flat=True).iterator(chunk_size=self.batch_size),
+            dtype=np.int64,
+        )
+
+    def _create_referrals(self, user_ids, promoter_ids, promoter_user_ids):
+        total = len(user_ids)
+        promoter_indexes = self.rng.integers(0, len(promoter_ids), total) if total else np.array([], dtype=np.int64)
+        # Referred users that are promoters themselves must not refer themselves.
+        self_referrals = promoter_user_ids[promoter_indexes] == user_ids
+        if len(promoter_ids) == 1 and self_referrals.any():
+            raise CommandError('A single promoter can not refer itself, use fewer referrals or more promoters.')
+        promoter_indexes[self_referrals] = (promoter_indexes[self_referrals] + 1) % len(promoter_ids)
+
+        statuses = self.rng.choice(len(REFERRAL_STATUSES), total, p=REFERRAL_STATUS_WEIGHTS)
+        methods = self.rng.integers(0, len(INVITATION_METHODS), total)
+
+        def build_batch(start, end):
+            return [
+                Referral(
+                    user_id=int(user_ids[index]),
+                    promoter_id=int(promoter_ids[promoter_indexes[index]]),
+                    status=REFERRAL_STATUSES[statuses[index]],
+                    invitation_method=INVITATION_METHODS[methods[index]],
+                    commission_rate=self.program.commission_rate,
+                )
+                for index in range(start, end)
+            ], Referral
+
+        self._insert('referrals', total, build_batch)
+        if not total:
+            return np.array([], dtype=np.int64), np.array([], dtype=np.int64)
+
+        rows = Referral.objects.filter(user__username__startswith=f"{self.prefix}-").order_by(
+            "user_id").values_list("id", "promoter_id")
+        referrals = np.array(list(rows.iterator(chunk_size=self.batch_size)), dtype=np.int64)
+        return referrals[:, 0], referrals[:, 1]
+
+    def _create_commissions(self, total, referral_ids, referral_promoter_ids):
+        def build_batch(start, end):
+            size = end - start
+            referral_indexes = self.rng.integers(0, len(referral_ids), size)
+            amounts = self.rng.integers(1, 500, size)
+            statuses = self.rng.integers(0, len(COMMISSION_STATUSES), size)
+            return [
+                PromoterCommission(
+                    referral_id=int(referral_ids[referral_index]),
+                    promoter_id=int(referral_promoter_ids[referral_index]),
+                    amount=int(amount),
+                    status=COMMISSION_STATUSES[commission_status],
+                )
+                for referral_index, amount, commission_status in zip(referral_indexes, amounts, statuses)
+            ], PromoterCommission
+
+        self._insert('commissions', total, build_batch)
+
+    def _create_payouts(self, total, promoter_ids):
+        def build_batch(start, end):
+            size = end - start
+            promoter_indexes = self.rng.integers(0, len(promoter_ids), size)
+            amounts = self.rng.integers(10, 1000, size)
+            return [
+                PromoterPayout(promoter_id=int(promoter_ids[promoter_index]), amount=int(amount), payout_method="wise")
+                for promoter_index, amount in zip(promoter_indexes, amounts)
+            ], PromoterPayout
+
+        self._insert('payouts', total, build_batch)
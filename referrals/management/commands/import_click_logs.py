@@ -0,0 +1,58 @@
+import time
+from datetime import datetime
+from itertools import chain
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from referrals.services.click_ingestion_service import click_ingestion_service
+
+
+def _aware_datetime(value):
+    moment = datetime.fromisoformat(value)
+    return timezone.make_aware(moment) if timezone.is_naive(moment) else moment
+
+
+class Command(BaseCommand):
+    help = ("Count the referral link hits (URLs with a ref param) of edge or CDN access logs in the common or "
+            "combined log format")
+
+    def add_arguments(self, parser):
+        parser.add_argument('paths', nargs='+', help='Paths of the access logs')
+        parser.add_argument(
+            '--since',
+            type=_aware_datetime,
+            help='Only count hits logged at or after this ISO 8601 datetime',
+        )
+        parser.add_argument(
+            '--until',
+            type=_aware_datetime,
+            help='Only count hits logged before this ISO 8601 datetime',
+        )
+        parser.add_argument(
+            '--chunk-size',
+            type=int,
+            default=50_000,
+            help='Number of hits aggregated and written per batch (default: 50000)',
+        )
+
+    def handle(self, *args, **options):
+        self.started = time.monotonic()
+
+        clicks = chain.from_iterable(
+            click_ingestion_service.read_access_log(path, since=options['since'], until=options['until'])
+            for path in options['paths']
+        )
+        try:
+            counts = click_ingestion_service.ingest(clicks, chunk_size=options['chunk_size'],
+                                                    on_progress=self._report)
+        except OSError as e:
+            raise CommandError(str(e))
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Counted {counts["counted"]} link clicks, rejected {counts["rejected"]} hits.'
+        ))
+
+    def _report(self, received, counted):
+        rate = received / max(time.monotonic() - self.started, 1e-9)
+        self.stdout.write(f'hits: {received} read, {counted} counted ({rate:,.0f} hits/s)')
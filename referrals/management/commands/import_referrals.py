@@ -0,0 +1,90 @@
+import csv
+import json
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from referrals.choices import ExportFormatChoices
+from referrals.services.referral_import_service import IMPORT_FIELDS, referral_import_service
+
+
+class Command(BaseCommand):
+    help = ("Import referrals from a CSV or JSONL file with email, referral_token, invitation_method, status and "
+            "created fields, e.g. when migrating from another affiliate platform")
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='Path of the CSV or JSONL file to import')
+        parser.add_argument(
+            '--file-format',
+            type=str,
+            choices=ExportFormatChoices.values,
+            help='Input format (default: from the file extension)',
+        )
+        parser.add_argument(
+            '--rejects',
+            type=str,
+            help='Path of the file rejected rows are written to, with their line number and error',
+        )
+        parser.add_argument(
+            '--chunk-size',
+            type=int,
+            default=5000,
+            help='Number of rows validated and inserted per batch (default: 5000)',
+        )
+
+    def handle(self, *args, **options):
+        file_format = options['file_format'] or (
+            ExportFormatChoices.JSONL if options['path'].endswith(('.jsonl', '.ndjson')) else ExportFormatChoices.CSV
+        )
+        self.started = time.monotonic()
+
+        try:
+            with open(options['path'], newline='') as file, \
+                    _RejectsWriter(options['rejects'], file_format) as on_reject:
+                counts = referral_import_service.import_rows(
+                    referral_import_service.read_rows(file, file_format),
+                    chunk_size=options['chunk_size'],
+                    on_reject=on_reject,
+                    on_progress=self._report,
+                )
+        except OSError as e:
+            raise CommandError(str(e))
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Imported {counts["imported"]} referrals, rejected {counts["rejected"]} rows.'
+        ))
+
+    def _report(self, read, imported, rejected):
+        rate = read / max(time.monotonic() - self.started, 1e-9)
+        self.stdout.write(f'rows: {read} read, {imported} imported, {rejected} rejected ({rate:,.0f} rows/s)')
+
+
+class _RejectsWriter:
+    """Writes rejected rows in the input format, with their line number and error added."""
+
+    def __init__(self, path, file_format):
+        self.path = path
+        self.file_format = file_format
+        self.file = None
+
+    def __enter__(self):
+        if self.path is None:
+            return None
+        self.file = open(self.path, 'w', newline='')
+        if self.file_format == ExportFormatChoices.CSV:
+            self.writer = csv.DictWriter(self.file, fieldnames=[*IMPORT_FIELDS, 'line', 'error'],
+                                         extrasaction='ignore')
+            self.writer.writeheader()
+        return self.write
+
+    def __exit__(self, *exc):
+        if self.file:
+            self.file.close()
+        return False
+
+    def write(self, line_number, row, reason):
+        record = {**(row or {}), 'line': line_number, 'error': reason}
+        if self.file_format == ExportFormatChoices.CSV:
+            self.writer.writerow(record)
+        else:
+            self.file.write(json.dumps(record, default=str) + '\n')
@@ -0,0 +1,37 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from referrals.config import config
+from referrals.services.fx_rate_service import fx_rate_service
+
+
+class Command(BaseCommand):
+    help = ("Load exchange rates to the base currency from a CSV (currency,rate) or JSON file, or from the "
+            "command line")
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', nargs='?', help='Path of the CSV or JSON file with the rates')
+        parser.add_argument(
+            '--rate',
+            action='append',
+            default=[],
+            dest='rates',
+            help='Rate of a currency as CURRENCY=RATE, the value of one unit in the base currency, can be repeated '
+                 '(e.g., --rate EUR=1.08)',
+        )
+
+    def handle(self, *args, **options):
+        if not options['path'] and not options['rates']:
+            raise CommandError('Pass a rates file or at least one --rate.')
+
+        try:
+            rates = fx_rate_service.read_rates_file(options['path']) if options['path'] else {}
+            for value in options['rates']:
+                currency, separator, rate = value.partition('=')
+                if not separator:
+                    raise ValueError(f"Invalid rate '{value}', expected CURRENCY=RATE")
+                rates[currency] = rate
+            loaded = fx_rate_service.load_rates(rates)
+        except (OSError, KeyError, ValueError) as e:
+            raise CommandError(str(e))
+
+        self.stdout.write(self.style.SUCCESS(f'Loaded {loaded} FX rates to {config.BASE_CURRENCY}.'))
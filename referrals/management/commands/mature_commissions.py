@@ -0,0 +1,19 @@
+from django.core.management.base import BaseCommand
+
+from referrals.services.commission_maturation_service import commission_maturation_service
+
+
+class Command(BaseCommand):
+    help = "Mature the pending commissions whose hold period is over, so they count toward payouts"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--chunk-size',
+            type=int,
+            default=1000,
+            help='Number of commissions updated per statement (default: 1000)',
+        )
+
+    def handle(self, *args, **options):
+        matured = commission_maturation_service.mature_due_commissions(chunk_size=options['chunk_size'])
+        self.stdout.write(self.style.SUCCESS(f'Matured {matured} commissions.'))
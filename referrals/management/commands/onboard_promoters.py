@@ -0,0 +1,49 @@
+import time
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+
+from referrals.services.promoter_service import promoter_service
+
+
+class Command(BaseCommand):
+    help = "Enroll existing users as promoters in bulk, skipping users that already are promoters"
+
+    def add_arguments(self, parser):
+        source = parser.add_mutually_exclusive_group(required=True)
+        source.add_argument('--all-users', action='store_true', help='Onboard all active users')
+        source.add_argument('--ids-file', help='Path to a file with one user ID per line')
+        parser.add_argument(
+            '--chunk-size',
+            type=int,
+            default=1000,
+            help='Number of users onboarded per batch (default: 1000)',
+        )
+
+    def handle(self, *args, **options):
+        self.started = time.monotonic()
+
+        if options['all_users']:
+            users = User.objects.filter(is_active=True, promoter__isnull=True)
+            created = promoter_service.onboard_promoters(users, options['chunk_size'], on_progress=self._report)
+        else:
+            try:
+                with open(options['ids_file']) as ids_file:
+                    user_ids = (self._parse_user_id(line) for line in ids_file if line.strip())
+                    created = promoter_service.onboard_promoters(user_ids, options['chunk_size'],
+                                                                 on_progress=self._report)
+            except OSError as e:
+                raise CommandError(f'Can not read {options["ids_file"]}: {e}')
+
+        self.stdout.write(self.style.SUCCESS(f'Onboarded {created} new promoters.'))
+
+    @staticmethod
+    def _parse_user_id(line):
+        try:
+            return int(line)
+        except ValueError:
+            raise CommandError(f'Invalid user ID: {line.strip()}')
+
+    def _report(self, processed, created):
+        rate = processed / max(time.monotonic() - self.started, 1e-9)
+        self.stdout.write(f'users: {processed} processed, {created} promoters created ({rate:,.0f} users/s)')
@@ -0,0 +1,19 @@
+from django.core.management.base import BaseCommand
+
+from referrals.services.referral_tree_service import referral_tree_service
+
+
+class Command(BaseCommand):
+    help = "Rebuild the multi-level referral tree from the existing referrals"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--chunk-size',
+            type=int,
+            default=10_000,
+            help='Number of tree paths inserted per batch (default: 10000)',
+        )
+
+    def handle(self, *args, **options):
+        written = referral_tree_service.rebuild(chunk_size=options['chunk_size'])
+        self.stdout.write(self.style.SUCCESS(f'Referral tree rebuilt with {written} paths.'))
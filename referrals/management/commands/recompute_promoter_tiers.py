@@ -0,0 +1,31 @@
+from django.core.management.base import BaseCommand
+
+from referrals.services.commission_tier_service import commission_tier_service
+
+
+class Command(BaseCommand):
+    help = "Recompute the volume tier commission rates of promoters, e.g. after editing the tiers of a program"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--program',
+            type=int,
+            help='Only recompute the promoters of this referral program ID',
+        )
+        parser.add_argument(
+            '--recount',
+            action='store_true',
+            help='Count the active referrals of every promoter again first',
+        )
+        parser.add_argument(
+            '--chunk-size',
+            type=int,
+            default=1000,
+            help='Number of promoters updated per statement (default: 1000)',
+        )
+
+    def handle(self, *args, **options):
+        updated = commission_tier_service.recompute(
+            program_id=options['program'], recount=options['recount'], chunk_size=options['chunk_size']
+        )
+        self.stdout.write(self.style.SUCCESS(f'Recomputed the commission tiers of {updated} promoters.'))
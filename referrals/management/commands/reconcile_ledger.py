@@ -0,0 +1,47 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from referrals.services.reconciliation_service import reconciliation_service
+
+
+class Command(BaseCommand):
+    help = "Cross-check promoter balances, commissions and payouts and report discrepancies"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--workers',
+            type=int,
+            default=1,
+            help='Number of worker processes (default: 1)',
+        )
+        parser.add_argument(
+            '--chunk-size',
+            type=int,
+            default=100_000,
+            help='Number of promoter IDs reconciled per batch (default: 100000)',
+        )
+        parser.add_argument(
+            '--output',
+            type=str,
+            help='Path of the CSV discrepancy report (default: print a summary only)',
+        )
+
+    def handle(self, *args, **options):
+        started = time.monotonic()
+        report = reconciliation_service.reconcile(chunk_size=options['chunk_size'], workers=options['workers'])
+        elapsed = time.monotonic() - started
+
+        if options['output']:
+            report.to_csv(options['output'], index=False)
+
+        if report.empty:
+            self.stdout.write(self.style.SUCCESS(f'No discrepancies found ({elapsed:.1f}s).'))
+            return
+
+        issue_counts = report['issues'].str.split(';').explode().value_counts()
+        for issue, count in issue_counts.items():
+            self.stdout.write(f'{issue}: {count} promoters')
+        self.stdout.write(self.style.WARNING(
+            f'Found discrepancies for {len(report)} promoters ({elapsed:.1f}s).'
+        ))
@@ -0,0 +1,32 @@
+from django.core.management.base import BaseCommand
+
+from referrals.repositories import promoter_repository
+from referrals.services.promoter_service import promoter_service
+from referrals.services.referral_token_service import referral_token_service
+
+
+class Command(BaseCommand):
+    help = ("Issue signed referral tokens to promoters with legacy tokens or tokens signed with a rotated key. "
+            "Legacy tokens keep working as long as ACCEPT_LEGACY_REFERRAL_TOKENS is enabled")
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--chunk-size',
+            type=int,
+            default=1000,
+            help='Number of promoters updated per batch (default: 1000)',
+        )
+
+    def handle(self, *args, **options):
+        reissued = 0
+        for promoters in promoter_repository.iter_chunks(options['chunk_size']):
+            promoters = [promoter for promoter in promoters
+                         if referral_token_service.needs_reissue(promoter.referral_token)]
+            for promoter in promoters:
+                promoter_service.set_signed_referral_token(promoter)
+            promoter_repository.bulk_update(
+                promoters, ['referral_token', 'referral_link', 'legacy_referral_token'], batch_size=options['chunk_size']
+            )
+            reissued += len(promoters)
+
+        self.stdout.write(self.style.SUCCESS(f'Reissued referral tokens of {reissued} promoters.'))
@@ -0,0 +1,68 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from referrals.outbox_sinks import get_sink
+from referrals.services.outbox_service import outbox_service
+
+
+class Command(BaseCommand):
+    help = "Publish the unpublished referral lifecycle events of the outbox to a sink, in batches"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--sink',
+            type=str,
+            default='stdout',
+            help='jsonl, webhook, stdout or the dotted path of an OutboxSink subclass (default: stdout)',
+        )
+        parser.add_argument('--path', type=str, help='File the jsonl sink appends events to')
+        parser.add_argument('--url', type=str, help='URL the webhook sink posts batches to')
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=500,
+            help='Number of events published and acknowledged at a time (default: 500)',
+        )
+        parser.add_argument(
+            '--loop',
+            action='store_true',
+            help='Keep polling for new events instead of exiting once the outbox is drained',
+        )
+        parser.add_argument(
+            '--interval',
+            type=float,
+            default=1.0,
+            help='Seconds to wait between polls with --loop (default: 1.0)',
+        )
+
+    def handle(self, *args, **options):
+        sink_options = {}
+        if options['sink'] == 'jsonl':
+            if not options['path']:
+                raise CommandError('The jsonl sink needs --path.')
+            sink_options['path'] = options['path']
+        elif options['sink'] == 'webhook':
+            if not options['url']:
+                raise CommandError('The webhook sink needs --url.')
+            sink_options['url'] = options['url']
+
+        try:
+            sink = get_sink(options['sink'], **sink_options)
+        except ImportError as e:
+            raise CommandError(f'Unknown sink "{options["sink"]}": {e}')
+
+        published = 0
+        try:
+            while True:
+                published += outbox_service.relay(sink, batch_size=options['batch_size'])
+                if not options['loop']:
+                    break
+                time.sleep(options['interval'])
+        except KeyboardInterrupt:
+            pass
+        finally:
+            sink.close()
+
+        # Reported on stderr, so the stdout sink output stays a clean event stream.
+        self.stderr.write(self.style.SUCCESS(f'Published {published} outbox events.'))
@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from referrals.services.bulk_action_service import bulk_action_service
+
+
+class Command(BaseCommand):
+    help = "Run the admin bulk actions queued for selections too large to run within the admin request"
+
+    def handle(self, *args, **options):
+        jobs_run = bulk_action_service.run_pending_jobs()
+        self.stdout.write(self.style.SUCCESS(f'Ran {jobs_run} bulk action jobs.'))
@@ -0,0 +1,29 @@
+from datetime import date, timedelta
+
+from django.core.management.base import BaseCommand
+
+from referrals.services.balance_snapshot_service import balance_snapshot_service
+
+
+class Command(BaseCommand):
+    help = "Snapshot the balances of all promoters as of the end of a day (e.g. the end of the month)"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--as-of',
+            type=date.fromisoformat,
+            help='Snapshot balances as of the end of this date (YYYY-MM-DD, default: yesterday)',
+        )
+        parser.add_argument(
+            '--chunk-size',
+            type=int,
+            default=100_000,
+            help='Number of promoter IDs processed per batch (default: 100000)',
+        )
+
+    def handle(self, *args, **options):
+        as_of = options['as_of'] or date.today() - timedelta(days=1)
+
+        written = balance_snapshot_service.take_snapshots(as_of, chunk_size=options['chunk_size'])
+
+        self.stdout.write(self.style.SUCCESS(f'Wrote {written} promoter balance snapshots as of the end of {as_of}.'))
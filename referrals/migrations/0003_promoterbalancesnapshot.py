@@ -0,0 +1,30 @@
+# Generated by Django 5.2.18 on 2026-10-19 14:19
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('referrals', '0002_alter_payoutmethod_method_and_more'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PromoterBalanceSnapshot',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created', models.DateTimeField(auto_now_add=True)),
+                ('updated', models.DateTimeField(auto_now=True)),
+                ('as_of', models.DateTimeField(help_text='The snapshot includes commissions and payouts created before this moment')),
+                ('total_earned', models.IntegerField(default=0)),
+                ('total_paid', models.IntegerField(default=0)),
+                ('promoter', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='balance_snapshots', to='referrals.promoter')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['as_of'], name='balance_snapshot_as_of_idx')],
+                'constraints': [models.UniqueConstraint(fields=('promoter', 'as_of'), name='unique_promoter_balance_snapshot')],
+            },
+        ),
+    ]
@@ -0,0 +1,43 @@
+# Generated by Django 5.2.18 on 2026-10-19 14:21
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('referrals', '0003_promoterbalancesnapshot'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='promotercommission',
+            index=models.Index(fields=['promoter', 'status', 'amount'], name='commission_prom_status_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='promotercommission',
+            index=models.Index(fields=['referral', 'status'], name='commission_ref_status_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='promotercommission',
+            index=models.Index(fields=['promoter', 'created'], name='commission_prom_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='promotercommission',
+            index=models.Index(condition=models.Q(('status', 'pending')), fields=['promoter'], name='commission_pending_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='promoterpayout',
+            index=models.Index(fields=['promoter', '-created'], name='payout_promoter_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='promoterpayout',
+            index=models.Index(fields=['promoter', 'amount'], name='payout_promoter_amount_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='referral',
+            index=models.Index(fields=['promoter', '-created'], name='referral_promoter_created_idx'),
+        ),
+    ]
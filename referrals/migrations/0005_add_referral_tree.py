@@ -0,0 +1,50 @@
+# Generated by Django 5.2.18 on 2026-10-19 14:41
+
+import django.core.validators
+import django.db.models.deletion
+from decimal import Decimal
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('referrals', '0004_add_hot_query_indexes'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='promotercommission',
+            name='level',
+            field=models.PositiveSmallIntegerField(default=1, help_text='Depth of the promoter above the referred user, 1 for the direct promoter'),
+        ),
+        migrations.CreateModel(
+            name='ReferralProgramLevel',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created', models.DateTimeField(auto_now_add=True)),
+                ('updated', models.DateTimeField(auto_now=True)),
+                ('level', models.PositiveSmallIntegerField(help_text='Depth in the referral tree, 2 for the promoter who referred the direct promoter and so on', validators=[django.core.validators.MinValueValidator(2)])),
+                ('commission_rate', models.DecimalField(decimal_places=2, help_text='Commission rate as a percentage', max_digits=5, validators=[django.core.validators.MinValueValidator(Decimal('0.01'))])),
+                ('program', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='levels', to='referrals.referralprogram')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('program', 'level'), name='unique_referral_program_level')],
+            },
+        ),
+        migrations.CreateModel(
+            name='ReferralTreePath',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('depth', models.PositiveSmallIntegerField()),
+                ('ancestor', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='downline_paths', to='referrals.promoter')),
+                ('descendant', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='upline_paths', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['descendant', 'depth'], name='tree_path_descendant_idx'), models.Index(fields=['ancestor', 'depth'], name='tree_path_ancestor_idx')],
+                'constraints': [models.UniqueConstraint(fields=('ancestor', 'descendant'), name='unique_referral_tree_path')],
+            },
+        ),
+    ]
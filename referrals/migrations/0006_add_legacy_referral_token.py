@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-19 14:44
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('referrals', '0005_add_referral_tree'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='promoter',
+            name='legacy_referral_token',
+            field=models.CharField(blank=True, help_text='Unsigned referral token replaced by a signed one, still accepted for existing links', max_length=256, null=True, unique=True),
+        ),
+    ]
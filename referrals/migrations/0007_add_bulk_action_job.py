@@ -0,0 +1,34 @@
+# Generated by Django 5.2.18 on 2026-10-19 14:56
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('referrals', '0006_add_legacy_referral_token'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='BulkActionJob',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created', models.DateTimeField(auto_now_add=True)),
+                ('updated', models.DateTimeField(auto_now=True)),
+                ('action', models.CharField(choices=[('pay_promoters', 'Pay Promoters'), ('fail_commissions', 'Fail Commissions'), ('retry_commissions', 'Retry Commissions')], max_length=30)),
+                ('object_ids', models.JSONField(help_text='Primary keys of the selected promoters or commissions')),
+                ('params', models.JSONField(blank=True, default=dict, help_text='Action parameters, e.g. the failure reason')),
+                ('status', models.CharField(choices=[('pending', 'Pending'), ('running', 'Running'), ('done', 'Done'), ('failed', 'Failed')], default='pending', max_length=10)),
+                ('processed', models.IntegerField(default=0, help_text='Number of rows changed by the action')),
+                ('error', models.TextField(blank=True, null=True)),
+                ('requested_by', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['status', 'id'], name='bulk_action_job_status_idx')],
+            },
+        ),
+    ]
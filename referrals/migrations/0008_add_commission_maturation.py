@@ -0,0 +1,27 @@
+# Generated by Django 5.2.18 on 2026-10-19 15:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('referrals', '0007_add_bulk_action_job'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='referralprogram',
+            name='commission_hold_days',
+            field=models.PositiveIntegerField(default=0, help_text='Days a commission is held as pending before it matures and can be paid out'),
+        ),
+        migrations.AlterField(
+            model_name='promotercommission',
+            name='status',
+            field=models.CharField(choices=[('pending', 'Pending'), ('matured', 'Matured'), ('paid', 'Paid'), ('failed', 'Failed'), ('refund', 'Refund')], default='pending', max_length=10),
+        ),
+        migrations.AddIndex(
+            model_name='promotercommission',
+            index=models.Index(fields=['status', 'created'], name='commission_status_created_idx'),
+        ),
+    ]
@@ -0,0 +1,27 @@
+# Generated by Django 5.2.18 on 2026-10-19 15:03
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('referrals', '0008_add_commission_maturation'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='OutboxEvent',
+            fields=[
+                ('id', models.BigAutoField(primary_key=True, serialize=False)),
+                ('event_type', models.CharField(choices=[('referral.signup', 'Referral Signup'), ('referral.active', 'Referral Active'), ('referral.refund', 'Referral Refund'), ('commission.created', 'Commission Created'), ('payout.created', 'Payout Created')], max_length=30)),
+                ('aggregate_id', models.BigIntegerField(help_text='ID of the referral, commission or payout', null=True)),
+                ('payload', models.JSONField()),
+                ('created', models.DateTimeField(auto_now_add=True)),
+                ('published_at', models.DateTimeField(blank=True, null=True)),
+            ],
+            options={
+                'indexes': [models.Index(condition=models.Q(('published_at__isnull', True)), fields=['id'], name='outbox_unpublished_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,48 @@
+# Generated by Django 5.2.18 on 2026-10-19 15:15
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def mark_default_program(apps, schema_editor):
+    # Until now only one program could be active, it becomes the default program.
+    ReferralProgram = apps.get_model('referrals', 'ReferralProgram')
+    program = ReferralProgram.objects.filter(is_active=True).order_by('-id').first()
+    if program:
+        ReferralProgram.objects.filter(pk=program.pk).update(is_default=True)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('referrals', '0009_add_outbox_event'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='promoter',
+            name='program',
+            field=models.ForeignKey(blank=True, help_text="The promoter's referral program, the default program if empty", null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='promoters', to='referrals.referralprogram'),
+        ),
+        migrations.AddField(
+            model_name='referralprogram',
+            name='is_default',
+            field=models.BooleanField(default=False, help_text='The program of promoters without an assigned program, only one program is default'),
+        ),
+        migrations.AlterField(
+            model_name='bulkactionjob',
+            name='action',
+            field=models.CharField(choices=[('pay_promoters', 'Pay Promoters'), ('fail_commissions', 'Fail Commissions'), ('retry_commissions', 'Retry Commissions'), ('sync_program', 'Sync Program')], max_length=30),
+        ),
+        migrations.AlterField(
+            model_name='bulkactionjob',
+            name='object_ids',
+            field=models.JSONField(help_text='Primary keys of the selected promoters, commissions or programs'),
+        ),
+        migrations.AlterField(
+            model_name='referralprogram',
+            name='is_active',
+            field=models.BooleanField(default=True, help_text='Indicates if promoters can be assigned to this program'),
+        ),
+        migrations.RunPython(mark_default_program, migrations.RunPython.noop),
+    ]
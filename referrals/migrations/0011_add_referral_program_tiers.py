@@ -0,0 +1,55 @@
+# Generated by Django 5.2.18 on 2026-10-19 15:21
+
+import django.core.validators
+import django.db.models.deletion
+from decimal import Decimal
+from django.db import migrations, models
+from django.db.models import Count, IntegerField, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def count_active_referrals(apps, schema_editor):
+    Promoter = apps.get_model('referrals', 'Promoter')
+    Referral = apps.get_model('referrals', 'Referral')
+    active_referrals = (
+        Referral.objects.filter(promoter_id=OuterRef('pk'), status='active')
+        .order_by().values('promoter_id').annotate(total=Count('id')).values('total')
+    )
+    Promoter.objects.update(
+        active_referrals_count=Coalesce(Subquery(active_referrals, output_field=IntegerField()), 0)
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('referrals', '0010_multiple_referral_programs'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='promoter',
+            name='active_referrals_count',
+            field=models.PositiveIntegerField(default=0, help_text='Number of active referrals, maintained when referrals become active or are refunded'),
+        ),
+        migrations.AddField(
+            model_name='promoter',
+            name='tier_commission_rate',
+            field=models.DecimalField(blank=True, decimal_places=2, help_text='Commission rate of the volume tier reached by the promoter, empty below the first tier', max_digits=5, null=True),
+        ),
+        migrations.CreateModel(
+            name='ReferralProgramTier',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created', models.DateTimeField(auto_now_add=True)),
+                ('updated', models.DateTimeField(auto_now=True)),
+                ('min_active_referrals', models.PositiveIntegerField(help_text='Active referrals a promoter needs to reach this tier', validators=[django.core.validators.MinValueValidator(1)])),
+                ('commission_rate', models.DecimalField(decimal_places=2, help_text='Commission rate as a percentage', max_digits=5, validators=[django.core.validators.MinValueValidator(Decimal('0.01'))])),
+                ('program', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='tiers', to='referrals.referralprogram')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('program', 'min_active_referrals'), name='unique_referral_program_tier')],
+            },
+        ),
+        migrations.RunPython(count_active_referrals, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,62 @@
+# Generated by Django 5.2.18 on 2026-10-19 15:28
+
+import django.core.validators
+import referrals.models
+from decimal import Decimal
+from django.db import migrations, models
+from django.db.models import F
+
+
+def copy_base_amounts(apps, schema_editor):
+    # Existing commissions and payouts were all in the base currency.
+    apps.get_model('referrals', 'PromoterCommission').objects.update(original_amount=F('amount'))
+    apps.get_model('referrals', 'PromoterPayout').objects.update(target_amount=F('amount'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('referrals', '0011_add_referral_program_tiers'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='FxRate',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created', models.DateTimeField(auto_now_add=True)),
+                ('updated', models.DateTimeField(auto_now=True)),
+                ('currency', models.CharField(help_text='ISO 4217 currency code, e.g. EUR', max_length=3, unique=True)),
+                ('rate', models.DecimalField(decimal_places=8, help_text='Value of one unit of the currency in the base currency', max_digits=18, validators=[django.core.validators.MinValueValidator(Decimal('1E-8'))])),
+            ],
+            options={
+                'abstract': False,
+            },
+        ),
+        migrations.AddField(
+            model_name='payoutmethod',
+            name='currency',
+            field=models.CharField(default=referrals.models.get_base_currency, help_text='Currency the promoter is paid in', max_length=3),
+        ),
+        migrations.AddField(
+            model_name='promotercommission',
+            name='currency',
+            field=models.CharField(default=referrals.models.get_base_currency, help_text='Currency the referral was billed in', max_length=3),
+        ),
+        migrations.AddField(
+            model_name='promotercommission',
+            name='original_amount',
+            field=models.IntegerField(blank=True, help_text='Amount in the billing currency, `amount` is in the base currency', null=True),
+        ),
+        migrations.AddField(
+            model_name='promoterpayout',
+            name='currency',
+            field=models.CharField(default=referrals.models.get_base_currency, help_text='Currency the promoter was paid in', max_length=3),
+        ),
+        migrations.AddField(
+            model_name='promoterpayout',
+            name='target_amount',
+            field=models.IntegerField(blank=True, help_text='Amount paid in `currency` in cents, `amount` is in the base currency', null=True),
+        ),
+        migrations.RunPython(copy_base_amounts, migrations.RunPython.noop),
+    ]
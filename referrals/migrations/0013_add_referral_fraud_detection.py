@@ -0,0 +1,91 @@
+# Generated by Django 5.2.18 on 2026-10-19 15:35
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('referrals', '0012_multi_currency'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ReferralClickFingerprint',
+            fields=[
+                ('id', models.BigAutoField(primary_key=True, serialize=False)),
+                ('kind', models.CharField(choices=[('ip', 'Ip'), ('device', 'Device'), ('payment', 'Payment')], max_length=10)),
+                ('value_hash', models.CharField(max_length=32)),
+                ('created', models.DateTimeField(auto_now_add=True, help_text='The first click with the fingerprint')),
+            ],
+        ),
+        migrations.CreateModel(
+            name='ReferralFingerprint',
+            fields=[
+                ('id', models.BigAutoField(primary_key=True, serialize=False)),
+                ('kind', models.CharField(choices=[('ip', 'Ip'), ('device', 'Device'), ('payment', 'Payment')], max_length=10)),
+                ('value_hash', models.CharField(max_length=32)),
+                ('event', models.CharField(choices=[('promoter', 'Promoter'), ('click', 'Click'), ('signup', 'Signup'), ('payment', 'Payment')], max_length=10)),
+                ('created', models.DateTimeField(auto_now_add=True)),
+            ],
+        ),
+        migrations.AddField(
+            model_name='referral',
+            name='flag_reason',
+            field=models.CharField(blank=True, choices=[('self_referral', 'Self Referral'), ('duplicate_account', 'Duplicate Account'), ('fingerprint_cluster', 'Fingerprint Cluster'), ('manual', 'Manual')], default='', max_length=20),
+        ),
+        migrations.AddField(
+            model_name='referral',
+            name='is_flagged',
+            field=models.BooleanField(default=False, help_text='Suspected fraud, the commissions of the referral are not paid out'),
+        ),
+        migrations.AlterField(
+            model_name='bulkactionjob',
+            name='action',
+            field=models.CharField(choices=[('pay_promoters', 'Pay Promoters'), ('fail_commissions', 'Fail Commissions'), ('retry_commissions', 'Retry Commissions'), ('sync_program', 'Sync Program'), ('flag_referrals', 'Flag Referrals'), ('clear_referral_flags', 'Clear Referral Flags')], max_length=30),
+        ),
+        migrations.AlterField(
+            model_name='bulkactionjob',
+            name='object_ids',
+            field=models.JSONField(help_text='Primary keys of the selected promoters, referrals, commissions or programs'),
+        ),
+        migrations.AlterField(
+            model_name='promotercommission',
+            name='status',
+            field=models.CharField(choices=[('pending', 'Pending'), ('matured', 'Matured'), ('paid', 'Paid'), ('failed', 'Failed'), ('refund', 'Refund'), ('flagged', 'Flagged')], default='pending', max_length=10),
+        ),
+        migrations.AddIndex(
+            model_name='referral',
+            index=models.Index(condition=models.Q(('is_flagged', True)), fields=['promoter'], name='referral_flagged_idx'),
+        ),
+        migrations.AddField(
+            model_name='referralclickfingerprint',
+            name='promoter',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='click_fingerprints', to='referrals.promoter'),
+        ),
+        migrations.AddField(
+            model_name='referralfingerprint',
+            name='promoter',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='fingerprints', to='referrals.promoter'),
+        ),
+        migrations.AddField(
+            model_name='referralfingerprint',
+            name='user',
+            field=models.ForeignKey(help_text='The promoter, clicking or referred user the fingerprint belongs to', on_delete=django.db.models.deletion.CASCADE, related_name='referral_fingerprints', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AddConstraint(
+            model_name='referralclickfingerprint',
+            constraint=models.UniqueConstraint(fields=('kind', 'value_hash', 'promoter'), name='unique_referral_click_fingerprint'),
+        ),
+        migrations.AddIndex(
+            model_name='referralfingerprint',
+            index=models.Index(fields=['created'], name='fingerprint_created_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='referralfingerprint',
+            constraint=models.UniqueConstraint(fields=('kind', 'value_hash', 'event', 'promoter', 'user'), name='unique_referral_fingerprint'),
+        ),
+    ]
@@ -1,6 +1,11 @@
+from bisect import bisect_right
+from collections import defaultdict
+from datetime import date, datetime
 from decimal import Decimal
+from typing import Iterable, Optional, Union
 
 from django.contrib.auth.models import User
+from django.core.cache import cache
 from django.core.validators import MinValueValidator
 from django.db import models
 from django.db import transaction
@@ -9,7 +14,34 @@ from django.utils import timezone
 from django.utils.functional import cached_property
 
 from referrals.choices import InvitationMethodChoices, ReferralStateChoices, \
-    PromoterCommissionStatusChoices
+    PromoterCommissionStatusChoices, BulkActionChoices, BulkActionJobStatusChoices, OutboxEventTypeChoices, \
+    FingerprintKindChoices, FingerprintEventChoices, FraudFlagReasonChoices
+from referrals.config import config
+from referrals.utils import get_as_of_datetime
+
+# Commissions that count toward the payable balance. Pending commissions are still in their hold period, and
+# refunds count right away so that they are deducted from the next payout. Flagged commissions are held until
+# their referral's fraud flag is cleared.
+PAYABLE_COMMISSION_STATUSES = [
+    PromoterCommissionStatusChoices.MATURED,
+    PromoterCommissionStatusChoices.PAID,
+    PromoterCommissionStatusChoices.FAILED,
+    PromoterCommissionStatusChoices.REFUND,
+]
+
+
+def get_base_currency() -> str:
+    """The currency commission and payout amounts are kept in, see `FxRate`."""
+    return config.BASE_CURRENCY
+
+
+def get_tier_rate(tiers: list[tuple[int, Decimal]], active_referrals: int) -> Optional[Decimal]:
+    """
+    Returns the rate of the highest `(min_active_referrals, commission_rate)` tier reached with `active_referrals`,
+    or None below the first tier.
+    """
+    index = bisect_right([min_active_referrals for min_active_referrals, _ in tiers], active_referrals)
+    return tiers[index - 1][1] if index else None
 
 
 class TimeStampedModel(models.Model):
@@ -25,6 +57,13 @@ class TimeStampedModel(models.Model):
 
 
 class ReferralProgram(TimeStampedModel):
+    """
+    A commission program. Several programs can be active at once (e.g. default, partners, influencers); every
+    promoter is assigned to one of them, and promoters without a program use the default program.
+    """
+
+    CACHE_KEY = "referrals:referral-programs"
+
     name = models.CharField(max_length=255, unique=True)
     commission_rate = models.DecimalField(
         max_digits=5,
@@ -33,30 +72,123 @@ class ReferralProgram(TimeStampedModel):
         validators=[MinValueValidator(Decimal("0.01"))],
     )
     is_active = models.BooleanField(
-        default=True, help_text="Indicates if this is the currently active referral program"
+        default=True, help_text="Indicates if promoters can be assigned to this program"
+    )
+    is_default = models.BooleanField(
+        default=False, help_text="The program of promoters without an assigned program, only one program is default"
     )
     min_withdrawal_balance = models.DecimalField(
         max_digits=10, decimal_places=2, default=0.00, help_text="Minimum balance required to withdraw earnings"
     )
+    commission_hold_days = models.PositiveIntegerField(
+        default=0, help_text="Days a commission is held as pending before it matures and can be paid out"
+    )
+
+    def __str__(self):
+        return self.name
 
     @transaction.atomic
     def save(self, *args, **kwargs):
-        if self.is_active:
-            ReferralProgram.objects.filter(is_active=True).update(is_active=False)
-            Promoter.objects.filter(min_withdrawal_balance__lt=self.min_withdrawal_balance).update(
-                min_withdrawal_balance=self.min_withdrawal_balance
-            )
+        if self.is_active and not self.is_default:
+            # The first active program becomes the default one.
+            self.is_default = not ReferralProgram.objects.filter(is_active=True, is_default=True).exclude(
+                pk=self.pk).exists()
+        if self.is_default:
+            ReferralProgram.objects.filter(is_default=True).exclude(pk=self.pk).update(is_default=False)
 
         super(ReferralProgram, self).save(*args, **kwargs)
+        self.invalidate_cache()
+
+        # Raising the minimum withdrawal balance and recomputing the tiers of the assigned promoters touches many
+        # rows, so it's done in chunks by the `run_bulk_action_jobs` command. The promoters of an inactive program
+        # are on the default program, which is synced instead.
+        program = self if self.is_active else ReferralProgram.get_active_referral_program()
+        if program:
+            BulkActionJob.objects.create(action=BulkActionChoices.SYNC_PROGRAM, object_ids=[program.pk])
+
+    def delete(self, *args, **kwargs):
+        result = super().delete(*args, **kwargs)
+        self.invalidate_cache()
+        return result
+
+    @classmethod
+    def invalidate_cache(cls) -> None:
+        cache.delete(cls.CACHE_KEY)
+        # Another process may cache the old programs before this transaction commits.
+        transaction.on_commit(lambda: cache.delete(cls.CACHE_KEY))
 
     @classmethod
-    def get_active_referral_program(cls):
-        return cls.objects.filter(is_active=True).first()
+    def _get_cached_programs(cls) -> dict:
+        """
+        The active programs by ID, the default program ID, the upline level rates and the volume tiers by program
+        ID, read with three queries and cached for `REFERRAL_PROGRAM_CACHE_SECONDS`.
+        """
+        programs = cache.get(cls.CACHE_KEY)
+        if programs is None:
+            active_programs = list(cls.objects.filter(is_active=True).order_by("id"))
+            default = next((program for program in active_programs if program.is_default), None)
+            if default is None and active_programs:
+                default = active_programs[-1]
+
+            level_rates = {}
+            for program_id, level, commission_rate in ReferralProgramLevel.objects.filter(
+                    program__is_active=True).values_list("program_id", "level", "commission_rate"):
+                level_rates.setdefault(program_id, {})[level] = commission_rate
+
+            tiers = {}
+            for program_id, min_active_referrals, commission_rate in ReferralProgramTier.objects.filter(
+                    program__is_active=True).order_by("min_active_referrals").values_list(
+                    "program_id", "min_active_referrals", "commission_rate"):
+                tiers.setdefault(program_id, []).append((min_active_referrals, commission_rate))
+
+            programs = {
+                "by_id": {program.id: program for program in active_programs},
+                "default_id": default.id if default else None,
+                "level_rates": level_rates,
+                "tiers": tiers,
+            }
+            if config.REFERRAL_PROGRAM_CACHE_SECONDS > 0:
+                cache.set(cls.CACHE_KEY, programs, config.REFERRAL_PROGRAM_CACHE_SECONDS)
+        return programs
+
+    @classmethod
+    def resolve(cls, program_id: Optional[int] = None) -> Optional["ReferralProgram"]:
+        """
+        Returns the program of a promoter from the cache: the assigned program if it's active, the default
+        program otherwise.
+        """
+        programs = cls._get_cached_programs()
+        return programs["by_id"].get(program_id) or programs["by_id"].get(programs["default_id"])
+
+    @classmethod
+    def get_level_rates(cls, program_id: Optional[int] = None) -> dict[int, Decimal]:
+        """
+        Returns the cached upline commission rates by level of a promoter's program, see `resolve`.
+        """
+        program = cls.resolve(program_id)
+        return cls._get_cached_programs()["level_rates"].get(program.id, {}) if program else {}
+
+    @classmethod
+    def get_tiers(cls, program_id: Optional[int] = None) -> list[tuple[int, Decimal]]:
+        """
+        Returns the cached `(min_active_referrals, commission_rate)` volume tiers of a promoter's program, see
+        `resolve`, ordered by threshold.
+        """
+        program = cls.resolve(program_id)
+        return cls._get_cached_programs()["tiers"].get(program.id, []) if program else []
+
+    @classmethod
+    def get_active_referral_program(cls) -> Optional["ReferralProgram"]:
+        """
+        Returns the default program, the program of promoters without an assigned program.
+        """
+        return cls.resolve()
 
 
 class PayoutMethod(models.Model):
     method = models.CharField(max_length=20, help_text="Payout method (e.g., wise, crypto, etc.)")
     payment_address = models.CharField(max_length=100, help_text="Payment address (email or solana wallet)")
+    currency = models.CharField(max_length=3, default=get_base_currency, help_text="Currency the promoter is paid in")
 
     def __str__(self):
         return self.method
@@ -66,7 +198,22 @@ class Promoter(TimeStampedModel):
     user = models.OneToOneField(User, on_delete=models.CASCADE, related_name="promoter")
     referral_token = models.CharField(max_length=256, blank=True, null=True, unique=True, help_text="Referral token")
     referral_link = models.CharField(max_length=256, blank=True, null=True, unique=True, help_text="Referral link")
+    legacy_referral_token = models.CharField(
+        max_length=256, blank=True, null=True, unique=True,
+        help_text="Unsigned referral token replaced by a signed one, still accepted for existing links",
+    )
     active_payout_method = models.ForeignKey(PayoutMethod, on_delete=models.SET_NULL, null=True, blank=True)
+    program = models.ForeignKey(
+        ReferralProgram, related_name="promoters", on_delete=models.SET_NULL, null=True, blank=True,
+        help_text="The promoter's referral program, the default program if empty",
+    )
+    active_referrals_count = models.PositiveIntegerField(
+        default=0, help_text="Number of active referrals, maintained when referrals become active or are refunded"
+    )
+    tier_commission_rate = models.DecimalField(
+        max_digits=5, decimal_places=2, null=True, blank=True,
+        help_text="Commission rate of the volume tier reached by the promoter, empty below the first tier",
+    )
     link_clicked = models.IntegerField(default=0)
     min_withdrawal_balance = models.DecimalField(
         max_digits=10,
@@ -75,9 +222,15 @@ class Promoter(TimeStampedModel):
         help_text="Custom minimum balance required to withdraw earnings",
     )
 
+    @cached_property
+    def _commission_totals(self) -> dict:
+        return self.promoter_commission.aggregate(
+            total=Sum("amount"), payable=Sum("amount", filter=models.Q(status__in=PAYABLE_COMMISSION_STATUSES))
+        )
+
     @cached_property
     def total_earned(self) -> int:
-        return self.promoter_commission.aggregate(total=Sum("amount"))["total"] or 0
+        return self._commission_totals["total"] or 0
 
     @cached_property
     def total_paid(self) -> int:
@@ -92,15 +245,56 @@ class Promoter(TimeStampedModel):
     def current_balance(self) -> int:
         return self.total_earned - self.total_paid
 
+    @cached_property
+    def payable_earned(self) -> int:
+        return self._commission_totals["payable"] or 0
+
+    @cached_property
+    def payable_balance(self) -> int:
+        """
+        The balance without the commissions still held as pending, i.e. the amount a payout can pay.
+        """
+        return self.payable_earned - self.total_paid
+
+    def balance_as_of(self, moment: Union[date, datetime]) -> int:
+        """
+        Returns the balance at a point in time (a date means the end of that day).
+
+        The balance is read from the nearest earlier `PromoterBalanceSnapshot` plus the commissions and
+        payouts created since that snapshot, so the query cost doesn't grow with the ledger history.
+        """
+        as_of = get_as_of_datetime(moment)
+        snapshot = self.balance_snapshots.filter(as_of__lte=as_of).order_by("-as_of").first()
+
+        balance, since = 0, {}
+        if snapshot:
+            balance, since = snapshot.balance, {"created__gte": snapshot.as_of}
+
+        earned = self.promoter_commission.filter(created__lt=as_of, **since).aggregate(total=Sum("amount"))["total"]
+        paid = self.promoter_payouts.filter(created__lt=as_of, **since).aggregate(total=Sum("amount"))["total"]
+        return balance + (earned or 0) - (paid or 0)
+
     def __str__(self):
         return f"{self.user.email} - {self.referral_link}"
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._loaded_program_id = instance.__dict__.get("program_id")
+        return instance
+
     def save(self, *args, **kwargs):
-        if self.pk is None:
-            active_program = ReferralProgram.get_active_referral_program()
-            if active_program:
-                self.min_withdrawal_balance = active_program.min_withdrawal_balance
+        if self.pk is None or self.program_id != getattr(self, "_loaded_program_id", self.program_id):
+            program = ReferralProgram.resolve(self.program_id)
+            if program and self.pk is None:
+                self.min_withdrawal_balance = program.min_withdrawal_balance
+            elif program:
+                self.min_withdrawal_balance = max(self.min_withdrawal_balance, program.min_withdrawal_balance)
+            # The tier rate of the new program, for the active referrals counted so far.
+            self.tier_commission_rate = get_tier_rate(ReferralProgram.get_tiers(self.program_id),
+                                                      self.active_referrals_count)
         super(Promoter, self).save(*args, **kwargs)
+        self._loaded_program_id = self.program_id
 
 
 class Referral(TimeStampedModel):
@@ -111,13 +305,185 @@ class Referral(TimeStampedModel):
     commission_rate = models.DecimalField(
         max_digits=5, decimal_places=2, help_text="Commission rate at the moment of creating the referral", default=0.00
     )
+    is_flagged = models.BooleanField(
+        default=False, help_text="Suspected fraud, the commissions of the referral are not paid out"
+    )
+    flag_reason = models.CharField(max_length=20, choices=FraudFlagReasonChoices.choices, blank=True, default="")
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["promoter", "-created"], name="referral_promoter_created_idx"),
+            # Only the few flagged referrals are indexed, for the fraud review in the admin.
+            models.Index(fields=["promoter"], name="referral_flagged_idx", condition=models.Q(is_flagged=True)),
+        ]
+
+    @transaction.atomic
+    def save(self, *args, **kwargs):
+        is_new = self.pk is None
+        if is_new:
+            program = ReferralProgram.resolve(self.promoter.program_id)
+            if program:
+                self.commission_rate = program.commission_rate
+        super().save(*args, **kwargs)
+        if is_new:
+            ReferralTreePath.add_referral(self)
+
+
+class ReferralProgramLevel(TimeStampedModel):
+    program = models.ForeignKey(ReferralProgram, related_name="levels", on_delete=models.CASCADE)
+    level = models.PositiveSmallIntegerField(
+        validators=[MinValueValidator(2)],
+        help_text="Depth in the referral tree, 2 for the promoter who referred the direct promoter and so on",
+    )
+    commission_rate = models.DecimalField(
+        max_digits=5,
+        decimal_places=2,
+        help_text="Commission rate as a percentage",
+        validators=[MinValueValidator(Decimal("0.01"))],
+    )
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["program", "level"], name="unique_referral_program_level"),
+        ]
+
+    def __str__(self):
+        return f"{self.program.name} - level {self.level}: {self.commission_rate}%"
+
+    def save(self, *args, **kwargs):
+        super().save(*args, **kwargs)
+        ReferralProgram.invalidate_cache()
+
+    def delete(self, *args, **kwargs):
+        result = super().delete(*args, **kwargs)
+        ReferralProgram.invalidate_cache()
+        return result
+
+
+class ReferralProgramTier(TimeStampedModel):
+    """
+    A volume tier of a program: promoters with at least `min_active_referrals` active referrals earn
+    `commission_rate` on their direct commissions, if it's higher than the rate of the referral.
+    """
+
+    program = models.ForeignKey(ReferralProgram, related_name="tiers", on_delete=models.CASCADE)
+    min_active_referrals = models.PositiveIntegerField(
+        validators=[MinValueValidator(1)], help_text="Active referrals a promoter needs to reach this tier"
+    )
+    commission_rate = models.DecimalField(
+        max_digits=5,
+        decimal_places=2,
+        help_text="Commission rate as a percentage",
+        validators=[MinValueValidator(Decimal("0.01"))],
+    )
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["program", "min_active_referrals"], name="unique_referral_program_tier"),
+        ]
 
+    def __str__(self):
+        return f"{self.program.name} - {self.min_active_referrals}+ active referrals: {self.commission_rate}%"
+
+    @transaction.atomic
     def save(self, *args, **kwargs):
-        if self.pk is None:
-            active_program = ReferralProgram.get_active_referral_program()
-            if active_program:
-                self.commission_rate = active_program.commission_rate
         super().save(*args, **kwargs)
+        self._tiers_changed()
+
+    @transaction.atomic
+    def delete(self, *args, **kwargs):
+        result = super().delete(*args, **kwargs)
+        self._tiers_changed()
+        return result
+
+    def _tiers_changed(self) -> None:
+        ReferralProgram.invalidate_cache()
+        # The tier rates of the program's promoters are recomputed by the `run_bulk_action_jobs` command.
+        BulkActionJob.objects.create(action=BulkActionChoices.SYNC_PROGRAM, object_ids=[self.program_id])
+
+
+class ReferralTreePath(models.Model):
+    """
+    Closure table of the referral tree: one row per (upline promoter, downline user) pair with their distance.
+
+    A user referred by promoter P is at depth 1 below P, at depth 2 below the promoter who referred P's user and
+    so on, up to `REFERRAL_TREE_MAX_DEPTH` levels. All ancestors of a user, or the whole downline of a promoter,
+    are read with a single indexed query.
+    """
+
+    ancestor = models.ForeignKey(Promoter, related_name="downline_paths", on_delete=models.CASCADE)
+    descendant = models.ForeignKey(User, related_name="upline_paths", on_delete=models.CASCADE)
+    depth = models.PositiveSmallIntegerField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["ancestor", "descendant"], name="unique_referral_tree_path"),
+        ]
+        indexes = [
+            models.Index(fields=["descendant", "depth"], name="tree_path_descendant_idx"),
+            models.Index(fields=["ancestor", "depth"], name="tree_path_ancestor_idx"),
+        ]
+
+    @classmethod
+    def add_referral(cls, referral: "Referral") -> None:
+        """
+        Links the referred user, and the downline the user already has as a promoter, below the referring
+        promoter and all of its ancestors.
+        """
+        cls.add_referrals([referral])
+
+    @classmethod
+    def add_referrals(cls, referrals: Iterable["Referral"]) -> None:
+        """
+        Links many referrals like `add_referral`, e.g. a chunk of imported referrals, with two queries and one
+        bulk INSERT in total. The referrals are linked in order, each one on top of the paths of the previous ones.
+        """
+        max_depth = config.REFERRAL_TREE_MAX_DEPTH
+        referrals = [(referral.user_id, referral.promoter_id, referral.promoter.user_id) for referral in referrals]
+        if not referrals:
+            return
+
+        # The paths above the referring promoters and below the referred users, keyed by user on both ends.
+        uplines, downlines = defaultdict(dict), defaultdict(dict)
+        for ancestor_id, ancestor_user_id, descendant_id, depth in cls.objects.filter(
+            descendant_id__in={promoter_user_id for _, _, promoter_user_id in referrals}, depth__lt=max_depth
+        ).values_list("ancestor_id", "ancestor__user_id", "descendant_id", "depth"):
+            uplines[descendant_id][ancestor_id] = (ancestor_user_id, depth)
+        for ancestor_user_id, descendant_id, depth in cls.objects.filter(
+            ancestor__user_id__in={user_id for user_id, _, _ in referrals}, depth__lt=max_depth
+        ).values_list("ancestor__user_id", "descendant_id", "depth"):
+            downlines[ancestor_user_id][descendant_id] = depth
+
+        paths = {}
+        for user_id, promoter_id, promoter_user_id in referrals:
+            ancestors = [(promoter_id, promoter_user_id, 1)]
+            descendants = [(user_id, 0)]
+            downline = [(descendant_id, depth) for descendant_id, depth in downlines[user_id].items()
+                        if depth < max_depth]
+            # A promoter referred from its own downline would close a cycle, so it only gets the direct link.
+            if promoter_user_id != user_id and all(descendant_id != promoter_user_id for descendant_id, _ in downline):
+                ancestors += [
+                    (ancestor_id, ancestor_user_id, depth + 1)
+                    for ancestor_id, (ancestor_user_id, depth) in uplines[promoter_user_id].items()
+                    if depth < max_depth
+                ]
+                descendants += downline
+
+            for ancestor_id, ancestor_user_id, ancestor_depth in ancestors:
+                for descendant_id, descendant_depth in descendants:
+                    depth = ancestor_depth + descendant_depth
+                    if depth > max_depth or (ancestor_id, descendant_id) in paths:
+                        continue
+                    paths[ancestor_id, descendant_id] = depth
+                    # Later referrals of the same batch build on the new paths.
+                    uplines[descendant_id].setdefault(ancestor_id, (ancestor_user_id, depth))
+                    downlines[ancestor_user_id].setdefault(descendant_id, depth)
+
+        cls.objects.bulk_create(
+            [cls(ancestor_id=ancestor_id, descendant_id=descendant_id, depth=depth)
+             for (ancestor_id, descendant_id), depth in paths.items()],
+            ignore_conflicts=True,
+        )
 
 
 class PromoterCommission(TimeStampedModel):
@@ -129,6 +495,29 @@ class PromoterCommission(TimeStampedModel):
     )
     failure_reason = models.TextField(null=True, blank=True)
     invoice_external_id = models.CharField(null=True, max_length=255, blank=True, help_text="e.g. Chargebee invoice ID")
+    level = models.PositiveSmallIntegerField(
+        default=1, help_text="Depth of the promoter above the referred user, 1 for the direct promoter"
+    )
+    currency = models.CharField(max_length=3, default=get_base_currency,
+                                help_text="Currency the referral was billed in")
+    original_amount = models.IntegerField(
+        null=True, blank=True, help_text="Amount in the billing currency, `amount` is in the base currency"
+    )
+
+    class Meta:
+        indexes = [
+            # Covers the balance sums (SUM(amount) per promoter and status) without reading the table.
+            models.Index(fields=["promoter", "status", "amount"], name="commission_prom_status_idx"),
+            models.Index(fields=["referral", "status"], name="commission_ref_status_idx"),
+            models.Index(fields=["promoter", "created"], name="commission_prom_created_idx"),
+            # Finds the pending commissions due to mature, oldest first.
+            models.Index(fields=["status", "created"], name="commission_status_created_idx"),
+            models.Index(
+                fields=["promoter"],
+                name="commission_pending_idx",
+                condition=models.Q(status=PromoterCommissionStatusChoices.PENDING),
+            ),
+        ]
 
 
 class PromoterPayout(TimeStampedModel):
@@ -136,3 +525,148 @@ class PromoterPayout(TimeStampedModel):
     amount = models.IntegerField()
     payout_method = models.CharField(max_length=20, null=False, help_text="Payout method (e.g., wise, crypto, etc.)")
     tx_signature = models.CharField(max_length=255, null=True, blank=True)
+    currency = models.CharField(max_length=3, default=get_base_currency, help_text="Currency the promoter was paid in")
+    target_amount = models.IntegerField(
+        null=True, blank=True, help_text="Amount paid in `currency` in cents, `amount` is in the base currency"
+    )
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["promoter", "-created"], name="payout_promoter_created_idx"),
+            # Covers the total paid sums per promoter without reading the table.
+            models.Index(fields=["promoter", "amount"], name="payout_promoter_amount_idx"),
+        ]
+
+
+class ReferralFingerprint(models.Model):
+    """
+    A keyed hash of an IP address, device or payment fingerprint seen when a promoter fetched its link, a
+    signed-in user clicked it, or a referred user signed up or paid. Raw values are never stored, see
+    `fraud_service`.
+    """
+
+    id = models.BigAutoField(primary_key=True)
+    kind = models.CharField(max_length=10, choices=FingerprintKindChoices.choices)
+    value_hash = models.CharField(max_length=32)
+    event = models.CharField(max_length=10, choices=FingerprintEventChoices.choices)
+    promoter = models.ForeignKey(Promoter, related_name="fingerprints", on_delete=models.CASCADE)
+    user = models.ForeignKey(User, related_name="referral_fingerprints", on_delete=models.CASCADE,
+                             help_text="The promoter, clicking or referred user the fingerprint belongs to")
+    created = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        constraints = [
+            # Also the index of the fingerprint lookups, which filter on its (kind, value_hash) prefix.
+            models.UniqueConstraint(fields=["kind", "value_hash", "event", "promoter", "user"],
+                                    name="unique_referral_fingerprint"),
+        ]
+        indexes = [
+            models.Index(fields=["created"], name="fingerprint_created_idx"),
+        ]
+
+
+class ReferralClickFingerprint(models.Model):
+    """
+    A keyed hash of the IP address or device fingerprint of an anonymous referral link click, stored once per
+    promoter and fingerprint however often it clicks. Clicks of signed-in users are `ReferralFingerprint` rows
+    of the clicking user.
+    """
+
+    id = models.BigAutoField(primary_key=True)
+    kind = models.CharField(max_length=10, choices=FingerprintKindChoices.choices)
+    value_hash = models.CharField(max_length=32)
+    promoter = models.ForeignKey(Promoter, related_name="click_fingerprints", on_delete=models.CASCADE)
+    created = models.DateTimeField(auto_now_add=True, help_text="The first click with the fingerprint")
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["kind", "value_hash", "promoter"],
+                                    name="unique_referral_click_fingerprint"),
+        ]
+
+
+class FxRate(TimeStampedModel):
+    """
+    Exchange rate of a currency to the base currency (`BASE_CURRENCY`), loaded from a file or the command line
+    with the `load_fx_rates` command. Rates are read through `fx_rate_service`, which caches the table in process.
+    """
+
+    currency = models.CharField(max_length=3, unique=True, help_text="ISO 4217 currency code, e.g. EUR")
+    rate = models.DecimalField(
+        max_digits=18,
+        decimal_places=8,
+        validators=[MinValueValidator(Decimal("0.00000001"))],
+        help_text="Value of one unit of the currency in the base currency",
+    )
+
+    def __str__(self):
+        return f"{self.currency}: {self.rate}"
+
+
+class PromoterBalanceSnapshot(TimeStampedModel):
+    promoter = models.ForeignKey(Promoter, related_name="balance_snapshots", on_delete=models.CASCADE)
+    as_of = models.DateTimeField(help_text="The snapshot includes commissions and payouts created before this moment")
+    total_earned = models.IntegerField(default=0)
+    total_paid = models.IntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["promoter", "as_of"], name="unique_promoter_balance_snapshot"),
+        ]
+        indexes = [
+            models.Index(fields=["as_of"], name="balance_snapshot_as_of_idx"),
+        ]
+
+    @property
+    def balance(self) -> int:
+        return self.total_earned - self.total_paid
+
+
+class BulkActionJob(TimeStampedModel):
+    """
+    An admin bulk action over a selection too large to run within the admin request, executed later by the
+    `run_bulk_action_jobs` command.
+    """
+
+    action = models.CharField(max_length=30, choices=BulkActionChoices.choices)
+    object_ids = models.JSONField(
+        help_text="Primary keys of the selected promoters, referrals, commissions or programs"
+    )
+    params = models.JSONField(default=dict, blank=True, help_text="Action parameters, e.g. the failure reason")
+    status = models.CharField(
+        max_length=10, choices=BulkActionJobStatusChoices.choices, default=BulkActionJobStatusChoices.PENDING
+    )
+    processed = models.IntegerField(default=0, help_text="Number of rows changed by the action")
+    error = models.TextField(null=True, blank=True)
+    requested_by = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["status", "id"], name="bulk_action_job_status_idx"),
+        ]
+
+    def __str__(self):
+        return f"{self.get_action_display()} #{self.id} ({self.status})"
+
+
+class OutboxEvent(models.Model):
+    """
+    Transactional outbox of referral lifecycle events. Rows are inserted in the transaction of the change they
+    describe and published to downstream systems by the `relay_outbox_events` command.
+    """
+
+    id = models.BigAutoField(primary_key=True)
+    event_type = models.CharField(max_length=30, choices=OutboxEventTypeChoices.choices)
+    aggregate_id = models.BigIntegerField(null=True, help_text="ID of the referral, commission or payout")
+    payload = models.JSONField()
+    created = models.DateTimeField(auto_now_add=True)
+    published_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            # The relay only reads the unpublished tail of the table.
+            models.Index(fields=["id"], name="outbox_unpublished_idx", condition=models.Q(published_at__isnull=True)),
+        ]
+
+    def __str__(self):
+        return f"{self.event_type} #{self.id}"
@@ -0,0 +1,80 @@
+import json
+import logging
+import sys
+import urllib.request
+from typing import Optional, TextIO
+
+from django.utils.module_loading import import_string
+
+logger = logging.getLogger(__name__)
+
+
+class OutboxSink:
+    """
+    Destination the outbox relay publishes events to.
+
+    `publish` receives a batch of event dicts and must raise if any event of the batch was not delivered; the
+    batch is then left unacknowledged and published again by the next relay run (at-least-once delivery), so
+    consumers should deduplicate by event `id`.
+    """
+
+    def publish(self, events: list[dict]) -> None:
+        raise NotImplementedError
+
+    def close(self) -> None:
+        pass
+
+
+class JsonlFileSink(OutboxSink):
+    """Appends events to a JSONL file, one event per line."""
+
+    def __init__(self, path: str):
+        self.file = open(path, "a")
+
+    def publish(self, events: list[dict]) -> None:
+        self.file.write("".join(json.dumps(event) + "\n" for event in events))
+        self.file.flush()
+
+    def close(self) -> None:
+        self.file.close()
+
+
+class StreamSink(OutboxSink):
+    """Writes events as JSONL to a stream, stdout by default. A local stand-in for a real consumer."""
+
+    def __init__(self, stream: Optional[TextIO] = None):
+        self.stream = stream or sys.stdout
+
+    def publish(self, events: list[dict]) -> None:
+        self.stream.write("".join(json.dumps(event) + "\n" for event in events))
+
+
+class WebhookSink(OutboxSink):
+    """POSTs every batch as a JSON array to a webhook URL. Any non-2xx response fails the batch."""
+
+    def __init__(self, url: str, timeout: float = 10.0, headers: Optional[dict] = None):
+        self.url = url
+        self.timeout = timeout
+        self.headers = {"Content-Type": "application/json", **(headers or {})}
+
+    def publish(self, events: list[dict]) -> None:
+        request = urllib.request.Request(self.url, data=json.dumps(events).encode(), headers=self.headers,
+                                         method="POST")
+        with urllib.request.urlopen(request, timeout=self.timeout) as response:
+            if not 200 <= response.status < 300:
+                raise RuntimeError(f"Webhook {self.url} responded with {response.status}")
+
+
+SINKS = {
+    "jsonl": JsonlFileSink,
+    "stdout": StreamSink,
+    "webhook": WebhookSink,
+}
+
+
+def get_sink(name: str, **options) -> OutboxSink:
+    """
+    Builds a sink by name (`jsonl`, `stdout` or `webhook`) or by the dotted path of an `OutboxSink` subclass.
+    """
+    sink_class = SINKS.get(name) or import_string(name)
+    return sink_class(**options)
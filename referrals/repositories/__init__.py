@@ -1,11 +1,25 @@
 __all__ = [
+    'bulk_action_job_repository',
+    'fx_rate_repository',
+    'outbox_event_repository',
+    'referral_click_fingerprint_repository',
+    'referral_fingerprint_repository',
     'referral_repository',
     'promoter_repository',
+    'promoter_balance_snapshot_repository',
     'promoter_commission_repository',
     'promoter_payout_repository',
+    'referral_tree_repository',
 ]
 
+from .bulk_action_job_repository import bulk_action_job_repository
+from .fx_rate_repository import fx_rate_repository
+from .outbox_event_repository import outbox_event_repository
+from .promoter_balance_snapshot_repository import promoter_balance_snapshot_repository
 from .promoter_commission_repository import promoter_commission_repository
 from .promoter_payout_repository import promoter_payout_repository
 from .promoter_repository import promoter_repository
+from .referral_click_fingerprint_repository import referral_click_fingerprint_repository
+from .referral_fingerprint_repository import referral_fingerprint_repository
 from .referral_repository import referral_repository
+from .referral_tree_repository import referral_tree_repository
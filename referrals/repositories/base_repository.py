@@ -1,10 +1,14 @@
-from typing import Generic, List, Optional, Tuple, Type, TypeVar
+from typing import Generic, Iterator, List, Optional, Tuple, Type, TypeVar
 
+from django.db import connections, router, transaction
 from django.db.models import Model, QuerySet
 from django.shortcuts import get_object_or_404
+from django.utils import timezone
 
 T = TypeVar("T", bound=Model)
 
+DEFAULT_BATCH_SIZE = 1000
+
 
 class BaseRepository(Generic[T]):
     def __init__(self, model: Type[T]):
@@ -28,17 +32,30 @@ class BaseRepository(Generic[T]):
     def create(self, **kwargs) -> T:
         return self.model.objects.create(**kwargs)
 
-    def create_many(self, data_list: List[dict]) -> List[T]:
+    def create_many(self, data_list: List[dict], **bulk_options) -> List[T]:
         instances = [self.model(**data) for data in data_list]
-        return self.model.objects.bulk_create(instances)
+        return self.bulk_create(instances, **bulk_options)
 
     def update(self, values: dict, **kwargs) -> T:
         instance = self.model.objects.get(**kwargs)
         for attr, value in values.items():
             setattr(instance, attr, value)
-        instance.save()
+        instance.save(update_fields=list(dict.fromkeys([*values, *self._get_auto_now_values()])))
         return instance
 
+    def update_where(self, values: dict, **filters) -> int:
+        """
+        Updates all rows matching the filters in a single UPDATE statement, without fetching them.
+
+        Values can be expressions such as `F("link_clicked") + 1`. `auto_now` fields are set as well, since
+        `QuerySet.update` bypasses `save()`.
+
+        Returns:
+            int: The number of updated rows.
+        """
+        values = {**self._get_auto_now_values(), **values}
+        return self.model.objects.filter(**filters).update(**values)
+
     def update_or_create(self, defaults: Optional[dict] = None, **kwargs) -> Tuple[T, bool]:
         return self.model.objects.update_or_create(defaults=defaults, **kwargs)
 
@@ -69,11 +86,107 @@ class BaseRepository(Generic[T]):
     def prefetch_related(self, *args) -> QuerySet[T]:
         return self.model.objects.prefetch_related(*args)
 
-    def bulk_create(self, objs: List[T]) -> List[T]:
-        return self.model.objects.bulk_create(objs)
+    def bulk_create(self, objs: List[T],
+                    batch_size: Optional[int] = DEFAULT_BATCH_SIZE,
+                    ignore_conflicts: bool = False,
+                    update_conflicts: bool = False,
+                    update_fields: Optional[List[str]] = None,
+                    unique_fields: Optional[List[str]] = None) -> List[T]:
+        """
+        Inserts objects in batches of `batch_size` rows per INSERT statement.
+
+        With `ignore_conflicts`, rows violating a unique constraint are skipped. With `update_conflicts`, they
+        are upserted: `update_fields` are overwritten on the row matching `unique_fields`. In both cases the
+        primary keys of the returned objects are only set on databases that return them for conflicting rows.
+        """
+        if update_conflicts and update_fields:
+            update_fields = list(dict.fromkeys([*update_fields, *self._get_auto_now_values()]))
+        return self.model.objects.bulk_create(
+            objs,
+            batch_size=batch_size,
+            ignore_conflicts=ignore_conflicts,
+            update_conflicts=update_conflicts,
+            update_fields=update_fields,
+            unique_fields=unique_fields,
+        )
+
+    def bulk_create_with_pks(self, objs: List[T], batch_size: Optional[int] = DEFAULT_BATCH_SIZE) -> List[T]:
+        """
+        Inserts objects like `bulk_create`, but the returned objects always have their primary keys, e.g. to
+        reference them from outbox events.
+
+        Databases that can't return the rows of a bulk INSERT (MySQL) leave the primary keys of `bulk_create`
+        objects unset, so there the objects are inserted one at a time, in a transaction. Only use this for
+        models whose `save()` has no side effects.
+        """
+        using = router.db_for_write(self.model)
+        if connections[using].features.can_return_rows_from_bulk_insert:
+            return self.bulk_create(objs, batch_size=batch_size)
+
+        with transaction.atomic(using=using):
+            for obj in objs:
+                obj.save(force_insert=True, using=using)
+        return objs
+
+    def bulk_update(self, objs: List[T], fields: List[str], batch_size: Optional[int] = DEFAULT_BATCH_SIZE) -> int:
+        """
+        Updates `fields` of the objects with one UPDATE statement per batch of `batch_size` objects.
+
+        Returns:
+            int: The number of updated rows.
+        """
+        return self.model.objects.bulk_update(objs, fields, batch_size=batch_size)
+
+    def iter_chunks(self, chunk_size: int = DEFAULT_BATCH_SIZE,
+                    queryset: Optional[QuerySet[T]] = None) -> Iterator[List[T]]:
+        """
+        Iterates over a queryset (all rows by default) in lists of at most `chunk_size` objects.
+
+        Chunks are fetched by primary-key keyset (`pk > last_pk ORDER BY pk LIMIT chunk_size`), so every chunk is
+        an index range scan and the cost doesn't grow with the offset like `OFFSET` pagination does.
+        """
+        queryset = (queryset if queryset is not None else self.get_all()).order_by("pk")
+        last_pk = None
+        while True:
+            chunk_query = queryset if last_pk is None else queryset.filter(pk__gt=last_pk)
+            chunk = list(chunk_query[:chunk_size])
+            if not chunk:
+                return
+            yield chunk
+            if len(chunk) < chunk_size:
+                return
+            last_pk = chunk[-1].pk
+
+    def get_estimated_count(self, using: str = "default") -> Optional[int]:
+        """
+        Returns the row count estimate of the table from the database statistics, without scanning it.
+
+        Returns:
+            Optional[int]: The estimate on PostgreSQL and MySQL, or None where no estimate is available (SQLite,
+            or a PostgreSQL table that was never analyzed).
+        """
+        connection = connections[using]
+        if connection.vendor == "postgresql":
+            sql = "SELECT reltuples::bigint FROM pg_class WHERE oid = to_regclass(%s)"
+        elif connection.vendor == "mysql":
+            sql = "SELECT table_rows FROM information_schema.tables WHERE table_schema = DATABASE() AND table_name = %s"
+        else:
+            return None
 
-    def bulk_update(self, objs: List[T], fields: Optional[List[str]] = None) -> None:
-        return self.model.objects.bulk_update(objs, fields)
+        with connection.cursor() as cursor:
+            cursor.execute(sql, [self.model._meta.db_table])
+            row = cursor.fetchone()
+        if row is None or row[0] is None or row[0] < 0:
+            return None
+        return int(row[0])
+
+    def _get_auto_now_values(self) -> dict:
+        now = timezone.now()
+        return {
+            field.name: now
+            for field in self.model._meta.concrete_fields
+            if getattr(field, "auto_now", False)
+        }
 
     def values_list(self, *fields, flat: bool = False, named: bool = False) -> QuerySet:
         return self.model.objects.values_list(*fields, flat=flat, named=named)
@@ -0,0 +1,22 @@
+from typing import Optional
+
+from referrals.choices import BulkActionJobStatusChoices
+from referrals.models import BulkActionJob
+from .base_repository import BaseRepository
+
+
+class BulkActionJobRepository(BaseRepository):
+    def claim_next_pending(self) -> Optional[BulkActionJob]:
+        """
+        Marks the oldest pending job as running and returns it. The status is changed with a conditional UPDATE,
+        so a job is only claimed by one of several concurrent workers.
+        """
+        for job_id in self.filter(status=BulkActionJobStatusChoices.PENDING).order_by("id").values_list(
+                "id", flat=True)[:10]:
+            if self.update_where({"status": BulkActionJobStatusChoices.RUNNING}, pk=job_id,
+                                 status=BulkActionJobStatusChoices.PENDING):
+                return self.get_one(pk=job_id)
+        return None
+
+
+bulk_action_job_repository = BulkActionJobRepository(model=BulkActionJob)
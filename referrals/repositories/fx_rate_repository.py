@@ -0,0 +1,24 @@
+from decimal import Decimal
+
+from referrals.models import FxRate
+from .base_repository import BaseRepository
+
+
+class FxRateRepository(BaseRepository):
+    def get_rates(self) -> dict[str, Decimal]:
+        return dict(self.get_all().values_list("currency", "rate"))
+
+    def upsert_rates(self, rates: dict[str, Decimal]) -> int:
+        """
+        Inserts or updates the rates of many currencies with batched INSERT ... ON CONFLICT statements.
+
+        Returns:
+            int: The number of loaded rates.
+        """
+        return len(self.bulk_create(
+            [FxRate(currency=currency, rate=rate) for currency, rate in rates.items()],
+            update_conflicts=True, update_fields=["rate"], unique_fields=["currency"],
+        ))
+
+
+fx_rate_repository = FxRateRepository(model=FxRate)
@@ -0,0 +1,25 @@
+from typing import Iterable
+
+from django.db import connections
+from django.utils import timezone
+
+from referrals.models import OutboxEvent
+from .base_repository import BaseRepository
+
+
+class OutboxEventRepository(BaseRepository):
+    def get_unpublished_batch(self, batch_size: int) -> list[OutboxEvent]:
+        """
+        Locks and returns the oldest unpublished events. Rows locked by another relay are skipped, so several
+        relays can run at once; must be called inside a transaction.
+        """
+        query = self.filter(published_at__isnull=True).order_by("id")
+        if connections[query.db].features.has_select_for_update_skip_locked:
+            query = query.select_for_update(skip_locked=True)
+        return list(query[:batch_size])
+
+    def mark_published(self, event_ids: Iterable[int]) -> int:
+        return self.update_where({"published_at": timezone.now()}, pk__in=list(event_ids))
+
+
+outbox_event_repository = OutboxEventRepository(model=OutboxEvent)
@@ -0,0 +1,23 @@
+import logging
+from datetime import datetime
+from typing import Optional
+
+from django.db.models import Max
+
+from referrals.models import PromoterBalanceSnapshot
+from .base_repository import BaseRepository
+
+logger = logging.getLogger(__name__)
+
+
+class PromoterBalanceSnapshotRepository(BaseRepository):
+
+    def get_latest_as_of(self, before: datetime, inclusive: bool = True) -> Optional[datetime]:
+        lookup = "as_of__lte" if inclusive else "as_of__lt"
+        return self.filter(**{lookup: before}).aggregate(latest=Max("as_of"))["latest"]
+
+    def get_snapshot_totals(self, as_of: datetime, **promoter_filters):
+        return self.filter(as_of=as_of, **promoter_filters).values_list("promoter_id", "total_earned", "total_paid")
+
+
+promoter_balance_snapshot_repository = PromoterBalanceSnapshotRepository(model=PromoterBalanceSnapshot)
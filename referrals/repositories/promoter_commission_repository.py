@@ -1,31 +1,157 @@
 import logging
+from datetime import date, datetime
+from typing import Iterable, Optional, Sequence
+
+from django.db.models import Exists, OuterRef, Q, Sum
 
 from referrals.choices import PromoterCommissionStatusChoices
 from referrals.models import Promoter, Referral, PromoterCommission
 from referrals.repositories.base_repository import BaseRepository
+from referrals.utils import get_date_range_filters
 
 logger = logging.getLogger(__name__)
 
+UNPAID_COMMISSION_STATUSES = [PromoterCommissionStatusChoices.PENDING.value,
+                              PromoterCommissionStatusChoices.MATURED.value]
+POSITIVE_COMMISSION_STATUSES = [PromoterCommissionStatusChoices.PENDING, PromoterCommissionStatusChoices.MATURED,
+                                PromoterCommissionStatusChoices.PAID, PromoterCommissionStatusChoices.FLAGGED]
+
 
 class PromoterCommissionRepository(BaseRepository):
 
     def mark_commission_paid(self, promoter: Promoter):
-        self.filter(
-            promoter=promoter,
-            status__in=[PromoterCommissionStatusChoices.PENDING.value, PromoterCommissionStatusChoices.FAILED.value],
-        ).update(status=PromoterCommissionStatusChoices.PAID.value)
+        self.mark_commissions_paid([promoter.id])
 
+    def mark_commissions_paid(self, promoter_ids: Iterable[int]) -> int:
+        """
+        Marks the matured and failed commissions of promoters paid. Pending commissions are still in their hold
+        period and are not part of the payout.
+        """
+        return self.update_where(
+            {"status": PromoterCommissionStatusChoices.PAID.value},
+            promoter_id__in=promoter_ids,
+            status__in=[PromoterCommissionStatusChoices.MATURED.value, PromoterCommissionStatusChoices.FAILED.value],
+        )
+
+    # Only matured commissions can fail: failed commissions are payable, so failing a commission that is still
+    # in its hold period would skip the hold.
     def mark_commission_failed_with_reason(self, promoter: Promoter, failure_reason: str):
-        self.filter(promoter=promoter, status=PromoterCommissionStatusChoices.PENDING.value).update(
-            status=PromoterCommissionStatusChoices.FAILED.value, failure_reason=failure_reason
+        self.update_where(
+            {"status": PromoterCommissionStatusChoices.FAILED.value, "failure_reason": failure_reason},
+            promoter=promoter,
+            status=PromoterCommissionStatusChoices.MATURED.value,
+        )
+
+    def mark_commissions_failed(self, commission_ids: Iterable[int], failure_reason: str) -> int:
+        return self.update_where(
+            {"status": PromoterCommissionStatusChoices.FAILED.value, "failure_reason": failure_reason},
+            pk__in=commission_ids,
+            status=PromoterCommissionStatusChoices.MATURED.value,
+        )
+
+    def get_due_pending_ids(self, matured_before: datetime, limit: int, promoters: Optional[Q] = None) -> list[int]:
+        """
+        Returns up to `limit` IDs of pending commissions created before `matured_before`, oldest first, read from
+        the (status, created) index. `promoters` limits them to the promoters matching a condition.
+        """
+        query = self.filter(status=PromoterCommissionStatusChoices.PENDING.value, created__lt=matured_before)
+        if promoters is not None:
+            query = query.filter(promoters)
+        return list(query.order_by("created").values_list("id", flat=True)[:limit])
+
+    def mark_commissions_matured(self, commission_ids: Iterable[int]) -> int:
+        return self.update_where(
+            {"status": PromoterCommissionStatusChoices.MATURED.value},
+            pk__in=commission_ids,
+            status=PromoterCommissionStatusChoices.PENDING.value,
+        )
+
+    def retry_failed_commissions(self, commission_ids: Iterable[int]) -> int:
+        """
+        Moves failed commissions back to matured, which they were before they failed, so they are paid by the
+        next payout run.
+        """
+        return self.update_where(
+            {"status": PromoterCommissionStatusChoices.MATURED.value, "failure_reason": None},
+            pk__in=commission_ids,
+            status=PromoterCommissionStatusChoices.FAILED.value,
         )
 
+    def flag_referral_commissions(self, referral_ids: Iterable[int]) -> int:
+        """
+        Moves the unpaid commissions of flagged referrals, and the refunds of those commissions, to flagged, which
+        doesn't count toward the payable balance. Refunds of paid commissions stay refunds, so they are still
+        deducted from the next payout, like in `PromoterPayoutService.calculate_refund`.
+        """
+        referral_ids = list(referral_ids)
+        unpaid_commissions = self.filter(
+            referral_id=OuterRef("referral_id"), promoter_id=OuterRef("promoter_id"), level=OuterRef("level"),
+            status__in=UNPAID_COMMISSION_STATUSES,
+        )
+        refund_ids = list(
+            self.filter(referral_id__in=referral_ids, status=PromoterCommissionStatusChoices.REFUND.value)
+            .filter(Exists(unpaid_commissions)).values_list("id", flat=True)
+        )
+        flagged = {"status": PromoterCommissionStatusChoices.FLAGGED.value}
+        return (
+            self.update_where(flagged, pk__in=refund_ids)
+            + self.update_where(flagged, referral_id__in=referral_ids, status__in=UNPAID_COMMISSION_STATUSES)
+        )
+
+    def unflag_referral_commissions(self, referral_ids: Iterable[int]) -> int:
+        """
+        Moves the flagged commissions of cleared referrals back to pending, and their refunds back to refund.
+        Pending commissions mature again on the next maturation run.
+        """
+        referral_ids = list(referral_ids)
+        flagged = {"referral_id__in": referral_ids, "status": PromoterCommissionStatusChoices.FLAGGED.value}
+        return (
+            self.update_where({"status": PromoterCommissionStatusChoices.PENDING.value}, amount__gte=0, **flagged)
+            + self.update_where({"status": PromoterCommissionStatusChoices.REFUND.value}, amount__lt=0, **flagged)
+        )
+
+    def get_promoter_commission_totals(self, promoter_id: int, days: Sequence[date] = ()) -> dict:
+        """
+        Sums a promoter's commissions in total, by status and for each of the given days in a single query.
+
+        Returns:
+            dict: `total`, `by_status` and `by_day` sums, with the days in ISO format. Every status and day is
+            present.
+        """
+        day_filters = {day: Q(**get_date_range_filters("created", day, day)) for day in days}
+        totals = self.filter(promoter_id=promoter_id).aggregate(
+            total=Sum("amount"),
+            **{f"status_{value}": Sum("amount", filter=Q(status=value))
+               for value in PromoterCommissionStatusChoices.values},
+            **{f"day_{day.isoformat()}": Sum("amount", filter=day_filter) for day, day_filter in day_filters.items()},
+        )
+        return {
+            "total": totals["total"] or 0,
+            "by_status": {value: totals[f"status_{value}"] or 0 for value in PromoterCommissionStatusChoices.values},
+            "by_day": {day.isoformat(): totals[f"day_{day.isoformat()}"] or 0 for day in days},
+        }
+
     def get_referral_positive_commission(self, referral: Referral):
         query = self.filter(
             referral=referral,
-            status__in=[PromoterCommissionStatusChoices.PENDING, PromoterCommissionStatusChoices.PAID]
+            level=1,
+            status__in=POSITIVE_COMMISSION_STATUSES,
         )
         return query.first()
 
+    def get_referral_positive_commissions(self, referral: Referral) -> list[PromoterCommission]:
+        """
+        Returns the first positive commission of every level of a referral, ordered by level.
+        """
+        query = self.filter(
+            referral=referral,
+            status__in=POSITIVE_COMMISSION_STATUSES,
+        ).order_by("level", "id")
+
+        commissions = {}
+        for commission in query:
+            commissions.setdefault(commission.level, commission)
+        return list(commissions.values())
+
 
 promoter_commission_repository = PromoterCommissionRepository(model=PromoterCommission)
@@ -1,4 +1,5 @@
 import logging
+from typing import Iterable
 
 from .base_repository import BaseRepository
 from referrals.models import Promoter, PromoterPayout
@@ -7,13 +8,26 @@ logger = logging.getLogger(__name__)
 
 
 class PromoterPayoutRepository(BaseRepository):
-    def create_payout(self, promoter: Promoter, amount: float, payout_method, tx_signature: str = None):
-        self.create(
+    def create_payout(self, promoter: Promoter, amount: float, payout_method,
+                      tx_signature: str = None) -> PromoterPayout:
+        return self.create(
             promoter=promoter,
             amount=amount,
             payout_method=payout_method,
             tx_signature=tx_signature,
         )
 
+    def create_payouts(self, payouts: Iterable[tuple[int, int, str, int]],
+                       payout_method: str) -> list[PromoterPayout]:
+        """
+        Creates payouts from `(promoter_id, amount, currency, target_amount)` rows with batched INSERT
+        statements. `amount` is in the base currency and `target_amount` in the payout `currency`, both in cents.
+        """
+        return self.bulk_create_with_pks([
+            PromoterPayout(promoter_id=promoter_id, amount=amount, payout_method=payout_method, currency=currency,
+                           target_amount=target_amount)
+            for promoter_id, amount, currency, target_amount in payouts
+        ])
+
 
 promoter_payout_repository = PromoterPayoutRepository(model=PromoterPayout)
@@ -1,8 +1,14 @@
 import logging
-from typing import Optional
+from collections import defaultdict
+from decimal import Decimal
+from typing import Iterable, Iterator, Optional
 
-from referrals.models import Promoter, Referral
-from .base_repository import BaseRepository
+from django.db.models import Count, F, IntegerField, Max, Min, OuterRef, Q, QuerySet, Subquery, Sum
+from django.db.models.functions import Coalesce
+
+from referrals.models import PAYABLE_COMMISSION_STATUSES, Promoter, PromoterCommission, PromoterPayout, Referral, \
+    ReferralProgram
+from .base_repository import DEFAULT_BATCH_SIZE, BaseRepository
 
 logger = logging.getLogger(__name__)
 
@@ -20,8 +26,176 @@ class PromoterRepository(BaseRepository):
                 active_payout_method__method="wise")
         )
 
+    def get_wise_payout_promoters_with_balance(self):
+        """
+        Wise payout promoters annotated with their balances, see `annotate_balances`.
+
+        The annotations take the place of the `Promoter` cached properties, so `payable_balance` doesn't
+        run aggregate queries per promoter.
+        """
+        return self.annotate_balances(self.get_wise_payout_promoters())
+
+    def annotate_balances(self, queryset: Optional[QuerySet] = None) -> QuerySet:
+        """
+        Annotates promoters with `total_earned`, `total_paid`, `balance`, `payable_earned` and `payable_balance`
+        in the same query.
+
+        The annotations are correlated subqueries, so on a paginated query they are only computed for the rows
+        of the page. The payable totals only read matured, paid, failed and refund commissions.
+        """
+        queryset = queryset if queryset is not None else self.get_all()
+        return queryset.annotate(
+            total_earned=self._aggregate_subquery(PromoterCommission, Sum("amount")),
+            total_paid=self._aggregate_subquery(PromoterPayout, Sum("amount")),
+            payable_earned=self._aggregate_subquery(PromoterCommission, Sum("amount"),
+                                                    status__in=PAYABLE_COMMISSION_STATUSES),
+        ).annotate(
+            balance=F("total_earned") - F("total_paid"),
+            payable_balance=F("payable_earned") - F("total_paid"),
+        )
+
+    def get_with_payout_totals(self, user_id: int) -> Optional[Promoter]:
+        """
+        The promoter of a user annotated with `total_paid`, `payouts_count` and `last_payout_at`, in one query.
+        """
+        last_payout = PromoterPayout.objects.filter(promoter_id=OuterRef("pk")).order_by("-created")
+        return self.filter(user_id=user_id).annotate(
+            total_paid=self._aggregate_subquery(PromoterPayout, Sum("amount")),
+            payouts_count=self._aggregate_subquery(PromoterPayout, Count("id")),
+            last_payout_at=Subquery(last_payout.values("created")[:1]),
+        ).first()
+
+    def annotate_referrals_count(self, queryset: Optional[QuerySet] = None) -> QuerySet:
+        queryset = queryset if queryset is not None else self.get_all()
+        return queryset.annotate(referrals_count=self._aggregate_subquery(Referral, Count("id")))
+
+    @staticmethod
+    def _aggregate_subquery(model, aggregate, **filters) -> Coalesce:
+        totals = (
+            model.objects.filter(promoter_id=OuterRef("pk"), **filters).order_by().values("promoter_id")
+            .annotate(total=aggregate).values("total")
+        )
+        return Coalesce(Subquery(totals, output_field=IntegerField()), 0)
+
+    def increment_link_clicked(self, promoter_id: int) -> bool:
+        """
+        Increments the link clicks of a promoter in a single UPDATE statement.
+
+        Returns:
+            bool: Whether the promoter exists.
+        """
+        return self.update_where({"link_clicked": F("link_clicked") + 1}, pk=promoter_id) > 0
+
+    def add_link_clicks(self, clicks_by_promoter: dict[int, int], batch_size: int = DEFAULT_BATCH_SIZE) -> int:
+        """
+        Adds many promoters' link clicks with one UPDATE per distinct click count (and batch of `batch_size`
+        promoters), e.g. one statement for all promoters clicked once, one for those clicked twice.
+
+        Returns:
+            int: The number of clicks added to existing promoters.
+        """
+        promoter_ids_by_clicks = defaultdict(list)
+        for promoter_id, clicks in clicks_by_promoter.items():
+            promoter_ids_by_clicks[clicks].append(promoter_id)
+
+        added = 0
+        for clicks, promoter_ids in promoter_ids_by_clicks.items():
+            for start in range(0, len(promoter_ids), batch_size):
+                updated = self.update_where({"link_clicked": F("link_clicked") + clicks},
+                                            pk__in=promoter_ids[start:start + batch_size])
+                added += updated * clicks
+        return added
+
+    def get_id_by_legacy_referral_token(self, referral_token: str) -> Optional[int]:
+        return (
+            self.get_all().filter(Q(referral_token=referral_token) | Q(legacy_referral_token=referral_token))
+            .values_list("id", flat=True).first()
+        )
+
+    def get_ids_by_legacy_referral_tokens(self, referral_tokens: Iterable[str]) -> dict[str, int]:
+        """Maps unsigned referral tokens to promoter IDs with a single query."""
+        referral_tokens = set(referral_tokens)
+        ids_by_token = {}
+        for promoter_id, referral_token, legacy_referral_token in self.get_all().filter(
+            Q(referral_token__in=referral_tokens) | Q(legacy_referral_token__in=referral_tokens)
+        ).values_list("id", "referral_token", "legacy_referral_token"):
+            for token in (referral_token, legacy_referral_token):
+                if token in referral_tokens:
+                    ids_by_token[token] = promoter_id
+        return ids_by_token
+
     def check_promoter_get_commission_from_referral(self, promoter: Promoter, referral: Referral) -> bool:
         return self.filter(promoter_commission__referral=referral, pk=promoter.id).exists()
 
+    def get_id_ranges(self, chunk_size: int) -> Iterator[tuple[int, int]]:
+        """
+        Splits the promoter primary keys into half-open `[start, end)` ranges of `chunk_size` IDs.
+        """
+        bounds = self.get_all().aggregate(min_id=Min("id"), max_id=Max("id"))
+        if bounds["min_id"] is None:
+            return iter(())
+        return (
+            (start, start + chunk_size)
+            for start in range(bounds["min_id"], bounds["max_id"] + 1, chunk_size)
+        )
+
+    def get_total_link_clicked(self, promoter_id: Optional[int] = None) -> int:
+        query = self.filter(pk=promoter_id) if promoter_id is not None else self.get_all()
+        return query.aggregate(total=Sum("link_clicked"))["total"] or 0
+
+    def raise_min_withdrawal_balance(self, program: ReferralProgram, include_unassigned: bool = False,
+                                     **filters) -> int:
+        """
+        Raises the minimum withdrawal balance of a program's promoters to the program's minimum with a single
+        UPDATE. With `include_unassigned`, promoters without a program or on an inactive one (i.e. on the default
+        program) as well.
+
+        Returns:
+            int: The number of updated promoters.
+        """
+        programs = Q(program_id=program.id)
+        if include_unassigned:
+            programs |= Q(program__isnull=True) | Q(program__is_active=False)
+        return self.get_all().filter(
+            programs, min_withdrawal_balance__lt=program.min_withdrawal_balance, **filters
+        ).update(min_withdrawal_balance=program.min_withdrawal_balance, **self._get_auto_now_values())
+
+    def update_tier_commission_rates(self, tier_commission_rate, promoters: Q, **filters) -> int:
+        """
+        Sets the tier commission rate of the matching promoters with a single UPDATE, `tier_commission_rate` is
+        usually a `Case` expression over `active_referrals_count`.
+
+        Returns:
+            int: The number of updated promoters.
+        """
+        return self.get_all().filter(promoters, **filters).update(
+            tier_commission_rate=tier_commission_rate, **self._get_auto_now_values()
+        )
+
+    def get_tier_commission_rates(self, promoter_ids: Iterable[int]) -> dict[int, Decimal]:
+        """
+        Returns the tier commission rates of the promoters that reached a tier, by promoter ID, in a single query.
+        """
+        return dict(
+            self.get_all().filter(pk__in=list(promoter_ids), tier_commission_rate__isnull=False)
+            .values_list("id", "tier_commission_rate")
+        )
+
+    def get_by_ids_or_legacy_tokens(self, promoter_ids: Iterable[int],
+                                    legacy_tokens: Iterable[str]) -> list[tuple]:
+        """
+        Looks up many promoters by ID or by unsigned token in a single query.
+
+        Returns:
+            list[tuple]: `(id, user_id, referral_token, legacy_referral_token, program_id)` rows.
+        """
+        legacy_tokens = list(legacy_tokens)
+        return list(
+            self.get_all().filter(
+                Q(pk__in=list(promoter_ids)) | Q(referral_token__in=legacy_tokens)
+                | Q(legacy_referral_token__in=legacy_tokens)
+            ).values_list("id", "user_id", "referral_token", "legacy_referral_token", "program_id")
+        )
+
 
 promoter_repository = PromoterRepository(model=Promoter)
@@ -0,0 +1,16 @@
+from typing import Iterable
+
+from referrals.models import ReferralClickFingerprint
+from .base_repository import BaseRepository
+
+
+class ReferralClickFingerprintRepository(BaseRepository):
+    def record(self, clicks: Iterable[ReferralClickFingerprint]) -> None:
+        """
+        Inserts click fingerprints with one INSERT statement, fingerprints that already clicked the promoter's
+        link are skipped.
+        """
+        self.bulk_create(list(clicks), ignore_conflicts=True)
+
+
+referral_click_fingerprint_repository = ReferralClickFingerprintRepository(model=ReferralClickFingerprint)
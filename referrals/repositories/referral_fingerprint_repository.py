@@ -0,0 +1,61 @@
+from datetime import datetime
+from typing import Iterable
+
+from django.db.models import Count, Exists, OuterRef, Q
+
+from referrals.choices import FingerprintEventChoices, FingerprintKindChoices
+from referrals.models import ReferralFingerprint
+from .base_repository import BaseRepository
+
+# Only device and payment fingerprints identify a person, many people can share an IP address.
+ACCOUNT_FINGERPRINT_KINDS = [FingerprintKindChoices.DEVICE.value, FingerprintKindChoices.PAYMENT.value]
+
+
+class ReferralFingerprintRepository(BaseRepository):
+    def record(self, fingerprints: Iterable[ReferralFingerprint]) -> None:
+        """
+        Inserts fingerprints with one INSERT statement, fingerprints that were already recorded are skipped.
+        """
+        self.bulk_create(list(fingerprints), ignore_conflicts=True)
+
+    def get_matches(self, hashes: dict[str, str], promoter_id: int, promoter_user_id: int, user_id: int,
+                    limit: int = 20) -> list[tuple[str, int]]:
+        """
+        Finds other users with one of the fingerprints among a promoter's own fingerprints and those of the users
+        who clicked its link or were referred by it, with a single query on the (kind, value_hash) index.
+
+        Returns:
+            list[tuple[str, int]]: Up to `limit` `(kind, user_id)` pairs.
+        """
+        fingerprints = Q()
+        for kind, value_hash in hashes.items():
+            fingerprints |= Q(kind=kind, value_hash=value_hash)
+        return list(
+            self.get_all().filter(fingerprints)
+            .filter(Q(user_id=promoter_user_id) | Q(promoter_id=promoter_id))
+            .exclude(user_id=user_id)
+            .values_list("kind", "user_id")[:limit]
+        )
+
+    def get_clustered_accounts(self, since: datetime, min_accounts: int) -> list[tuple[int, int]]:
+        """
+        Finds the referred users that share a device or payment fingerprint with at least `min_accounts - 1`
+        other accounts, among the fingerprints recorded since `since`.
+
+        Returns:
+            list[tuple[int, int]]: Distinct `(user_id, promoter_id)` pairs of the signups and payments with a
+            shared fingerprint.
+        """
+        recent = self.filter(created__gte=since, kind__in=ACCOUNT_FINGERPRINT_KINDS)
+        shared = (
+            recent.filter(kind=OuterRef("kind"), value_hash=OuterRef("value_hash"))
+            .order_by().values("kind", "value_hash")
+            .annotate(accounts=Count("user_id", distinct=True)).filter(accounts__gte=min_accounts)
+        )
+        return list(
+            recent.filter(Exists(shared), event__in=[FingerprintEventChoices.SIGNUP, FingerprintEventChoices.PAYMENT])
+            .order_by().values_list("user_id", "promoter_id").distinct()
+        )
+
+
+referral_fingerprint_repository = ReferralFingerprintRepository(model=ReferralFingerprint)
@@ -1,16 +1,92 @@
-from typing import Optional
+from datetime import date
+from typing import Iterable, Optional
+
+from django.db.models import Count, Prefetch, Q, QuerySet
 
 from .base_repository import BaseRepository
-from referrals.models import Referral
+from referrals.choices import InvitationMethodChoices, PromoterCommissionStatusChoices, ReferralStateChoices
+from referrals.models import PromoterCommission, Referral
+from referrals.utils import get_date_range_filters
 
 
 class ReferralRepository(BaseRepository):
 
     def get_referrals_by_user_id(self, user_id: int) -> Optional[Referral]:
-        return self.select_related("promoter__user").filter(promoter__user_id=user_id).all().order_by("-created")
+        positive_commissions = PromoterCommission.objects.filter(
+            level=1, status__in=[PromoterCommissionStatusChoices.PENDING, PromoterCommissionStatusChoices.MATURED,
+                                 PromoterCommissionStatusChoices.PAID]
+        ).order_by("id")
+        return (
+            self.select_related("user", "promoter__user")
+            .prefetch_related(Prefetch("referral_commission", queryset=positive_commissions,
+                                       to_attr="positive_commissions"))
+            .filter(promoter__user_id=user_id)
+            .order_by("-created")
+        )
 
     def get_referral_by_user_id(self, user_id: int) -> Optional[Referral]:
         return self.select_related("promoter").filter(user_id=user_id).first()
 
+    def set_flagged(self, referral_ids: Iterable[int], flag_reason: str = "") -> int:
+        """
+        Flags the referrals with a reason, or clears their flags with an empty reason, in a single UPDATE.
+
+        Returns:
+            int: The number of referrals whose flag changed.
+        """
+        return self.update_where(
+            {"is_flagged": bool(flag_reason), "flag_reason": flag_reason},
+            pk__in=list(referral_ids), is_flagged=not flag_reason,
+        )
+
+    def get_unflagged_ids_by_user_ids(self, user_ids: Iterable[int]) -> list[int]:
+        return list(self.filter(user_id__in=list(user_ids), is_flagged=False).values_list("id", flat=True))
+
+    def get_funnel_counts(self, group_field: Optional[str] = None,
+                          date_from: Optional[date] = None,
+                          date_to: Optional[date] = None,
+                          promoter_id: Optional[int] = None) -> QuerySet:
+        """
+        Returns funnel counts (signups, active, refunded) aggregated in a single GROUP BY query.
+
+        A refunded referral has been active before, so it is counted in `active` as well.
+        """
+        query = self.filter(**get_date_range_filters("created", date_from, date_to))
+        if promoter_id is not None:
+            query = query.filter(promoter_id=promoter_id)
+
+        aggregates = {
+            "signups": Count("id"),
+            "active": Count(
+                "id", filter=Q(status__in=[ReferralStateChoices.ACTIVE, ReferralStateChoices.REFUND])
+            ),
+            "refunded": Count("id", filter=Q(status=ReferralStateChoices.REFUND)),
+        }
+        if group_field is None:
+            result = query.aggregate(**aggregates)
+            return [result] if result["signups"] else []
+        return query.values(group_field).annotate(**aggregates).values_list(group_field, *aggregates).order_by(
+            group_field
+        )
+
+    def get_promoter_referral_counts(self, promoter_id: int) -> dict:
+        """
+        Counts a promoter's referrals in total, by status and by invitation method in a single query.
+
+        Returns:
+            dict: `total`, `by_status` and `by_invitation_method` counts. Every choice is present.
+        """
+        counts = self.filter(promoter_id=promoter_id).aggregate(
+            total=Count("id"),
+            **{f"status_{value}": Count("id", filter=Q(status=value)) for value in ReferralStateChoices.values},
+            **{f"method_{value}": Count("id", filter=Q(invitation_method=value))
+               for value in InvitationMethodChoices.values},
+        )
+        return {
+            "total": counts["total"],
+            "by_status": {value: counts[f"status_{value}"] for value in ReferralStateChoices.values},
+            "by_invitation_method": {value: counts[f"method_{value}"] for value in InvitationMethodChoices.values},
+        }
+
 
 referral_repository = ReferralRepository(model=Referral)
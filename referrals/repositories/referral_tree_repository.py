@@ -0,0 +1,50 @@
+import logging
+from decimal import Decimal
+from typing import Iterable
+
+from django.db.models import Count
+
+from referrals.models import ReferralProgram, ReferralTreePath
+from .base_repository import BaseRepository
+
+logger = logging.getLogger(__name__)
+
+
+class ReferralTreeRepository(BaseRepository):
+
+    def get_upline_level_rates(self, user_id: int) -> list[tuple[int, int, Decimal]]:
+        """
+        Returns `(promoter_id, level, commission_rate)` of the indirect promoters above a user that earn a
+        commission, each at the level rate of their own program.
+
+        The upline is read in a single query and the rates come from the cached programs.
+        """
+        return self.get_upline_level_rates_by_user([user_id]).get(user_id, [])
+
+    def get_upline_level_rates_by_user(self, user_ids: Iterable[int]) -> dict[int, list[tuple[int, int, Decimal]]]:
+        """
+        Returns the `(promoter_id, level, commission_rate)` upline of many users at once, see
+        `get_upline_level_rates`, in a single query. Users without a paid upline are left out.
+        """
+        upline = (
+            self.filter(descendant_id__in=list(user_ids), depth__gte=2).order_by("descendant_id", "depth")
+            .values_list("descendant_id", "ancestor_id", "depth", "ancestor__program_id")
+        )
+        level_rates = {}
+        for user_id, promoter_id, level, program_id in upline:
+            commission_rate = ReferralProgram.get_level_rates(program_id).get(level)
+            if commission_rate is not None:
+                level_rates.setdefault(user_id, []).append((promoter_id, level, commission_rate))
+        return level_rates
+
+    def get_downline_counts(self, promoter_id: int) -> list[tuple[int, int]]:
+        """
+        Returns `(level, users)` pairs of a promoter's downline, counted with a single GROUP BY query.
+        """
+        return list(
+            self.filter(ancestor_id=promoter_id).values("depth").annotate(users=Count("id"))
+            .order_by("depth").values_list("depth", "users")
+        )
+
+
+referral_tree_repository = ReferralTreeRepository(model=ReferralTreePath)
@@ -1,5 +1,7 @@
 from rest_framework import serializers
 
+from referrals.choices import PromoterCommissionStatusChoices, ReferralStateChoices, ExportDatasetChoices, \
+    ExportFormatChoices
 from referrals.models import (
     PayoutMethod,
     Promoter,
@@ -59,14 +61,20 @@ class ReferralSerializer(CamelCaseSerializer):
     def get_user_id(self, obj):
         return obj.user.id
 
+    @staticmethod
+    def get_positive_commission(obj):
+        if hasattr(obj, "positive_commissions"):
+            return obj.positive_commissions[0] if obj.positive_commissions else None
+        return promoter_commission_repository.get_referral_positive_commission(obj)
+
     def get_commission_amount(self, obj):
-        commission = promoter_commission_repository.get_referral_positive_commission(obj)
+        commission = self.get_positive_commission(obj)
         if commission:
             return commission.amount
         return 0
 
     def get_commission_status(self, obj):
-        commission = promoter_commission_repository.get_referral_positive_commission(obj)
+        commission = self.get_positive_commission(obj)
         if commission:
             return commission.status
         return None
@@ -75,7 +83,10 @@ class ReferralSerializer(CamelCaseSerializer):
 class PayoutMethodSerializer(CamelCaseSerializer):
     class Meta:
         model = PayoutMethod
-        fields = ["method", "payment_address"]
+        fields = ["method", "payment_address", "currency"]
+
+    def validate_currency(self, value):
+        return value.upper()
 
 
 class PromoterSerializer(CamelCaseSerializer):
@@ -91,6 +102,7 @@ class PromoterSerializer(CamelCaseSerializer):
             "referral_link",
             "active_payout_method",
             "current_balance",
+            "payable_balance",
             "total_earned",
             "total_paid",
             "created",
@@ -101,16 +113,88 @@ class PromoterSerializer(CamelCaseSerializer):
         )
 
     def get_commission_rate(self, obj):
-        active_program = ReferralProgram.get_active_referral_program()
-        return active_program.commission_rate
+        program = ReferralProgram.resolve(obj.program_id)
+        return program.commission_rate if program else None
 
 
 class PromoterPayoutsSerializer(CamelCaseSerializer):
     class Meta:
         model = PromoterPayout
-        fields = ["id", "created", "amount"]
+        fields = ["id", "created", "amount", "currency", "target_amount"]
 
 
 class MinWithdrawalBalanceSerializer(PromoterSerializer):
     class Meta(PromoterSerializer.Meta):
         fields = ['min_withdrawal_balance']
+
+
+class DateRangeSerializer(serializers.Serializer):
+    date_from = serializers.DateField(required=False)
+    date_to = serializers.DateField(required=False)
+
+    def validate(self, attrs):
+        date_from, date_to = attrs.get("date_from"), attrs.get("date_to")
+        if date_from and date_to and date_from > date_to:
+            raise serializers.ValidationError("date_from must be before or equal to date_to.")
+        return attrs
+
+
+class FunnelQuerySerializer(DateRangeSerializer):
+    group_by = serializers.ChoiceField(choices=["promoter", "invitation_method"], required=False)
+
+
+class ExportQuerySerializer(DateRangeSerializer):
+    dataset = serializers.ChoiceField(choices=ExportDatasetChoices.choices)
+    file_format = serializers.ChoiceField(choices=ExportFormatChoices.choices, default=ExportFormatChoices.CSV)
+    gzip = serializers.BooleanField(default=False)
+    status = serializers.ChoiceField(
+        choices=sorted(set(ReferralStateChoices.values) | set(PromoterCommissionStatusChoices.values)), required=False
+    )
+
+    dataset_status_choices = {
+        ExportDatasetChoices.COMMISSIONS: PromoterCommissionStatusChoices.values,
+        ExportDatasetChoices.REFERRALS: ReferralStateChoices.values,
+    }
+
+    def validate(self, attrs):
+        attrs = super().validate(attrs)
+        status, dataset = attrs.get("status"), attrs["dataset"]
+        if not status:
+            return attrs
+        if dataset not in self.dataset_status_choices:
+            raise serializers.ValidationError({"status": f"The {dataset} dataset can't be filtered by status."})
+        if status not in self.dataset_status_choices[dataset]:
+            raise serializers.ValidationError({"status": f'"{status}" is not a {dataset} status.'})
+        return attrs
+
+
+class BalancesAsOfQuerySerializer(serializers.Serializer):
+    date = serializers.DateField()
+
+
+class OnboardPromotersSerializer(serializers.Serializer):
+    user_ids = serializers.ListField(
+        child=serializers.IntegerField(min_value=1), allow_empty=False, max_length=10_000
+    )
+
+
+class ClickField(serializers.Field):
+    """A `[referral_token, timestamp, source]` array, where the timestamp and the source may be null or omitted."""
+
+    default_error_messages = {"invalid": "Expected a [referral_token, timestamp, source] array."}
+    timestamp_field = serializers.DateTimeField(allow_null=True)
+
+    def to_internal_value(self, data):
+        if not isinstance(data, (list, tuple)) or not 1 <= len(data) <= 3:
+            self.fail("invalid")
+        referral_token, timestamp, source = (*data, None, None)[:3]
+        if not isinstance(referral_token, str) or not referral_token or not isinstance(source, (str, type(None))):
+            self.fail("invalid")
+        return referral_token, self.timestamp_field.run_validation(timestamp), source
+
+    def to_representation(self, value):
+        return list(value)
+
+
+class IngestClicksSerializer(serializers.Serializer):
+    clicks = serializers.ListField(child=ClickField(), allow_empty=False, max_length=10_000)
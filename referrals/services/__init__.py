@@ -1,7 +1,35 @@
 __all__ = [
+    'balance_snapshot_service',
+    'batch_commission_service',
+    'bulk_action_service',
+    'click_ingestion_service',
+    'commission_maturation_service',
+    'commission_tier_service',
+    'funnel_analytics_service',
+    'fraud_service',
+    'fx_rate_service',
+    'outbox_service',
     'promoter_service',
+    'promoter_summary_service',
+    'referral_import_service',
     'referral_service',
+    'referral_token_service',
+    'referral_tree_service',
 ]
 
+from .balance_snapshot_service import balance_snapshot_service
+from .batch_commission_service import batch_commission_service
+from .bulk_action_service import bulk_action_service
+from .click_ingestion_service import click_ingestion_service
+from .commission_maturation_service import commission_maturation_service
+from .commission_tier_service import commission_tier_service
+from .funnel_analytics_service import funnel_analytics_service
+from .fraud_service import fraud_service
+from .fx_rate_service import fx_rate_service
+from .outbox_service import outbox_service
 from .promoter_service import promoter_service
+from .promoter_summary_service import promoter_summary_service
+from .referral_import_service import referral_import_service
 from .referral_service import referral_service
+from .referral_token_service import referral_token_service
+from .referral_tree_service import referral_tree_service
@@ -0,0 +1,109 @@
+import logging
+from datetime import date, datetime
+from typing import Optional, Sequence, Union
+
+import numpy as np
+import pandas as pd
+from django.db.models import Sum
+
+from referrals.models import PromoterBalanceSnapshot
+from referrals.repositories import promoter_balance_snapshot_repository, promoter_commission_repository, \
+    promoter_payout_repository, promoter_repository
+from referrals.utils import get_as_of_datetime
+
+logger = logging.getLogger(__name__)
+
+BALANCE_COLUMNS = ["promoter_id", "total_earned", "total_paid"]
+
+
+class BalanceSnapshotService:
+    """
+    Service class that maintains periodic `PromoterBalanceSnapshot` rows and answers point-in-time balance
+    queries from them.
+
+    A snapshot job writes a row for every promoter with ledger activity, built from the previous snapshot plus
+    the commissions and payouts created since then, so both the job and the lookups only scan one period of
+    the ledger.
+    """
+
+    @staticmethod
+    def _get_balances(as_of: datetime, since: Optional[datetime], **promoter_filters) -> pd.DataFrame:
+        period = {"created__lt": as_of}
+        if since:
+            period["created__gte"] = since
+
+        frames = [
+            pd.DataFrame.from_records(
+                list(promoter_balance_snapshot_repository.get_snapshot_totals(since, **promoter_filters))
+                if since else [],
+                columns=BALANCE_COLUMNS,
+            ),
+            pd.DataFrame.from_records(
+                list(promoter_commission_repository.filter(**period, **promoter_filters)
+                     .values("promoter_id").annotate(total=Sum("amount")).values_list("promoter_id", "total")),
+                columns=["promoter_id", "total_earned"],
+            ),
+            pd.DataFrame.from_records(
+                list(promoter_payout_repository.filter(**period, **promoter_filters)
+                     .values("promoter_id").annotate(total=Sum("amount")).values_list("promoter_id", "total")),
+                columns=["promoter_id", "total_paid"],
+            ),
+        ]
+        balances = pd.concat(frames, ignore_index=True).fillna(0)
+        balances = balances.groupby("promoter_id", as_index=False)[["total_earned", "total_paid"]].sum()
+        return balances.astype(np.int64)
+
+    def take_snapshots(self, moment: Union[date, datetime], chunk_size: int = 100_000) -> int:
+        """
+        Writes balance snapshots of all promoters at a point in time (a date means the end of that day).
+
+        Args:
+            moment (Union[date, datetime]): The point in time of the snapshot.
+            chunk_size (int): The number of promoter IDs processed per batch.
+
+        Returns:
+            int: The number of snapshot rows written.
+        """
+        as_of = get_as_of_datetime(moment)
+        since = promoter_balance_snapshot_repository.get_latest_as_of(as_of, inclusive=False)
+
+        written = 0
+        for id_from, id_to in promoter_repository.get_id_ranges(chunk_size):
+            balances = self._get_balances(as_of, since, promoter_id__gte=id_from, promoter_id__lt=id_to)
+            snapshots = [
+                PromoterBalanceSnapshot(promoter_id=promoter_id, as_of=as_of, total_earned=total_earned,
+                                        total_paid=total_paid)
+                for promoter_id, total_earned, total_paid in balances[BALANCE_COLUMNS].itertuples(index=False)
+            ]
+            promoter_balance_snapshot_repository.bulk_create(
+                snapshots,
+                update_conflicts=True,
+                unique_fields=["promoter", "as_of"],
+                update_fields=["total_earned", "total_paid"],
+            )
+            written += len(snapshots)
+
+        logger.info(f"Wrote {written} promoter balance snapshots as of {as_of}")
+        return written
+
+    def get_balances_as_of(self, moment: Union[date, datetime], promoter_ids: Sequence[int]) -> list[dict]:
+        """
+        Returns the balances of many promoters at a point in time (a date means the end of that day).
+
+        Args:
+            moment (Union[date, datetime]): The point in time.
+            promoter_ids (Sequence[int]): The promoters to return balances for.
+
+        Returns:
+            list[dict]: One row per promoter with `promoter_id`, `total_earned`, `total_paid` and `balance`.
+        """
+        as_of = get_as_of_datetime(moment)
+        since = promoter_balance_snapshot_repository.get_latest_as_of(as_of)
+
+        balances = self._get_balances(as_of, since, promoter_id__in=promoter_ids)
+        balances = balances.set_index("promoter_id").reindex(promoter_ids, fill_value=0).reset_index()
+        balances["balance"] = balances["total_earned"] - balances["total_paid"]
+        return balances.to_dict(orient="records")
+
+
+balance_snapshot_service = BalanceSnapshotService()
@@ -0,0 +1,182 @@
+import logging
+from decimal import Decimal
+from typing import Optional, Sequence, Union
+
+import numpy as np
+from django.db import transaction
+
+from referrals.config import config
+from referrals.models import PromoterCommission, Referral
+from referrals.repositories import promoter_commission_repository, promoter_repository, referral_tree_repository
+from referrals.services.fraud_service import fraud_service
+from referrals.services.fx_rate_service import fx_rate_service
+from referrals.services.outbox_service import outbox_service
+
+logger = logging.getLogger(__name__)
+
+ArrayLike = Union[Sequence[int], Sequence[Decimal], np.ndarray]
+
+# Commission rates are percentages with two decimal places, e.g. 12.34% is stored as 1234 basis points.
+RATE_SCALE = 100
+# amount_paid is in cents and the commission amount is in whole currency units:
+# commission = amount_paid / 100 * rate_bp / 100 / 100
+COMMISSION_DIVISOR = 100 * 100 * RATE_SCALE
+MAX_SAFE_PRODUCT = np.iinfo(np.int64).max
+# FX rates have eight decimal places, e.g. 1.08 is scaled to 108000000.
+FX_RATE_SCALE = 10 ** 8
+
+
+class BatchCommissionService:
+    """
+    Service class that computes commissions and refunds for many payments at once.
+
+    All arithmetic is done on int64 NumPy arrays with floor division, so the results are exact and
+    match `PromoterPayoutService.calculate_commission_amount` and `PromoterPayoutService.calculate_refund`.
+    """
+
+    @staticmethod
+    def to_rate_basis_points(commission_rates: ArrayLike) -> np.ndarray:
+        """
+        Converts commission rates given as percentages (e.g. Decimal("12.50")) to integer basis points.
+
+        Args:
+            commission_rates (ArrayLike): Commission rates as percentages with at most two decimal places.
+
+        Returns:
+            np.ndarray: An int64 array of basis points (12.50% -> 1250).
+        """
+        rates = np.asarray(commission_rates)
+        if np.issubdtype(rates.dtype, np.integer):
+            return rates.astype(np.int64) * RATE_SCALE
+        return np.rint(rates.astype(np.float64) * RATE_SCALE).astype(np.int64)
+
+    @staticmethod
+    def _multiply_checked(left: np.ndarray, right: np.ndarray) -> np.ndarray:
+        limit = int(np.abs(left).max(initial=0)) * int(np.abs(right).max(initial=0))
+        if limit > MAX_SAFE_PRODUCT:
+            raise ValueError("Amounts are too large to be multiplied exactly in int64.")
+        return left * right
+
+    def calculate_commission_amounts(self, amounts_paid: ArrayLike, commission_rates: ArrayLike) -> np.ndarray:
+        """
+        Calculates commission amounts for arrays of payments.
+
+        Args:
+            amounts_paid (ArrayLike): Amounts paid in cents.
+            commission_rates (ArrayLike): Commission rates as percentages, one per payment (or a single rate).
+
+        Returns:
+            np.ndarray: An int64 array of commission amounts.
+        """
+        amounts_paid = np.asarray(amounts_paid, dtype=np.int64)
+        rates_bp = np.broadcast_to(self.to_rate_basis_points(commission_rates), amounts_paid.shape)
+
+        return np.floor_divide(self._multiply_checked(amounts_paid, rates_bp), COMMISSION_DIVISOR)
+
+    def calculate_refund_amounts(self, commissions_paid: ArrayLike, amounts_refunded: ArrayLike,
+                                 amounts_paid: ArrayLike) -> np.ndarray:
+        """
+        Calculates pro-rata refund commission amounts for arrays of refunds.
+
+        Args:
+            commissions_paid (ArrayLike): The original commission amounts.
+            amounts_refunded (ArrayLike): The amounts refunded in cents.
+            amounts_paid (ArrayLike): The original amounts paid in cents.
+
+        Returns:
+            np.ndarray: An int64 array of (non-positive) refund commission amounts.
+        """
+        commissions_paid = np.asarray(commissions_paid, dtype=np.int64)
+        amounts_refunded = np.asarray(amounts_refunded, dtype=np.int64)
+        amounts_paid = np.asarray(amounts_paid, dtype=np.int64)
+        if (amounts_paid == 0).any():
+            raise ValueError("Amounts paid must not be zero.")
+
+        return -np.floor_divide(self._multiply_checked(commissions_paid, amounts_refunded), amounts_paid)
+
+    def convert_to_base(self, amounts: ArrayLike, currencies: Sequence[str]) -> np.ndarray:
+        """
+        Converts integer amounts to the base currency, rounded down like `FxRateService.to_base`.
+
+        Args:
+            amounts (ArrayLike): Integer amounts, e.g. payments in cents.
+            currencies (Sequence[str]): The currency of every amount.
+
+        Returns:
+            np.ndarray: An int64 array of amounts in the base currency.
+        """
+        amounts = np.asarray(amounts, dtype=np.int64)
+        scaled_rates = {
+            currency: int(fx_rate_service.get_rate(currency) * FX_RATE_SCALE) for currency in set(currencies)
+        }
+        rates = np.array([scaled_rates[currency] for currency in currencies], dtype=np.int64)
+
+        return np.floor_divide(self._multiply_checked(amounts, rates), FX_RATE_SCALE)
+
+    def create_commissions(self, referrals: Sequence[Referral], amounts_paid: ArrayLike,
+                           invoice_external_ids: Optional[Sequence[Optional[str]]] = None,
+                           currencies: Optional[Sequence[str]] = None) -> list[PromoterCommission]:
+        """
+        Creates commissions for many referral payments at once, e.g. for backfills.
+
+        Like `PromoterPayoutService.create_level_commissions`, every payment credits the direct promoter with the
+        referral's commission rate, or its volume tier rate if that is higher, and every upline promoter with its
+        level rate. The tier rates of all promoters and the upline of all referred users are read with one query
+        each.
+
+        Args:
+            referrals (Sequence[Referral]): The referrals that made the payments.
+            amounts_paid (ArrayLike): The amounts paid in cents, one per referral.
+            invoice_external_ids (Optional[Sequence[Optional[str]]]): Optional external invoice IDs.
+            currencies (Optional[Sequence[str]]): The currencies the payments were made in, the base currency by
+                default.
+
+        Returns:
+            list[PromoterCommission]: The created commissions, per payment the direct commission first.
+        """
+        tier_rates = promoter_repository.get_tier_commission_rates({referral.promoter_id for referral in referrals})
+        upline = referral_tree_repository.get_upline_level_rates_by_user({referral.user_id for referral in referrals})
+
+        # One row per commission: (payment index, promoter_id, level, commission_rate)
+        levels = []
+        for index, referral in enumerate(referrals):
+            levels.append((index, referral.promoter_id, 1,
+                           max(Decimal(referral.commission_rate), tier_rates.get(referral.promoter_id, 0))))
+            levels += [(index, *level_rate) for level_rate in upline.get(referral.user_id, [])]
+        payment_indexes = [index for index, _, _, _ in levels]
+
+        invoice_external_ids = invoice_external_ids or [None] * len(referrals)
+        currencies = currencies or [config.BASE_CURRENCY] * len(referrals)
+        level_currencies = [currencies[index] for index in payment_indexes]
+        level_amounts_paid = np.asarray(amounts_paid, dtype=np.int64)[payment_indexes]
+        commission_rates = [commission_rate for _, _, _, commission_rate in levels]
+
+        amounts = self.calculate_commission_amounts(level_amounts_paid, commission_rates)
+        # Like the single path, the payments are converted to the base currency before the commission is
+        # calculated, so the stored amounts are rounded down once.
+        base_amounts = self.calculate_commission_amounts(
+            self.convert_to_base(level_amounts_paid, level_currencies), commission_rates
+        )
+
+        commissions = [
+            PromoterCommission(
+                promoter_id=promoter_id,
+                referral=referrals[index],
+                amount=int(base_amount),
+                invoice_external_id=invoice_external_ids[index],
+                level=level,
+                currency=currency,
+                original_amount=int(amount),
+                status=fraud_service.get_commission_status(referrals[index]),
+            )
+            for (index, promoter_id, level, _), amount, base_amount, currency in zip(
+                levels, amounts, base_amounts, level_currencies
+            )
+        ]
+        with transaction.atomic():
+            created = promoter_commission_repository.bulk_create_with_pks(commissions)
+            outbox_service.record_commissions(created)
+        logger.info(f"Created {len(created)} commissions in batch")
+        return created
+
+batch_commission_service = BatchCommissionService()
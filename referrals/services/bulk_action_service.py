@@ -0,0 +1,112 @@
+import logging
+from typing import Optional
+
+from django.contrib.auth.models import User
+
+from referrals.choices import BulkActionChoices, BulkActionJobStatusChoices, FraudFlagReasonChoices
+from referrals.config import config
+from referrals.models import BulkActionJob
+from referrals.repositories import bulk_action_job_repository, promoter_commission_repository
+from referrals.repositories.base_repository import DEFAULT_BATCH_SIZE
+from referrals.services.fraud_service import fraud_service
+from referrals.services.promoter_payout_service import promoter_payout_service
+from referrals.services.promoter_service import promoter_service
+
+logger = logging.getLogger(__name__)
+
+
+class BulkActionService:
+    """
+    Service class for the admin bulk actions on promoters, commissions and referrals.
+
+    Every action changes its whole selection with set-based statements, one chunk of `DEFAULT_BATCH_SIZE`
+    rows at a time. Selections larger than `ADMIN_BULK_ACTION_SYNC_LIMIT` are saved as a `BulkActionJob` and
+    executed by the `run_bulk_action_jobs` command instead of the admin request. Saving an active referral
+    program queues a job as well, which propagates the program to its promoters.
+    """
+
+    @staticmethod
+    def _fail_commissions(commission_ids: list[int], failure_reason: str) -> int:
+        return sum(
+            promoter_commission_repository.mark_commissions_failed(
+                commission_ids[start:start + DEFAULT_BATCH_SIZE], failure_reason
+            )
+            for start in range(0, len(commission_ids), DEFAULT_BATCH_SIZE)
+        )
+
+    @staticmethod
+    def _retry_commissions(commission_ids: list[int]) -> int:
+        return sum(
+            promoter_commission_repository.retry_failed_commissions(commission_ids[start:start + DEFAULT_BATCH_SIZE])
+            for start in range(0, len(commission_ids), DEFAULT_BATCH_SIZE)
+        )
+
+    def run(self, action: str, object_ids: list[int], **params) -> int:
+        """
+        Runs a bulk action right away.
+
+        Args:
+            action (str): One of `BulkActionChoices` values.
+            object_ids (list[int]): The selected promoter, commission or referral IDs, or the IDs of the programs to
+                sync.
+            **params: The action parameters, `failure_reason` for failing commissions.
+
+        Returns:
+            int: The number of payouts created or commissions or referrals changed.
+        """
+        if action == BulkActionChoices.PAY_PROMOTERS:
+            return promoter_payout_service.pay_promoters(object_ids)
+        if action == BulkActionChoices.FAIL_COMMISSIONS:
+            return self._fail_commissions(object_ids, params["failure_reason"])
+        if action == BulkActionChoices.RETRY_COMMISSIONS:
+            return self._retry_commissions(object_ids)
+        if action == BulkActionChoices.SYNC_PROGRAM:
+            return sum(promoter_service.sync_program(program_id) for program_id in object_ids)
+        if action == BulkActionChoices.FLAG_REFERRALS:
+            return fraud_service.flag_referrals(object_ids, FraudFlagReasonChoices.MANUAL)
+        if action == BulkActionChoices.CLEAR_REFERRAL_FLAGS:
+            return fraud_service.clear_flags(object_ids)
+        raise ValueError(f"Unknown bulk action '{action}'")
+
+    def submit(self, action: str, object_ids: list[int], requested_by: Optional[User] = None,
+               **params) -> tuple[int, Optional[BulkActionJob]]:
+        """
+        Runs a bulk action, or queues it as a job if the selection is larger than `ADMIN_BULK_ACTION_SYNC_LIMIT`.
+
+        Returns:
+            tuple[int, Optional[BulkActionJob]]: The number of changed rows and None, or 0 and the queued job.
+        """
+        if len(object_ids) <= config.ADMIN_BULK_ACTION_SYNC_LIMIT:
+            return self.run(action, object_ids, **params), None
+
+        job = bulk_action_job_repository.create(
+            action=action, object_ids=object_ids, params=params, requested_by=requested_by
+        )
+        logger.info(f"Queued bulk action job {job.id} ({action}) for {len(object_ids)} objects")
+        return 0, job
+
+    def run_pending_jobs(self) -> int:
+        """
+        Runs the queued bulk action jobs until none are left.
+
+        Returns:
+            int: The number of jobs run.
+        """
+        jobs_run = 0
+        while job := bulk_action_job_repository.claim_next_pending():
+            try:
+                processed = self.run(job.action, job.object_ids, **job.params)
+            except Exception as e:
+                logger.exception(f"Bulk action job {job.id} failed")
+                bulk_action_job_repository.update_where(
+                    {"status": BulkActionJobStatusChoices.FAILED, "error": str(e)}, pk=job.id
+                )
+            else:
+                bulk_action_job_repository.update_where(
+                    {"status": BulkActionJobStatusChoices.DONE, "processed": processed}, pk=job.id
+                )
+            jobs_run += 1
+        return jobs_run
+
+
+bulk_action_service = BulkActionService()
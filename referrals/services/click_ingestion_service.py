@@ -0,0 +1,120 @@
+import logging
+import mmap
+import re
+from collections import Counter
+from datetime import datetime
+from itertools import islice
+from typing import Callable, Iterable, Iterator, Optional
+from urllib.parse import unquote_plus
+
+from django.db import transaction
+
+from referrals.repositories import promoter_repository
+from referrals.services.promoter_service import promoter_service
+
+logger = logging.getLogger(__name__)
+
+# (referral token, timestamp, source), the timestamp and source are optional.
+Click = tuple[str, Optional[datetime], Optional[str]]
+
+# Matches the query params written by `generate_referral_link` and the invitation emails.
+REF_PARAM_RE = re.compile(rb"[?&]ref=([^&\s\"#]+)")
+REF_SOURCE_PARAM_RE = re.compile(rb"[?&]ref-source=([^&\s\"#]+)")
+# The `[19/Oct/2026:10:00:00 +0000]` timestamp of the common and combined log formats.
+LOG_TIMESTAMP_RE = re.compile(rb"\[(\d{2}/\w{3}/\d{4}:\d{2}:\d{2}:\d{2} [+-]\d{4})\]")
+LOG_TIMESTAMP_FORMAT = "%d/%b/%Y:%H:%M:%S %z"
+
+
+class ClickIngestionService:
+    """
+    Service class that counts referral link clicks in bulk, e.g. from the access logs of an edge proxy or CDN.
+
+    Clicks are processed in chunks. Every chunk is reduced to one click count per distinct token, the tokens are
+    resolved with at most one query (signed tokens don't need the database) and the counts are added to
+    `Promoter.link_clicked` with one UPDATE per distinct count, instead of one UPDATE per click.
+    """
+
+    @staticmethod
+    def read_access_log(path: str, since: Optional[datetime] = None,
+                        until: Optional[datetime] = None) -> Iterator[Click]:
+        """
+        Lazily reads the referral link hits of an access log.
+
+        The file is memory-mapped and scanned line by line, so logs much larger than the available memory can be
+        read. Every line whose request URL has a `ref` query param is a click. Timestamps are only parsed when
+        the clicks are limited to the half-open range `[since, until)`, e.g. to skip the part of a log that was
+        imported before.
+
+        Args:
+            path (str): The path of the access log.
+            since (Optional[datetime]): Skip clicks logged before this moment.
+            until (Optional[datetime]): Skip clicks logged at or after this moment.
+        """
+        with open(path, "rb") as file:
+            try:
+                log = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+            except ValueError:
+                return  # empty files can't be mapped
+
+            with log:
+                for line in iter(log.readline, b""):
+                    ref = REF_PARAM_RE.search(line)
+                    if ref is None:
+                        continue
+
+                    timestamp = None
+                    if since or until:
+                        timestamp = _parse_log_timestamp(line)
+                        if timestamp is None or (since and timestamp < since) or (until and timestamp >= until):
+                            continue
+
+                    source = REF_SOURCE_PARAM_RE.search(line)
+                    yield (
+                        unquote_plus(ref.group(1).decode("latin-1")),
+                        timestamp,
+                        unquote_plus(source.group(1).decode("latin-1")) if source else None,
+                    )
+
+    def ingest(self, clicks: Iterable[Click], chunk_size: int = 50_000,
+               on_progress: Optional[Callable[[int, int], None]] = None) -> dict:
+        """
+        Adds the clicks to the link click counters of their promoters.
+
+        Args:
+            clicks (Iterable[Click]): The clicks, e.g. from `read_access_log`.
+            chunk_size (int): The number of clicks aggregated and written at a time.
+            on_progress (Optional[Callable[[int, int], None]]): Called after every chunk with the number of clicks
+                read and counted so far.
+
+        Returns:
+            dict: The number of clicks `received`, `counted` and `rejected` for an invalid token or an unknown
+            promoter.
+        """
+        clicks = iter(clicks)
+        received = counted = 0
+        while chunk := list(islice(clicks, chunk_size)):
+            clicks_by_token = Counter(token for token, _, _ in chunk)
+            promoter_ids = promoter_service.resolve_referral_tokens(clicks_by_token)
+
+            clicks_by_promoter = Counter()
+            for token, promoter_id in promoter_ids.items():
+                clicks_by_promoter[promoter_id] += clicks_by_token[token]
+            with transaction.atomic():
+                counted += promoter_repository.add_link_clicks(clicks_by_promoter)
+
+            received += len(chunk)
+            if on_progress:
+                on_progress(received, counted)
+
+        logger.info(f"Counted {counted} out of {received} referral link clicks")
+        return {"received": received, "counted": counted, "rejected": received - counted}
+
+
+def _parse_log_timestamp(line: bytes) -> Optional[datetime]:
+    match = LOG_TIMESTAMP_RE.search(line)
+    if match is None:
+        return None
+    return datetime.strptime(match.group(1).decode(), LOG_TIMESTAMP_FORMAT)
+
+
+click_ingestion_service = ClickIngestionService()
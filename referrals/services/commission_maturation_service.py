@@ -0,0 +1,72 @@
+import logging
+from datetime import datetime, timedelta
+from typing import Optional
+
+from django.db.models import Q
+from django.utils import timezone
+
+from referrals.models import ReferralProgram
+from referrals.repositories import promoter_commission_repository
+from referrals.repositories.base_repository import DEFAULT_BATCH_SIZE
+
+logger = logging.getLogger(__name__)
+
+
+class CommissionMaturationService:
+    """
+    Service class that moves commissions from pending to matured once the hold period of their promoter's
+    referral program is over. Only matured commissions count toward the payable balance, so refunds arriving within
+    the hold period are deducted before the commission is paid out.
+    """
+
+    @staticmethod
+    def get_maturity_cutoffs(now: Optional[datetime] = None) -> list[tuple[datetime, Optional[Q]]]:
+        """
+        Returns the moments before which pending commissions are due to mature, one per distinct hold period of
+        the active programs, with the condition selecting the promoters of those programs. The condition is None
+        when all programs hold commissions equally long.
+        """
+        now = now or timezone.now()
+        default_program = ReferralProgram.get_active_referral_program()
+        programs = list(ReferralProgram.objects.filter(is_active=True).values_list("id", "commission_hold_days"))
+        if len({hold_days for _, hold_days in programs}) <= 1:
+            hold_days = default_program.commission_hold_days if default_program else 0
+            return [(now - timedelta(days=hold_days), None)]
+
+        promoters_by_hold_days = {}
+        for program_id, hold_days in programs:
+            promoters = Q(promoter__program_id=program_id)
+            if program_id == default_program.id:
+                # Promoters without a program, or on a deactivated one, are on the default program.
+                promoters |= Q(promoter__program__isnull=True) | Q(promoter__program__is_active=False)
+            promoters_by_hold_days[hold_days] = promoters_by_hold_days.get(hold_days, Q()) | promoters
+        return [(now - timedelta(days=hold_days), promoters) for hold_days, promoters in promoters_by_hold_days.items()]
+
+    def mature_due_commissions(self, now: Optional[datetime] = None, chunk_size: int = DEFAULT_BATCH_SIZE) -> int:
+        """
+        Matures the pending commissions whose hold period, the one of their promoter's program, is over.
+
+        The due commissions are found on the (status, created) index and updated one chunk at a time, each
+        chunk with a single UPDATE, so a large backlog doesn't hold long locks. Matured rows leave the pending
+        set, so every chunk reads the index from its start again.
+
+        Args:
+            now (Optional[datetime]): The current time, `timezone.now()` by default.
+            chunk_size (int): The number of commissions updated per statement.
+
+        Returns:
+            int: The number of matured commissions.
+        """
+        matured = 0
+        for cutoff, promoters in self.get_maturity_cutoffs(now):
+            while commission_ids := promoter_commission_repository.get_due_pending_ids(cutoff, chunk_size, promoters):
+                matured += promoter_commission_repository.mark_commissions_matured(commission_ids)
+                if len(commission_ids) < chunk_size:
+                    break
+
+        if matured:
+            logger.info(f"Matured {matured} commissions")
+        return matured
+
+
+commission_maturation_service = CommissionMaturationService()
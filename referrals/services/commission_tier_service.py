@@ -0,0 +1,138 @@
+import logging
+from decimal import Decimal
+from typing import Iterable, Optional
+
+from django.db.models import Case, Count, DecimalField, F, IntegerField, OuterRef, Q, Subquery, Value, When
+from django.db.models.functions import Coalesce, Greatest
+from django.db.models.lookups import GreaterThanOrEqual
+
+from referrals.choices import ReferralStateChoices
+from referrals.models import Promoter, Referral, ReferralProgram, get_tier_rate
+from referrals.repositories import promoter_repository
+from referrals.repositories.base_repository import DEFAULT_BATCH_SIZE
+
+logger = logging.getLogger(__name__)
+
+Tiers = list[tuple[int, Decimal]]
+
+
+class CommissionTierService:
+    """
+    Service class that maintains the volume tier state of promoters.
+
+    Every promoter keeps a counter of its active referrals and the commission rate of the tier the counter
+    reaches. Both change with a single UPDATE when a referral becomes active or is refunded, with the new tier
+    computed in SQL from the cached tier definitions, so creating a commission reads the tier rate from the
+    promoter row instead of counting referrals.
+    """
+
+    @staticmethod
+    def get_tier_rate(tiers: Tiers, active_referrals: int) -> Optional[Decimal]:
+        """
+        Returns the rate of the highest tier reached with `active_referrals`, or None below the first tier.
+        """
+        return get_tier_rate(tiers, active_referrals)
+
+    @staticmethod
+    def _tier_rate_expression(tiers: Tiers, active_referrals) -> Case:
+        output_field = DecimalField(max_digits=5, decimal_places=2)
+        return Case(
+            *[
+                When(GreaterThanOrEqual(active_referrals, min_active_referrals),
+                     then=Value(commission_rate, output_field=output_field))
+                for min_active_referrals, commission_rate in reversed(tiers)
+            ],
+            default=Value(None, output_field=output_field),
+            output_field=output_field,
+        )
+
+    def get_commission_rate(self, referral: Referral) -> Decimal:
+        """
+        Returns the direct commission rate of a referral: the rate frozen on the referral, or the promoter's tier
+        rate if that is higher.
+        """
+        tier_commission_rate = referral.promoter.tier_commission_rate
+        if tier_commission_rate is None:
+            return referral.commission_rate
+        return max(Decimal(referral.commission_rate), tier_commission_rate)
+
+    def record_active_referral(self, promoter: Promoter, delta: int = 1) -> None:
+        """
+        Adds `delta` to a promoter's active referrals and moves it to the matching tier. Use a negative delta
+        when an active referral is refunded.
+
+        The tier is set by a second UPDATE that reads the new count: in a single UPDATE, MySQL would compute the
+        tier from the already incremented column, while other databases use the old value. Callers run both in
+        the transaction of the referral status change.
+        """
+        active_referrals = F("active_referrals_count") + delta
+        if delta < 0:
+            active_referrals = Greatest(active_referrals, Value(0))
+        promoter_repository.update_where({"active_referrals_count": active_referrals}, pk=promoter.pk)
+        promoter_repository.update_tier_commission_rates(
+            self._tier_rate_expression(ReferralProgram.get_tiers(promoter.program_id), F("active_referrals_count")),
+            Q(pk=promoter.pk),
+        )
+
+    def recompute(self, program_id: Optional[int] = None, recount: bool = False,
+                  chunk_size: int = DEFAULT_BATCH_SIZE, promoter_ids: Optional[Iterable[int]] = None) -> int:
+        """
+        Recomputes the tier rates of promoters, e.g. after the tier definitions changed, one range of
+        `chunk_size` promoter IDs at a time.
+
+        Args:
+            program_id (Optional[int]): Only recompute the promoters of this program, all promoters by default.
+            recount (bool): Count the active referrals again first, e.g. after referrals were imported in bulk.
+            chunk_size (int): The number of promoter IDs updated per statement.
+            promoter_ids (Optional[Iterable[int]]): Only recompute these promoters, e.g. the promoters of imported
+                referrals, instead of scanning every promoter ID range.
+
+        Returns:
+            int: The number of updated promoters.
+        """
+        default_program = ReferralProgram.get_active_referral_program()
+        program_ids = ReferralProgram.objects.filter(is_active=True).values_list("id", flat=True)
+        if program_id is not None:
+            program_ids = program_ids.filter(pk=program_id)
+
+        program_filters = []
+        for active_program_id in program_ids:
+            promoters = Q(program_id=active_program_id)
+            if default_program and active_program_id == default_program.id:
+                # Promoters without a program, or on a deactivated one, are on the default program.
+                promoters |= Q(program__isnull=True) | Q(program__is_active=False)
+            program_filters.append((ReferralProgram.get_tiers(active_program_id), promoters))
+        if default_program is None and program_id is None:
+            program_filters.append(([], Q(program__isnull=True) | Q(program__is_active=False)))
+
+        active_referrals = (
+            Referral.objects.filter(promoter_id=OuterRef("pk"), status=ReferralStateChoices.ACTIVE)
+            .order_by().values("promoter_id").annotate(total=Count("id")).values("total")
+        )
+        if promoter_ids is None:
+            chunk_filters = (
+                {"pk__gte": id_from, "pk__lt": id_to} for id_from, id_to in promoter_repository.get_id_ranges(chunk_size)
+            )
+        else:
+            promoter_ids = sorted(set(promoter_ids))
+            chunk_filters = (
+                {"pk__in": promoter_ids[start:start + chunk_size]} for start in range(0, len(promoter_ids), chunk_size)
+            )
+
+        updated = 0
+        for chunk_filter in chunk_filters:
+            if recount:
+                promoter_repository.update_where(
+                    {"active_referrals_count": Coalesce(Subquery(active_referrals, output_field=IntegerField()), 0)},
+                    **chunk_filter,
+                )
+            for tiers, promoters in program_filters:
+                updated += promoter_repository.update_tier_commission_rates(
+                    self._tier_rate_expression(tiers, F("active_referrals_count")), promoters, **chunk_filter,
+                )
+
+        logger.info(f"Recomputed the commission tiers of {updated} promoters")
+        return updated
+
+
+commission_tier_service = CommissionTierService()
@@ -0,0 +1,182 @@
+import csv
+import json
+import logging
+import zlib
+from datetime import date, datetime
+from decimal import Decimal
+from typing import Any, BinaryIO, Iterable, Iterator, Optional
+
+from referrals.choices import ExportDatasetChoices, ExportFormatChoices
+from referrals.db_router import get_read_db_alias
+from referrals.models import PromoterCommission, PromoterPayout, Referral
+from referrals.utils import get_date_range_filters
+
+logger = logging.getLogger(__name__)
+
+EXPORT_DATASETS = {
+    ExportDatasetChoices.COMMISSIONS: (
+        PromoterCommission,
+        ("id", "created", "updated", "promoter_id", "referral_id", "amount", "status", "failure_reason",
+         "invoice_external_id", "level", "currency", "original_amount"),
+    ),
+    ExportDatasetChoices.PAYOUTS: (
+        PromoterPayout,
+        ("id", "created", "updated", "promoter_id", "amount", "payout_method", "tx_signature", "currency",
+         "target_amount"),
+    ),
+    ExportDatasetChoices.REFERRALS: (
+        Referral,
+        ("id", "created", "updated", "user_id", "promoter_id", "invitation_method", "status", "commission_rate"),
+    ),
+}
+DATASETS_WITH_STATUS = (ExportDatasetChoices.COMMISSIONS, ExportDatasetChoices.REFERRALS)
+
+CONTENT_TYPES = {
+    ExportFormatChoices.CSV: "text/csv",
+    ExportFormatChoices.JSONL: "application/x-ndjson",
+}
+
+
+class _LineBuffer:
+    """File-like object for `csv.writer` that returns the written line instead of storing it."""
+
+    def write(self, value: str) -> str:
+        return value
+
+
+class ExportService:
+    """
+    Service class that streams accounting data (commissions, payouts and referrals) as CSV or JSONL.
+
+    Rows are read with `QuerySet.iterator(chunk_size=...)` which uses server-side cursors where the database
+    supports them, and are encoded one chunk at a time, so memory stays constant regardless of the export size.
+    Exports read from the read replica when one is configured.
+    """
+
+    @staticmethod
+    def get_rows(dataset: str,
+                 date_from: Optional[date] = None,
+                 date_to: Optional[date] = None,
+                 status: Optional[str] = None,
+                 chunk_size: int = 2000) -> Iterator[tuple]:
+        """
+        Iterates over the raw rows of a dataset ordered by primary key.
+
+        Args:
+            dataset (str): One of `EXPORT_DATASETS` keys.
+            date_from (Optional[date]): Only export rows created on or after this date.
+            date_to (Optional[date]): Only export rows created on or before this date.
+            status (Optional[str]): Only export rows with this status (commissions and referrals only).
+            chunk_size (int): The number of rows fetched from the database cursor at a time.
+
+        Returns:
+            Iterator[tuple]: Row value tuples in the order of the dataset fields.
+        """
+        model, fields = EXPORT_DATASETS[dataset]
+        # The rows are read lazily while the response streams, outside any `read_replica()` block.
+        query = model.objects.using(get_read_db_alias()).filter(
+            **get_date_range_filters("created", date_from, date_to)
+        )
+        if status:
+            if dataset not in DATASETS_WITH_STATUS:
+                raise ValueError(f"The {dataset} dataset can't be filtered by status.")
+            query = query.filter(status=status)
+
+        return query.order_by("id").values_list(*fields).iterator(chunk_size=chunk_size)
+
+    @staticmethod
+    def _format_value(value: Any) -> Any:
+        if isinstance(value, datetime):
+            return value.isoformat()
+        if isinstance(value, Decimal):
+            return str(value)
+        return value
+
+    def iter_csv(self, fields: Iterable[str], rows: Iterable[tuple], lines_per_chunk: int = 1000) -> Iterator[str]:
+        writer = csv.writer(_LineBuffer())
+        yield writer.writerow(fields)
+
+        lines = []
+        for row in rows:
+            lines.append(writer.writerow([self._format_value(value) for value in row]))
+            if len(lines) >= lines_per_chunk:
+                yield "".join(lines)
+                lines = []
+        if lines:
+            yield "".join(lines)
+
+    def iter_jsonl(self, fields: Iterable[str], rows: Iterable[tuple], lines_per_chunk: int = 1000) -> Iterator[str]:
+        fields = tuple(fields)
+        lines = []
+        for row in rows:
+            record = {field: self._format_value(value) for field, value in zip(fields, row)}
+            lines.append(json.dumps(record) + "\n")
+            if len(lines) >= lines_per_chunk:
+                yield "".join(lines)
+                lines = []
+        if lines:
+            yield "".join(lines)
+
+    @staticmethod
+    def _gzip(chunks: Iterable[bytes]) -> Iterator[bytes]:
+        compressor = zlib.compressobj(wbits=zlib.MAX_WBITS | 16)
+        for chunk in chunks:
+            compressed = compressor.compress(chunk)
+            if compressed:
+                yield compressed
+        yield compressor.flush()
+
+    def stream(self, dataset: str,
+               file_format: str = ExportFormatChoices.CSV,
+               compress: bool = False,
+               date_from: Optional[date] = None,
+               date_to: Optional[date] = None,
+               status: Optional[str] = None,
+               chunk_size: int = 2000) -> Iterator[bytes]:
+        """
+        Streams an encoded export of a dataset.
+
+        Args:
+            dataset (str): One of `EXPORT_DATASETS` keys.
+            file_format (str): One of `ExportFormatChoices` values.
+            compress (bool): Whether to gzip the output.
+            date_from (Optional[date]): Only export rows created on or after this date.
+            date_to (Optional[date]): Only export rows created on or before this date.
+            status (Optional[str]): Only export rows with this status.
+            chunk_size (int): The number of rows fetched from the database cursor at a time.
+
+        Returns:
+            Iterator[bytes]: Chunks of the encoded (and optionally gzipped) export.
+        """
+        _, fields = EXPORT_DATASETS[dataset]
+        rows = self.get_rows(dataset, date_from=date_from, date_to=date_to, status=status, chunk_size=chunk_size)
+        encoder = self.iter_csv if file_format == ExportFormatChoices.CSV else self.iter_jsonl
+
+        chunks = (chunk.encode() for chunk in encoder(fields, rows))
+        return self._gzip(chunks) if compress else chunks
+
+    def write_to_file(self, file: BinaryIO, dataset: str, **kwargs) -> int:
+        """
+        Writes an export of a dataset to a binary file object.
+
+        Args:
+            file (BinaryIO): The file object to write to.
+            dataset (str): One of `EXPORT_DATASETS` keys.
+            **kwargs: Additional keyword arguments to pass to `stream`.
+
+        Returns:
+            int: The number of bytes written.
+        """
+        written = 0
+        for chunk in self.stream(dataset, **kwargs):
+            file.write(chunk)
+            written += len(chunk)
+        logger.info(f"Exported {dataset} ({written} bytes)")
+        return written
+
+    @staticmethod
+    def get_filename(dataset: str, file_format: str, compress: bool) -> str:
+        return f"{dataset}.{file_format}" + (".gz" if compress else "")
+
+
+export_service = ExportService()
@@ -0,0 +1,211 @@
+import hashlib
+import hmac
+import logging
+from collections import Counter
+from datetime import datetime, timedelta
+from typing import Iterable, Optional
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from referrals.choices import FingerprintEventChoices, FingerprintKindChoices, FraudFlagReasonChoices, \
+    PromoterCommissionStatusChoices
+from referrals.config import config
+from referrals.models import Promoter, Referral, ReferralClickFingerprint, ReferralFingerprint
+from referrals.repositories import promoter_commission_repository, referral_click_fingerprint_repository, \
+    referral_fingerprint_repository, referral_repository
+from referrals.repositories.base_repository import DEFAULT_BATCH_SIZE
+from referrals.repositories.referral_fingerprint_repository import ACCOUNT_FINGERPRINT_KINDS
+
+logger = logging.getLogger(__name__)
+
+HASH_LENGTH = 32
+
+
+class FraudService:
+    """
+    Service class that detects self-referrals and duplicate accounts from IP address, device and payment
+    fingerprints.
+
+    Fingerprints are stored as keyed hashes in the `ReferralFingerprint` table, one row per promoter, user, event
+    and fingerprint. A signup or payment is checked with a single query on the (kind, value_hash) index against
+    the fingerprints of the promoter itself, including its clicks on its own link, and of the other users who
+    clicked the link or were referred by it, and a match flags the referral. Anonymous clicks are kept once per
+    promoter and fingerprint in `ReferralClickFingerprint`.
+    A nightly job (`detect_referral_fraud`) flags the accounts that share a fingerprint with several others.
+    The commissions of flagged referrals get the flagged status, so they are left out of the payable balance
+    without changing the balance queries. Everything is skipped unless `FRAUD_DETECTION_ENABLED` is set.
+    """
+
+    @staticmethod
+    def hash_fingerprint(kind: str, value: str) -> str:
+        """
+        Returns the keyed hash of a raw fingerprint, so IP addresses and payment fingerprints are never stored.
+        """
+        key = hashlib.sha256(f"referrals.fingerprint:{settings.SECRET_KEY}".encode()).digest()
+        digest = hmac.new(key, f"{kind}:{value.strip().lower()}".encode(), hashlib.sha256).hexdigest()
+        return digest[:HASH_LENGTH]
+
+    def hash_fingerprints(self, fingerprints: dict[str, Optional[str]]) -> dict[str, str]:
+        return {kind: self.hash_fingerprint(kind, value) for kind, value in fingerprints.items() if value}
+
+    @staticmethod
+    def _record(hashes: dict[str, str], event: str, promoter_id: int, user_id: int) -> None:
+        referral_fingerprint_repository.record(
+            ReferralFingerprint(kind=kind, value_hash=value_hash, event=event, promoter_id=promoter_id,
+                                user_id=user_id)
+            for kind, value_hash in hashes.items()
+        )
+
+    def record_promoter(self, promoter: Promoter, fingerprints: dict[str, Optional[str]]) -> None:
+        """
+        Records the fingerprints of a promoter's own requests, e.g. when it fetches its referral link.
+        """
+        if config.FRAUD_DETECTION_ENABLED:
+            self._record(self.hash_fingerprints(fingerprints), FingerprintEventChoices.PROMOTER, promoter.id,
+                         promoter.user_id)
+
+    def record_click(self, promoter_id: int, fingerprints: dict[str, Optional[str]],
+                     user_id: Optional[int] = None) -> None:
+        """
+        Records the fingerprints of a referral link click with a single INSERT, as fingerprints of the clicking
+        user if it is signed in, e.g. the promoter clicking its own link.
+        """
+        hashes = self.hash_fingerprints(fingerprints) if config.FRAUD_DETECTION_ENABLED else {}
+        if user_id is not None:
+            self._record(hashes, FingerprintEventChoices.CLICK, promoter_id, user_id)
+        else:
+            referral_click_fingerprint_repository.record(
+                ReferralClickFingerprint(kind=kind, value_hash=value_hash, promoter_id=promoter_id)
+                for kind, value_hash in hashes.items()
+            )
+
+    @staticmethod
+    def _get_match_reason(hashes: dict[str, str], promoter: Promoter, user_id: int) -> Optional[str]:
+        # Many people can share an IP address, so only device and payment fingerprints are matched.
+        account_hashes = {kind: value_hash for kind, value_hash in hashes.items()
+                          if kind in ACCOUNT_FINGERPRINT_KINDS}
+        if not account_hashes:
+            return None
+        matches = referral_fingerprint_repository.get_matches(account_hashes, promoter.id, promoter.user_id, user_id)
+        if any(match_user_id == promoter.user_id for _, match_user_id in matches):
+            return FraudFlagReasonChoices.SELF_REFERRAL
+        if matches:
+            return FraudFlagReasonChoices.DUPLICATE_ACCOUNT
+        return None
+
+    def screen_signup(self, promoter: Promoter, user_id: int,
+                      fingerprints: dict[str, Optional[str]]) -> Optional[str]:
+        """
+        Checks and records the fingerprints of a referred user's signup, before the referral is created.
+
+        A device or payment fingerprint of the promoter itself means a self-referral, one of another user who
+        clicked the promoter's link or was referred by it a duplicate account. IP addresses are recorded for the
+        review but are never enough on their own.
+
+        Returns:
+            Optional[str]: The `FraudFlagReasonChoices` value to flag the new referral with, or None.
+        """
+        hashes = self.hash_fingerprints(fingerprints) if config.FRAUD_DETECTION_ENABLED else {}
+        if not hashes:
+            return None
+
+        flag_reason = self._get_match_reason(hashes, promoter, user_id)
+        self._record(hashes, FingerprintEventChoices.SIGNUP, promoter.id, user_id)
+        if flag_reason:
+            logger.warning(f"Flagged the signup of user {user_id} referred by promoter {promoter.id}: {flag_reason}")
+        return flag_reason
+
+    def screen_payment(self, referral: Referral, payment_fingerprint: Optional[str]) -> Optional[str]:
+        """
+        Checks and records the payment fingerprint (e.g. the card fingerprint of the payment provider) of a
+        referred user, before its commissions are created, and flags the referral on a match.
+
+        Returns:
+            Optional[str]: The reason the referral was flagged for, or None.
+        """
+        hashes = self.hash_fingerprints({FingerprintKindChoices.PAYMENT: payment_fingerprint}) \
+            if config.FRAUD_DETECTION_ENABLED else {}
+        if not hashes:
+            return None
+
+        flag_reason = self._get_match_reason(hashes, referral.promoter, referral.user_id)
+        self._record(hashes, FingerprintEventChoices.PAYMENT, referral.promoter_id, referral.user_id)
+        if flag_reason and not referral.is_flagged:
+            self.flag_referrals([referral.id], flag_reason)
+            logger.warning(f"Flagged referral {referral.id} at payment: {flag_reason}")
+        return flag_reason
+
+    @staticmethod
+    def get_commission_status(referral: Referral) -> str:
+        """
+        The status new commissions of a referral are created with, flagged referrals earn flagged commissions.
+        """
+        if referral.is_flagged:
+            return PromoterCommissionStatusChoices.FLAGGED.value
+        return PromoterCommissionStatusChoices.PENDING.value
+
+    @transaction.atomic
+    def flag_referrals(self, referral_ids: Iterable[int],
+                       flag_reason: str = FraudFlagReasonChoices.MANUAL) -> int:
+        """
+        Flags referrals and holds back their unpaid commissions, one chunk of `DEFAULT_BATCH_SIZE` at a time.
+
+        Returns:
+            int: The number of newly flagged referrals.
+        """
+        referral_ids = list(referral_ids)
+        flagged = 0
+        for start in range(0, len(referral_ids), DEFAULT_BATCH_SIZE):
+            chunk = referral_ids[start:start + DEFAULT_BATCH_SIZE]
+            flagged += referral_repository.set_flagged(chunk, flag_reason)
+            promoter_commission_repository.flag_referral_commissions(chunk)
+        return flagged
+
+    @transaction.atomic
+    def clear_flags(self, referral_ids: Iterable[int]) -> int:
+        """
+        Clears the flags of referrals after a review, their commissions are paid out again.
+
+        Returns:
+            int: The number of cleared referrals.
+        """
+        referral_ids = list(referral_ids)
+        cleared = 0
+        for start in range(0, len(referral_ids), DEFAULT_BATCH_SIZE):
+            chunk = referral_ids[start:start + DEFAULT_BATCH_SIZE]
+            cleared += referral_repository.set_flagged(chunk)
+            promoter_commission_repository.unflag_referral_commissions(chunk)
+        return cleared
+
+    def flag_clusters(self, since: Optional[datetime] = None, days: int = 30,
+                      min_accounts: Optional[int] = None) -> dict:
+        """
+        Flags the referred users that share a device or payment fingerprint with other accounts, e.g. nightly.
+
+        Args:
+            since (Optional[datetime]): Only consider fingerprints recorded since, `days` ago by default.
+            days (int): The number of days of fingerprints considered.
+            min_accounts (Optional[int]): The number of accounts sharing a fingerprint that makes a cluster,
+                `FRAUD_CLUSTER_MIN_ACCOUNTS` by default.
+
+        Returns:
+            dict: The number of `clustered_accounts` and newly `flagged` referrals, and the `promoters` with
+            clustered referred users as `(promoter_id, clustered_accounts)` pairs, most suspicious first.
+        """
+        since = since or timezone.now() - timedelta(days=days)
+        min_accounts = min_accounts or config.FRAUD_CLUSTER_MIN_ACCOUNTS
+
+        accounts = referral_fingerprint_repository.get_clustered_accounts(since, min_accounts)
+        user_ids = {user_id for user_id, _ in accounts}
+        flagged = self.flag_referrals(
+            referral_repository.get_unflagged_ids_by_user_ids(user_ids), FraudFlagReasonChoices.FINGERPRINT_CLUSTER
+        )
+        promoters = Counter(promoter_id for _, promoter_id in accounts)
+
+        logger.info(f"Found {len(user_ids)} clustered accounts, flagged {flagged} referrals")
+        return {"clustered_accounts": len(user_ids), "flagged": flagged, "promoters": promoters.most_common()}
+
+
+fraud_service = FraudService()
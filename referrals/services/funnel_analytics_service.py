@@ -0,0 +1,101 @@
+import logging
+from datetime import date
+from typing import Optional
+
+import numpy as np
+import pandas as pd
+
+from referrals.repositories import promoter_repository, referral_repository
+
+logger = logging.getLogger(__name__)
+
+FUNNEL_COUNT_COLUMNS = ["clicks", "signups", "active", "refunded"]
+
+
+class FunnelAnalyticsService:
+    """
+    Service class that computes conversion funnels (clicks -> signups -> active -> refunded).
+
+    Counting is pushed down to the database as a single GROUP BY query, the conversion rates are then
+    computed in one vectorized pandas pass over the aggregated rows.
+    """
+
+    GROUP_BY_FIELDS = {
+        "promoter": "promoter_id",
+        "invitation_method": "invitation_method",
+    }
+
+    def get_funnel(self, group_by: Optional[str] = None,
+                   date_from: Optional[date] = None,
+                   date_to: Optional[date] = None,
+                   promoter_id: Optional[int] = None) -> list[dict]:
+        """
+        Computes funnel counts and conversion rates for referrals created in the given date range.
+
+        Args:
+            group_by (Optional[str]): One of `GROUP_BY_FIELDS` keys, or None for a single program-wide row.
+            date_from (Optional[date]): Only count referrals created on or after this date.
+            date_to (Optional[date]): Only count referrals created on or before this date.
+            promoter_id (Optional[int]): Restrict the funnel to a single promoter.
+
+        Returns:
+            list[dict]: One row per group with the funnel counts and the conversion rates.
+
+        Note:
+            `Promoter.link_clicked` is a lifetime counter, so clicks are not limited by the date range and are
+            only reported for the promoter and program-wide groupings.
+        """
+        group_field = self.GROUP_BY_FIELDS.get(group_by) if group_by else None
+        rows = referral_repository.get_funnel_counts(
+            group_field=group_field, date_from=date_from, date_to=date_to, promoter_id=promoter_id
+        )
+        df = pd.DataFrame.from_records(list(rows), columns=([group_field] if group_field else []) +
+                                                           ["signups", "active", "refunded"])
+        if group_field is None and df.empty:
+            df = pd.DataFrame([{"signups": 0, "active": 0, "refunded": 0}])
+
+        df["clicks"] = self._get_clicks(df, group_field, promoter_id)
+        df = self.compute_conversion_rates(df)
+
+        if group_field:
+            df = df.rename(columns={group_field: group_by})
+        return df.to_dict(orient="records")
+
+    @staticmethod
+    def _get_clicks(df: pd.DataFrame, group_field: Optional[str], promoter_id: Optional[int]) -> np.ndarray:
+        if group_field == "promoter_id":
+            clicks = dict(
+                promoter_repository.filter(pk__in=df["promoter_id"].tolist()).values_list("id", "link_clicked")
+            )
+            return df["promoter_id"].map(clicks).fillna(0).to_numpy(dtype=np.int64)
+        if group_field is None:
+            return np.full(len(df), promoter_repository.get_total_link_clicked(promoter_id), dtype=np.int64)
+        return np.zeros(len(df), dtype=np.int64)
+
+    @staticmethod
+    def compute_conversion_rates(df: pd.DataFrame) -> pd.DataFrame:
+        """
+        Adds conversion rate columns to a frame of aggregated funnel counts.
+
+        Every referral has passed the signup step and a refunded referral has been active before, so
+        `active` already includes refunded referrals. Division by zero yields a rate of 0.
+
+        Args:
+            df (pd.DataFrame): A frame with `clicks`, `signups`, `active` and `refunded` columns.
+
+        Returns:
+            pd.DataFrame: The same frame with `signup_rate`, `activation_rate` and `refund_rate` columns added.
+        """
+        counts = df[FUNNEL_COUNT_COLUMNS].to_numpy(dtype=np.float64).T
+        clicks, signups, active, refunded = counts
+
+        with np.errstate(divide="ignore", invalid="ignore"):
+            df["signup_rate"] = np.where(clicks > 0, signups / clicks, 0.0).round(4)
+            df["activation_rate"] = np.where(signups > 0, active / signups, 0.0).round(4)
+            df["refund_rate"] = np.where(active > 0, refunded / active, 0.0).round(4)
+
+        df[FUNNEL_COUNT_COLUMNS] = df[FUNNEL_COUNT_COLUMNS].astype(np.int64)
+        return df
+
+
+funnel_analytics_service = FunnelAnalyticsService()
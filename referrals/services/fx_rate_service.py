@@ -0,0 +1,124 @@
+import csv
+import json
+import logging
+import math
+import re
+import time
+from decimal import Decimal, InvalidOperation
+from typing import Optional
+
+from django.db import transaction
+
+from referrals.config import config
+from referrals.repositories import fx_rate_repository
+
+logger = logging.getLogger(__name__)
+
+CURRENCY_RE = re.compile(r"^[A-Z]{3}$")
+
+
+class FxRateService:
+    """
+    Service class that converts commission and payout amounts between currencies.
+
+    Amounts in the ledger are kept in `BASE_CURRENCY`, so balances can be summed regardless of the billing
+    currency. The rates come from the `FxRate` table, which is loaded from a local file or the command line with
+    the `load_fx_rates` command and read whole into an in-process cache for `FX_RATES_CACHE_SECONDS`. Converting
+    never fetches rates over the network, and a payout run reads the table at most once.
+    """
+
+    def __init__(self):
+        self._rates: Optional[dict[str, Decimal]] = None
+        self._loaded_at = 0.0
+
+    def get_rates(self) -> dict[str, Decimal]:
+        """
+        The cached value of one unit of every known currency in the base currency.
+        """
+        if self._rates is None or time.monotonic() - self._loaded_at >= config.FX_RATES_CACHE_SECONDS:
+            self._rates = fx_rate_repository.get_rates()
+            self._loaded_at = time.monotonic()
+        return self._rates
+
+    def invalidate(self) -> None:
+        """
+        Drops the cached rates of this process, other processes reload them after `FX_RATES_CACHE_SECONDS`.
+        """
+        self._rates = None
+
+    def get_rate(self, currency: str) -> Decimal:
+        """
+        Returns the value of one unit of `currency` in the base currency.
+
+        Raises:
+            ValueError: If no rate was loaded for the currency.
+        """
+        if currency == config.BASE_CURRENCY:
+            return Decimal(1)
+        try:
+            return self.get_rates()[currency]
+        except KeyError:
+            raise ValueError(f"No FX rate for currency '{currency}', load it with the load_fx_rates command.")
+
+    def is_supported(self, currency: str) -> bool:
+        return currency == config.BASE_CURRENCY or currency in self.get_rates()
+
+    def to_base(self, amount: int, currency: str) -> int:
+        """
+        Converts an integer amount in `currency`, e.g. a payment in cents, to the base currency, rounded down like
+        commission amounts.
+        """
+        return math.floor(Decimal(amount) * self.get_rate(currency))
+
+    def from_base(self, amount: int, currency: str) -> int:
+        """
+        Converts an integer amount in the base currency, e.g. a balance in cents, to `currency`, rounded down to
+        whole cents so that a payout never exceeds the balance it pays.
+        """
+        return math.floor(Decimal(amount) / self.get_rate(currency))
+
+    @transaction.atomic
+    def load_rates(self, rates: dict[str, Decimal]) -> int:
+        """
+        Validates and stores the rates of many currencies, replacing their previous rates.
+
+        Args:
+            rates (dict[str, Decimal]): The value of one unit of every currency in the base currency.
+
+        Returns:
+            int: The number of loaded rates.
+
+        Raises:
+            ValueError: If a currency code or rate is invalid.
+        """
+        cleaned = {}
+        for currency, rate in rates.items():
+            currency = currency.strip().upper()
+            if not CURRENCY_RE.match(currency):
+                raise ValueError(f"Invalid currency code '{currency}'")
+            try:
+                rate = Decimal(str(rate).strip())
+            except InvalidOperation:
+                raise ValueError(f"Invalid rate '{rate}' for currency '{currency}'")
+            if not rate.is_finite() or rate <= 0:
+                raise ValueError(f"Invalid rate '{rate}' for currency '{currency}'")
+            cleaned[currency] = rate
+
+        loaded = fx_rate_repository.upsert_rates(cleaned)
+        transaction.on_commit(self.invalidate)
+        self.invalidate()
+        logger.info(f"Loaded {loaded} FX rates")
+        return loaded
+
+    @staticmethod
+    def read_rates_file(path: str) -> dict[str, str]:
+        """
+        Reads rates from a JSON object (`{"EUR": "1.08"}`) or a CSV file with `currency` and `rate` columns.
+        """
+        with open(path, newline="") as file:
+            if path.endswith(".json"):
+                return json.load(file)
+            return {row["currency"]: row["rate"] for row in csv.DictReader(file)}
+
+
+fx_rate_service = FxRateService()
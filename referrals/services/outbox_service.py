@@ -0,0 +1,142 @@
+import logging
+from typing import Iterable, Optional
+
+from django.db import transaction
+
+from referrals.choices import OutboxEventTypeChoices, ReferralStateChoices
+from referrals.config import config
+from referrals.models import OutboxEvent, PromoterCommission, PromoterPayout, Referral
+from referrals.outbox_sinks import OutboxSink
+from referrals.repositories import outbox_event_repository
+
+logger = logging.getLogger(__name__)
+
+REFERRAL_EVENT_TYPES = {
+    ReferralStateChoices.SIGNUP: OutboxEventTypeChoices.REFERRAL_SIGNUP,
+    ReferralStateChoices.ACTIVE: OutboxEventTypeChoices.REFERRAL_ACTIVE,
+    ReferralStateChoices.REFUND: OutboxEventTypeChoices.REFERRAL_REFUND,
+}
+
+
+class OutboxService:
+    """
+    Service class for the transactional outbox of referral lifecycle events.
+
+    Write paths record events with the `record_*` methods in the transaction of their change, so an event
+    exists if and only if the change was committed. `relay` publishes the unpublished events in batches and
+    acknowledges a batch only after the sink accepted it. Recording is a no-op unless `OUTBOX_ENABLED` is set.
+
+    Events reference their aggregate by primary key, so bulk-created commissions and payouts are inserted with
+    `bulk_create_with_pks`, which sets the keys on databases that don't return them from a bulk INSERT (MySQL).
+    """
+
+    @staticmethod
+    def _record(events: list[OutboxEvent]) -> None:
+        if config.OUTBOX_ENABLED and events:
+            if any(event.aggregate_id is None for event in events):
+                raise ValueError("Outbox events need the primary key of their aggregate, insert it with "
+                                 "`bulk_create_with_pks`.")
+            outbox_event_repository.bulk_create(events)
+
+    def record_referral(self, referral: Referral) -> None:
+        """Records a `referral.<status>` event for a created referral or a referral status change."""
+        self.record_referrals([referral])
+
+    def record_referrals(self, referrals: Iterable[Referral]) -> None:
+        """Records the `referral.<status>` events of many referrals, e.g. of an import, with one INSERT."""
+        self._record([
+            OutboxEvent(
+                event_type=REFERRAL_EVENT_TYPES[referral.status],
+                aggregate_id=referral.id,
+                payload={
+                    "referral_id": referral.id,
+                    "user_id": referral.user_id,
+                    "promoter_id": referral.promoter_id,
+                    "status": referral.status,
+                    "invitation_method": referral.invitation_method,
+                },
+            )
+            for referral in referrals
+        ])
+
+    def record_commissions(self, commissions: Iterable[PromoterCommission]) -> None:
+        self._record([
+            OutboxEvent(
+                event_type=OutboxEventTypeChoices.COMMISSION_CREATED,
+                aggregate_id=commission.id,
+                payload={
+                    "commission_id": commission.id,
+                    "promoter_id": commission.promoter_id,
+                    "referral_id": commission.referral_id,
+                    "amount": commission.amount,
+                    "currency": commission.currency,
+                    "original_amount": commission.original_amount,
+                    "status": commission.status,
+                    "level": commission.level,
+                },
+            )
+            for commission in commissions
+        ])
+
+    def record_payouts(self, payouts: Iterable[PromoterPayout]) -> None:
+        self._record([
+            OutboxEvent(
+                event_type=OutboxEventTypeChoices.PAYOUT_CREATED,
+                aggregate_id=payout.id,
+                payload={
+                    "payout_id": payout.id,
+                    "promoter_id": payout.promoter_id,
+                    "amount": payout.amount,
+                    "payout_method": payout.payout_method,
+                    "currency": payout.currency,
+                    "target_amount": payout.target_amount,
+                },
+            )
+            for payout in payouts
+        ])
+
+    @staticmethod
+    def _serialize(event: OutboxEvent) -> dict:
+        return {
+            "id": event.id,
+            "type": event.event_type,
+            "aggregate_id": event.aggregate_id,
+            "created": event.created.isoformat(),
+            "payload": event.payload,
+        }
+
+    def relay(self, sink: OutboxSink, batch_size: int = 500, max_batches: Optional[int] = None) -> int:
+        """
+        Publishes the unpublished events to a sink in batches, oldest first.
+
+        Every batch is locked, published and acknowledged in one transaction. If the sink raises, the batch
+        stays unpublished and the error is propagated, so the next run retries it (at-least-once delivery).
+
+        Args:
+            sink (OutboxSink): The destination of the events.
+            batch_size (int): The number of events published and acknowledged at a time.
+            max_batches (Optional[int]): Stop after this many batches, all unpublished events by default.
+
+        Returns:
+            int: The number of published events.
+        """
+        published = batches = 0
+        while max_batches is None or batches < max_batches:
+            with transaction.atomic():
+                events = outbox_event_repository.get_unpublished_batch(batch_size)
+                if not events:
+                    break
+                sink.publish([self._serialize(event) for event in events])
+                outbox_event_repository.mark_published(event.id for event in events)
+
+            published += len(events)
+            batches += 1
+            if len(events) < batch_size:
+                break
+
+        if published:
+            logger.info(f"Published {published} outbox events in {batches} batches")
+        return published
+
+
+outbox_service = OutboxService()
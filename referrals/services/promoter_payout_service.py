@@ -4,14 +4,23 @@ from decimal import Decimal
 from typing import Optional
 
 import pandas as pd
-from pydantic import BaseModel
+from django.db import transaction
+from pydantic import BaseModel, Field
 
 from referrals.choices import PromoterCommissionStatusChoices
+from referrals.config import config
 from referrals.exceptions import ViewException
 from referrals.helpers import parse_df_to_csv_string_without_index_col
-from referrals.models import Promoter, PromoterPayout, PromoterCommission, Referral
+from referrals.instrumentation import instrument
+from referrals.models import Promoter, PromoterCommission, Referral
 from referrals.repositories import promoter_repository, promoter_payout_repository, promoter_commission_repository, \
-    referral_repository
+    referral_repository, referral_tree_repository
+from referrals.repositories.base_repository import DEFAULT_BATCH_SIZE
+from referrals.services.commission_maturation_service import commission_maturation_service
+from referrals.services.commission_tier_service import commission_tier_service
+from referrals.services.fraud_service import fraud_service
+from referrals.services.fx_rate_service import fx_rate_service
+from referrals.services.outbox_service import outbox_service
 
 logger = logging.getLogger(__name__)
 
@@ -20,64 +29,143 @@ class PromoterPayoutDataRow(BaseModel):
     name: str
     recipientEmail: str
     amount: float
-    sourceCurrency: str = "USD"
-    targetCurrency: str = "USD"
+    sourceCurrency: str = Field(default_factory=lambda: config.BASE_CURRENCY)
+    targetCurrency: str = Field(default_factory=lambda: config.BASE_CURRENCY)
     amountCurrency: str = "target"
     type: str = "EMAIL"
 
 
 class PromoterPayoutService:
-    def send_wise_csv_for_promoters_payouts(self, **kwargs) -> Optional[str]:
+    @instrument
+    def send_wise_csv_for_promoters_payouts(self, chunk_size: int = DEFAULT_BATCH_SIZE, **kwargs) -> Optional[str]:
         """
         Generates a CSV file for Wise payouts and processes payouts for eligible promoters.
 
         This method retrieves all promoters eligible for Wise payouts, generates the necessary
-        payout data, and creates payouts for those promoters whose current balance meets or exceeds
+        payout data, and creates payouts for those promoters whose payable balance meets or exceeds
         the minimum withdrawal balance. The resulting data is converted into a CSV format string.
 
+        Commissions whose hold period is over are matured first; pending commissions are not paid out.
+        Promoters are read in chunks with their balances annotated, and the payouts and paid commissions
+        of every chunk are written with one batched INSERT and one UPDATE in a transaction.
+
+        Balances are in the base currency and are converted to the currency of every promoter's payout method
+        with the cached FX rates, which are read at most once per run. Promoters paid in a currency without a
+        rate are skipped and logged, so they are paid by the next run after the rate is loaded.
+
         Args:
-            **kwargs: Additional keyword arguments to pass to the `PromoterPayoutDataRow`.
+            chunk_size (int): The number of promoters processed per batch.
+            **kwargs: Additional keyword arguments to pass to the `PromoterPayoutDataRow`. The amount and the
+                target currency are always set from the promoter's payout method.
 
         Returns:
             Optional[str]: A CSV formatted string containing payout data, or None if no data is available.
         """
-        promoters = promoter_repository.get_wise_payout_promoters()
+        commission_maturation_service.mature_due_commissions()
+        promoters = promoter_repository.get_wise_payout_promoters_with_balance()
 
         data = []
-        for promoter in promoters:
-            if promoter.current_balance > 0 and promoter.current_balance >= promoter.min_withdrawal_balance:
-                payout_data_row = PromoterPayoutDataRow(
-                    name=promoter.user.get_full_name(),
-                    recipientEmail=promoter.active_payout_method.payment_address,
-                    amount=promoter.current_balance,
-                    **kwargs,
-                )
-
-                data.append(payout_data_row.model_dump())
-                promoter_payout_repository.create_payout(
-                    promoter, promoter.current_balance, payout_method='wise'
-                )
-                promoter_commission_repository.mark_commission_paid(promoter)
+        for chunk in promoter_repository.iter_chunks(chunk_size, queryset=promoters):
+            payouts = []
+            for promoter in chunk:
+                if promoter.payable_balance > 0 and promoter.payable_balance >= promoter.min_withdrawal_balance:
+                    currency = promoter.active_payout_method.currency
+                    if not fx_rate_service.is_supported(currency):
+                        logger.error(f"Skipped the payout of promoter {promoter.id}, no FX rate for {currency}")
+                        continue
+                    target_amount = fx_rate_service.from_base(promoter.payable_balance, currency)
+                    payout_data_row = PromoterPayoutDataRow(**{
+                        **kwargs,
+                        "name": promoter.user.get_full_name(),
+                        "recipientEmail": promoter.active_payout_method.payment_address,
+                        "amount": target_amount,
+                        "targetCurrency": currency,
+                    })
+
+                    data.append(payout_data_row.model_dump())
+                    payouts.append((promoter.id, promoter.payable_balance, currency, target_amount))
+
+            if payouts:
+                with transaction.atomic():
+                    outbox_service.record_payouts(
+                        promoter_payout_repository.create_payouts(payouts, payout_method='wise')
+                    )
+                    promoter_commission_repository.mark_commissions_paid([payout[0] for payout in payouts])
         if data:
             df = pd.DataFrame(data)
             return parse_df_to_csv_string_without_index_col(df)
 
+    @instrument
+    def pay_promoters(self, promoter_ids: list[int], chunk_size: int = DEFAULT_BATCH_SIZE) -> int:
+        """
+        Pays out the payable balance of the given promoters, e.g. for a manual payout run from the admin.
+
+        Every chunk reads the balances of its promoters with one annotated query, then creates the payouts with
+        one batched INSERT per payout method and marks the commissions paid with one UPDATE, in a transaction.
+        Promoters without a positive balance are skipped, and promoters without an active payout method are
+        paid with the "manual" method in the base currency. Balances are converted to the currency of the
+        payout method with the cached FX rates, and promoters paid in a currency without a rate are skipped.
+
+        Args:
+            promoter_ids (list[int]): The promoters to pay.
+            chunk_size (int): The number of promoters processed per batch.
+
+        Returns:
+            int: The number of payouts created.
+        """
+        commission_maturation_service.mature_due_commissions()
+
+        paid = 0
+        for start in range(0, len(promoter_ids), chunk_size):
+            balances = (
+                promoter_repository.annotate_balances(promoter_repository.filter(
+                    pk__in=promoter_ids[start:start + chunk_size]))
+                .filter(payable_balance__gt=0)
+                .values_list("id", "payable_balance", "active_payout_method__method", "active_payout_method__currency")
+            )
+            payouts_by_method = {}
+            for promoter_id, balance, payout_method, currency in balances:
+                currency = currency or config.BASE_CURRENCY
+                if not fx_rate_service.is_supported(currency):
+                    logger.error(f"Skipped the payout of promoter {promoter_id}, no FX rate for {currency}")
+                    continue
+                payouts_by_method.setdefault(payout_method or "manual", []).append(
+                    (promoter_id, balance, currency, fx_rate_service.from_base(balance, currency))
+                )
+            if not payouts_by_method:
+                continue
+
+            with transaction.atomic():
+                for payout_method, payouts in payouts_by_method.items():
+                    outbox_service.record_payouts(
+                        promoter_payout_repository.create_payouts(payouts, payout_method=payout_method)
+                    )
+                    promoter_commission_repository.mark_commissions_paid([payout[0] for payout in payouts])
+                    paid += len(payouts)
+
+        logger.info(f"Paid out {paid} of {len(promoter_ids)} selected promoters")
+        return paid
+
+    @instrument
     def calculate_commission(self, user_id: int,
                              amount_paid: int,
-                             invoice_external_id: Optional[int] = None) -> Optional[PromoterCommission]:
+                             invoice_external_id: Optional[int] = None,
+                             currency: Optional[str] = None) -> Optional[PromoterCommission]:
         """
         Calculates and creates a commission for a promoter based on the referral's payment.
 
         This method checks if a commission has already been received for the given referral.
-        If not, it calculates the commission amount and creates a new `PromoterCommission` entry.
+        If not, it calculates the commission amounts and creates `PromoterCommission` entries for the
+        direct promoter and the upline promoters, see `create_level_commissions`.
 
         Args:
             user_id (int): The ID of the user who made the payment.
             amount_paid (int): The amount paid by the user in cents.
             invoice_external_id (Optional[int]): An optional external invoice ID.
+            currency (Optional[str]): The currency of the payment, the base currency by default.
 
         Returns:
-            Optional[PromoterCommission]: The created commission, or None if no commission was created.
+            Optional[PromoterCommission]: The direct promoter's commission, or None if no commission was created.
         """
         referral = referral_repository.get_referral_by_user_id(user_id)
         if not referral:
@@ -90,16 +178,19 @@ class PromoterPayoutService:
             logger.info(f"Referrer {referral.promoter_id} already received commission from referral {referral.id}")
             return
 
-        commission = self.create_commission(referral, amount_paid, invoice_external_id)
-        if commission:
+        commissions = self.create_level_commissions(referral, amount_paid, invoice_external_id, currency)
+        for commission in commissions:
             logger.info(
-                f"Commission {commission.id} created for promoter {referral.promoter_id} from referral {referral.id}"
+                f"Level {commission.level} commission {commission.id} created for promoter {commission.promoter_id} "
+                f"from referral {referral.id}"
             )
-        return commission
+        return commissions[0]
 
+    @instrument
     def create_commission(self, referral: Referral,
                           amount_paid: int,
-                          invoice_external_id: Optional[int] = None) -> Optional[PromoterCommission]:
+                          invoice_external_id: Optional[int] = None,
+                          currency: Optional[str] = None) -> Optional[PromoterCommission]:
         """
         Creates a new commission entry for a promoter based on a referral's payment.
 
@@ -107,42 +198,103 @@ class PromoterPayoutService:
             referral (Referral): The referral for which the commission is being created.
             amount_paid (int): The amount paid by the user in cents.
             invoice_external_id (Optional[int]): An optional external invoice ID.
+            currency (Optional[str]): The currency of the payment, the base currency by default.
 
         Returns:
             Optional[PromoterCommission]: The created commission, or None if no commission was created.
         """
-        commission_amount = self.calculate_commission_amount(amount_paid, referral.commission_rate)
+        currency = currency or config.BASE_CURRENCY
+        commission_rate = commission_tier_service.get_commission_rate(referral)
+        commission_amount = self.calculate_commission_amount(amount_paid, commission_rate)
 
         commission = PromoterCommission(
             promoter=referral.promoter,
             referral=referral,
-            amount=commission_amount,
+            amount=self.calculate_commission_amount(fx_rate_service.to_base(amount_paid, currency), commission_rate),
             invoice_external_id=invoice_external_id,
+            currency=currency,
+            original_amount=commission_amount,
+            status=fraud_service.get_commission_status(referral),
         )
         commission.save()
         return commission
 
+    @instrument
+    @transaction.atomic
+    def create_level_commissions(self, referral: Referral,
+                                 amount_paid: int,
+                                 invoice_external_id: Optional[int] = None,
+                                 currency: Optional[str] = None) -> list[PromoterCommission]:
+        """
+        Creates the commissions of the direct promoter and of every upline promoter for a referral's payment.
+
+        The direct promoter earns the referral's commission rate, or its volume tier rate if that is higher.
+        The upline promoters and their per-level rates of the active program are read from the referral tree
+        in a single query, and all commissions are inserted together with `bulk_create_with_pks`.
+
+        The payment is converted to the base currency in cents before the commission is calculated, so the
+        stored amount is rounded down once. The commission in the currency of the payment is kept on every
+        commission as its original amount, with the currency. The commissions of a flagged referral are created
+        as flagged and are not paid out until the flag is cleared.
+
+        Args:
+            referral (Referral): The referral for which the commissions are being created.
+            amount_paid (int): The amount paid by the user in cents.
+            invoice_external_id (Optional[int]): An optional external invoice ID.
+            currency (Optional[str]): The currency of the payment, the base currency by default.
+
+        Returns:
+            list[PromoterCommission]: The created commissions ordered by level, the direct commission first.
+        """
+        levels = [(referral.promoter_id, 1, commission_tier_service.get_commission_rate(referral))]
+        levels += referral_tree_repository.get_upline_level_rates(referral.user_id)
+
+        currency = currency or config.BASE_CURRENCY
+        base_amount_paid = fx_rate_service.to_base(amount_paid, currency)
+        commission_status = fraud_service.get_commission_status(referral)
+        commissions = []
+        for promoter_id, level, commission_rate in levels:
+            commission_amount = self.calculate_commission_amount(amount_paid, commission_rate)
+            commissions.append(PromoterCommission(
+                promoter_id=promoter_id,
+                referral=referral,
+                amount=self.calculate_commission_amount(base_amount_paid, commission_rate),
+                invoice_external_id=invoice_external_id,
+                level=level,
+                currency=currency,
+                original_amount=commission_amount,
+                status=commission_status,
+            ))
+        commissions = promoter_commission_repository.bulk_create_with_pks(commissions)
+        outbox_service.record_commissions(commissions)
+        return commissions
+
     @staticmethod
-    def calculate_commission_amount(amount_paid: int, referral_commission_rate: Decimal) -> float:
+    def calculate_commission_amount(amount_paid: int, referral_commission_rate: Decimal) -> int:
         """
         Calculates the commission amount based on the payment amount and referral commission rate.
 
+        The price is converted to `Decimal` directly from the integer amount in cents, so the result
+        is not affected by float rounding. See `BatchCommissionService` for the vectorized version.
+
         Args:
             amount_paid (int): The amount paid by the user in cents.
             referral_commission_rate (Decimal): The commission rate associated with the referral.
 
         Returns:
-            float: The calculated commission amount.
+            int: The calculated commission amount.
         """
-        commission_rate = referral_commission_rate / 100
-        price = amount_paid / 100
+        commission_rate = Decimal(referral_commission_rate) / 100
+        price = Decimal(amount_paid) / 100
 
         return math.floor(Decimal(price) * commission_rate)
 
     @staticmethod
+    @instrument
+    @transaction.atomic
     def create_payout(promoter: Promoter, amount: float, payout_method: str):
         """
-        Creates a payout record for a promoter and marks their pending commissions as paid.
+        Creates a payout record for a promoter and marks their matured and failed commissions as paid.
 
         Args:
             promoter (Promoter): The promoter receiving the payout.
@@ -152,19 +304,21 @@ class PromoterPayoutService:
         Returns:
             None
         """
-        PromoterPayout.objects.create(
-            promoter=promoter,
-            amount=amount,
-            payout_method=payout_method,
-        )
-        PromoterCommission.objects.filter(promoter=promoter, status="pending").update(status="paid")
+        payout = promoter_payout_repository.create_payout(promoter, amount, payout_method=payout_method)
+        promoter_commission_repository.mark_commission_paid(promoter)
+        outbox_service.record_payouts([payout])
 
     @staticmethod
+    @instrument
+    @transaction.atomic
     def calculate_refund(referral: Referral, amount_refunded: int, amount_paid: int,
                          invoice_external_id: Optional[int] = None) -> PromoterCommission:
         """
         Calculates the refund amount for a promoter's commission and creates a refund record.
 
+        The commissions of upline promoters on the same referral are refunded in the same proportion, in the
+        currency of the original commissions. Refunds of flagged commissions are flagged as well.
+
         Args:
             referral (Referral): The referral associated with the refund.
             amount_refunded (int): The amount refunded in cents.
@@ -172,30 +326,41 @@ class PromoterPayoutService:
             invoice_external_id (Optional[int]): An optional external invoice ID.
 
         Returns:
-            PromoterCommission: The created refund commission entry.
+            PromoterCommission: The created refund commission entry of the direct promoter.
 
         Raises:
             ViewException: If no positive commission is found for the referral.
         """
-        referral_commission = promoter_commission_repository.get_referral_positive_commission(referral)
-        if not referral_commission:
+        referral_commissions = promoter_commission_repository.get_referral_positive_commissions(referral)
+        if not referral_commissions or referral_commissions[0].level != 1:
             raise ViewException(
                 f"No commission found for referral with id {referral.id}.",
                 status_code=404
             )
 
-        commission_paid = referral_commission.amount
-        commission_refund_amount = -math.floor(commission_paid * amount_refunded / amount_paid)
-
-        commission = PromoterCommission(
-            promoter=referral.promoter,
-            referral=referral,
-            amount=commission_refund_amount,
-            status=PromoterCommissionStatusChoices.REFUND,
-            invoice_external_id=invoice_external_id,
-        )
-        commission.save()
-        return commission
+        refunds = [
+            PromoterCommission(
+                promoter_id=referral_commission.promoter_id,
+                referral=referral,
+                amount=-(referral_commission.amount * amount_refunded // amount_paid),
+                status=(
+                    PromoterCommissionStatusChoices.FLAGGED
+                    if referral_commission.status == PromoterCommissionStatusChoices.FLAGGED
+                    else PromoterCommissionStatusChoices.REFUND
+                ),
+                invoice_external_id=invoice_external_id,
+                level=referral_commission.level,
+                currency=referral_commission.currency,
+                original_amount=(
+                    None if referral_commission.original_amount is None
+                    else -(referral_commission.original_amount * amount_refunded // amount_paid)
+                ),
+            )
+            for referral_commission in referral_commissions
+        ]
+        refunds = promoter_commission_repository.bulk_create_with_pks(refunds)
+        outbox_service.record_commissions(refunds)
+        return refunds[0]
 
 
 promoter_payout_service = PromoterPayoutService()
@@ -1,11 +1,19 @@
 import logging
+from itertools import islice
+from typing import Callable, Iterable, Optional, Union
 
 from django.contrib.auth.models import User
+from django.db import transaction
+from django.db.models import QuerySet
 
 from referrals.config import config
-from referrals.models import Promoter
+from referrals.db_router import use_primary
+from referrals.models import Promoter, ReferralProgram
+from referrals.repositories.base_repository import DEFAULT_BATCH_SIZE
 from referrals.repositories.promoter_repository import promoter_repository
+from referrals.services.commission_tier_service import commission_tier_service
 from referrals.services.referral_service import referral_service
+from referrals.services.referral_token_service import referral_token_service
 
 logger = logging.getLogger(__name__)
 
@@ -15,21 +23,165 @@ class PromoterService:
     Service class for managing Promoter-related operations.
     """
 
+    @transaction.atomic
     def create_new_promoter(self, user: User) -> Promoter:
-        referral_token = referral_service.generate_referral_token(user_id=user.id)
-        referral_link = referral_service.generate_referral_link(base_referral_link=config.BASE_REFERRAL_LINK,
-                                                                referral_token=referral_token)
-
-        promoter = Promoter(
-            user=user,
-            referral_token=referral_token,
-            referral_link=referral_link,
-        )
+        promoter = Promoter(user=user)
         promoter.save()
+
+        # The signed token carries the promoter ID, so it can only be issued once the promoter is saved.
+        self.set_signed_referral_token(promoter)
+        promoter.save(update_fields=["referral_token", "referral_link", "updated"])
         logger.info(f"Created new promoter {user.email}")
 
         return promoter
 
+    @staticmethod
+    def set_signed_referral_token(promoter: Promoter) -> None:
+        """
+        Issues a signed referral token and link for a saved promoter, keeping an unsigned token as legacy token.
+        """
+        if promoter.referral_token and not referral_token_service.is_signed_token(promoter.referral_token):
+            promoter.legacy_referral_token = promoter.legacy_referral_token or promoter.referral_token
+        promoter.referral_token = referral_token_service.sign(promoter.id)
+        promoter.referral_link = referral_service.generate_referral_link(
+            base_referral_link=config.BASE_REFERRAL_LINK, referral_token=promoter.referral_token
+        )
+
+    @staticmethod
+    def resolve_referral_token(referral_token: Optional[str]) -> Optional[int]:
+        """
+        Returns the ID of the promoter a referral token belongs to.
+
+        Signed tokens are verified without a database query, so forged tokens never reach the database.
+        Legacy unsigned tokens are looked up while `ACCEPT_LEGACY_REFERRAL_TOKENS` is enabled.
+
+        Args:
+            referral_token (Optional[str]): The referral token from a referral link.
+
+        Returns:
+            Optional[int]: The promoter ID, or None if the token is invalid.
+        """
+        if not referral_token:
+            return None
+        if referral_token_service.is_signed_token(referral_token):
+            return referral_token_service.verify(referral_token)
+        if not config.ACCEPT_LEGACY_REFERRAL_TOKENS:
+            return None
+        return promoter_repository.get_id_by_legacy_referral_token(referral_token)
+
+    @staticmethod
+    def resolve_referral_tokens(referral_tokens: Iterable[str]) -> dict[str, int]:
+        """
+        Batch version of `resolve_referral_token`: signed tokens are verified in memory and all legacy tokens
+        are looked up with one query.
+
+        Returns:
+            dict[str, int]: Promoter IDs by token. Invalid tokens are left out.
+        """
+        promoter_ids, legacy_tokens = {}, set()
+        for token in set(referral_tokens):
+            if not token:
+                continue
+            if referral_token_service.is_signed_token(token):
+                promoter_id = referral_token_service.verify(token)
+                if promoter_id is not None:
+                    promoter_ids[token] = promoter_id
+            else:
+                legacy_tokens.add(token)
+
+        if legacy_tokens and config.ACCEPT_LEGACY_REFERRAL_TOKENS:
+            promoter_ids.update(promoter_repository.get_ids_by_legacy_referral_tokens(legacy_tokens))
+        return promoter_ids
+
+    def onboard_promoters(self, users: Union[QuerySet[User], Iterable[int]], chunk_size: int = DEFAULT_BATCH_SIZE,
+                          on_progress: Optional[Callable[[int, int], None]] = None) -> int:
+        """
+        Enrolls many existing users as promoters, skipping users that already are promoters.
+
+        The active program is read once, and every chunk of users costs a constant number of queries: one
+        to select the users without a promoter, a conflict-skipping bulk INSERT, one to read back the created
+        promoters and a bulk UPDATE of their signed referral tokens and links.
+
+        Args:
+            users (Union[QuerySet[User], Iterable[int]]): A user queryset or user IDs. Unknown IDs are skipped.
+            chunk_size (int): The number of users onboarded per transaction.
+            on_progress (Optional[Callable[[int, int], None]]): Called after every chunk with the number of users
+                processed and promoters created so far.
+
+        Returns:
+            int: The number of promoters created.
+        """
+        active_program = ReferralProgram.get_active_referral_program()
+        min_withdrawal_balance = (
+            active_program.min_withdrawal_balance if active_program
+            else Promoter._meta.get_field("min_withdrawal_balance").get_default()
+        )
+
+        processed = created = 0
+        for user_ids in self._iter_user_id_chunks(users, chunk_size):
+            with transaction.atomic():
+                new_user_ids = list(
+                    User.objects.filter(pk__in=user_ids, promoter__isnull=True).values_list("pk", flat=True)
+                )
+                promoter_repository.bulk_create(
+                    [Promoter(user_id=user_id, min_withdrawal_balance=min_withdrawal_balance)
+                     for user_id in new_user_ids],
+                    batch_size=chunk_size,
+                    ignore_conflicts=True,
+                )
+                # Primary keys aren't returned when conflicts are ignored, so the new rows are read back to sign
+                # their tokens. Rows created concurrently by get_or_create_promoter already have a token.
+                promoters = list(promoter_repository.filter(user_id__in=new_user_ids, referral_token__isnull=True))
+                for promoter in promoters:
+                    self.set_signed_referral_token(promoter)
+                promoter_repository.bulk_update(promoters, ["referral_token", "referral_link"], batch_size=chunk_size)
+
+            processed += len(user_ids)
+            created += len(promoters)
+            if on_progress:
+                on_progress(processed, created)
+
+        logger.info(f"Onboarded {created} new promoters out of {processed} users")
+        return created
+
+    @staticmethod
+    def sync_program(program_id: int, chunk_size: int = DEFAULT_BATCH_SIZE) -> int:
+        """
+        Propagates a program's minimum withdrawal balance to its promoters, and to the promoters without a program
+        if it's the default program, with one UPDATE per range of `chunk_size` promoter IDs. The tier rates of
+        those promoters are recomputed from the program's volume tiers as well.
+
+        Returns:
+            int: The number of promoters whose minimum withdrawal balance was raised.
+        """
+        program = ReferralProgram.objects.filter(pk=program_id, is_active=True).first()
+        if program is None:
+            return 0
+
+        default_program = ReferralProgram.get_active_referral_program()
+        include_unassigned = default_program is not None and default_program.id == program.id
+        updated = 0
+        for id_from, id_to in promoter_repository.get_id_ranges(chunk_size):
+            updated += promoter_repository.raise_min_withdrawal_balance(
+                program, include_unassigned, pk__gte=id_from, pk__lt=id_to
+            )
+        commission_tier_service.recompute(program.id, chunk_size=chunk_size)
+
+        logger.info(f"Synced referral program {program.name} to {updated} promoters")
+        return updated
+
+    @staticmethod
+    def _iter_user_id_chunks(users: Union[QuerySet[User], Iterable[int]], chunk_size: int) -> Iterable[list[int]]:
+        if isinstance(users, QuerySet):
+            for chunk in promoter_repository.iter_chunks(chunk_size, queryset=users.only("pk")):
+                yield [user.pk for user in chunk]
+            return
+
+        user_ids = iter(users)
+        while chunk := list(islice(user_ids, chunk_size)):
+            yield chunk
+
+    @use_primary()
     def get_or_create_promoter(self, user: User) -> Promoter:
         promoter = promoter_repository.get_by_user_id(user.id)
         if not promoter:
@@ -0,0 +1,82 @@
+from datetime import timedelta
+
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.utils import timezone
+
+from referrals.config import config
+from referrals.db_router import use_primary
+from referrals.models import PAYABLE_COMMISSION_STATUSES
+from referrals.repositories import promoter_commission_repository, promoter_repository, referral_repository
+from referrals.services.promoter_service import promoter_service
+
+CACHE_KEY = "referrals:promoter-summary:{user_id}"
+RECENT_EARNINGS_DAYS = 7
+
+
+class PromoterSummaryService:
+    """
+    Service class that builds the headline numbers of the promoter dashboard.
+
+    The summary is computed with the promoter lookup (with its payout totals) and two conditional-aggregation
+    queries, one over the promoter's referrals and one over their commissions, and then cached per user for
+    `PROMOTER_SUMMARY_CACHE_SECONDS`, so repeated dashboard loads don't query the ledger at all.
+    """
+
+    def get_summary(self, user: User) -> dict:
+        """
+        Returns the cached summary of a user's promoter account, creating the promoter if needed.
+
+        Args:
+            user (User): The promoter's user.
+
+        Returns:
+            dict: Referral counts by status and invitation method, commission totals by status, payout totals,
+            the balances and the earnings of the last 7 days.
+        """
+        if config.PROMOTER_SUMMARY_CACHE_SECONDS <= 0:
+            return self._build_summary(user)
+
+        key = CACHE_KEY.format(user_id=user.id)
+        summary = cache.get(key)
+        if summary is None:
+            summary = self._build_summary(user)
+            cache.set(key, summary, config.PROMOTER_SUMMARY_CACHE_SECONDS)
+        return summary
+
+    @staticmethod
+    def _build_summary(user: User) -> dict:
+        promoter = promoter_repository.get_with_payout_totals(user.id)
+        if promoter is None:
+            promoter_service.create_new_promoter(user)
+            with use_primary():
+                promoter = promoter_repository.get_with_payout_totals(user.id)
+
+        today = timezone.localdate()
+        days = [today - timedelta(days=offset) for offset in range(RECENT_EARNINGS_DAYS - 1, -1, -1)]
+        referrals = referral_repository.get_promoter_referral_counts(promoter.id)
+        commissions = promoter_commission_repository.get_promoter_commission_totals(promoter.id, days)
+
+        payable_earned = sum(commissions["by_status"][status] for status in PAYABLE_COMMISSION_STATUSES)
+        return {
+            "promoter_id": promoter.id,
+            "referral_link": promoter.referral_link,
+            "link_clicked": promoter.link_clicked,
+            "referrals": referrals,
+            "commissions": {"total": commissions["total"], "by_status": commissions["by_status"]},
+            "payouts": {
+                "total": promoter.total_paid,
+                "count": promoter.payouts_count,
+                "last_payout_at": promoter.last_payout_at,
+            },
+            "balance": commissions["total"] - promoter.total_paid,
+            "payable_balance": payable_earned - promoter.total_paid,
+            # Same shape as the `promoter-recent-earnings` action.
+            "recent_earnings": [
+                {"day": day.strftime("%a")[:2], "value": commissions["by_day"][day.isoformat()]} for day in days
+            ],
+            "generated_at": timezone.now(),
+        }
+
+
+promoter_summary_service = PromoterSummaryService()
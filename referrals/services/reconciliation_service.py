@@ -0,0 +1,168 @@
+import logging
+from concurrent.futures import ProcessPoolExecutor
+from typing import Optional
+
+import django
+import numpy as np
+import pandas as pd
+from django.db import connections
+from django.db.models import Count, Q, Sum
+
+from referrals.choices import PromoterCommissionStatusChoices
+from referrals.repositories import promoter_commission_repository, promoter_payout_repository, promoter_repository
+
+logger = logging.getLogger(__name__)
+
+AMOUNT_COLUMNS = [
+    "total_earned",
+    "paid_commissions",
+    "refunded_commissions",
+    "total_payouts",
+    "duplicate_referral_commissions",
+    "duplicate_invoice_commissions",
+]
+REPORT_COLUMNS = ["promoter_id"] + AMOUNT_COLUMNS + ["balance", "uncovered_paid_amount", "issues"]
+
+POSITIVE_COMMISSION_STATUSES = [
+    PromoterCommissionStatusChoices.PENDING,
+    PromoterCommissionStatusChoices.MATURED,
+    PromoterCommissionStatusChoices.PAID,
+    PromoterCommissionStatusChoices.FAILED,
+]
+
+
+class ReconciliationService:
+    """
+    Service class that cross-checks the commission and payout ledger of promoters in bulk.
+
+    Each promoter ID range is reconciled with a handful of grouped queries; the per-promoter comparison is then
+    done in a single vectorized pandas pass. Ranges can be processed in parallel by a process pool.
+    """
+
+    @staticmethod
+    def _get_range_aggregates(id_from: int, id_to: int) -> pd.DataFrame:
+        promoter_range = dict(promoter_id__gte=id_from, promoter_id__lt=id_to)
+
+        commissions = promoter_commission_repository.filter(**promoter_range).values("promoter_id").annotate(
+            total_earned=Sum("amount"),
+            paid_commissions=Sum("amount", filter=Q(status=PromoterCommissionStatusChoices.PAID)),
+            refunded_commissions=Sum("amount", filter=Q(status=PromoterCommissionStatusChoices.REFUND)),
+        )
+        payouts = promoter_payout_repository.filter(**promoter_range).values("promoter_id").annotate(
+            total_payouts=Sum("amount"),
+        )
+        duplicate_referrals = (
+            promoter_commission_repository.filter(status__in=POSITIVE_COMMISSION_STATUSES, **promoter_range)
+            .values("promoter_id", "referral_id")
+            .annotate(commissions=Count("id"))
+            .filter(commissions__gt=1)
+            .values_list("promoter_id", "commissions")
+        )
+        duplicate_invoices = (
+            promoter_commission_repository.filter(
+                status__in=POSITIVE_COMMISSION_STATUSES, invoice_external_id__isnull=False, **promoter_range
+            )
+            .values("promoter_id", "invoice_external_id")
+            .annotate(commissions=Count("id"))
+            .filter(commissions__gt=1)
+            .values_list("promoter_id", "commissions")
+        )
+
+        frames = [
+            pd.DataFrame.from_records(
+                list(commissions), columns=["promoter_id", "total_earned", "paid_commissions", "refunded_commissions"]
+            ),
+            pd.DataFrame.from_records(list(payouts), columns=["promoter_id", "total_payouts"]),
+            pd.DataFrame.from_records(
+                list(duplicate_referrals), columns=["promoter_id", "duplicate_referral_commissions"]
+            ).groupby("promoter_id", as_index=False).sum(),
+            pd.DataFrame.from_records(
+                list(duplicate_invoices), columns=["promoter_id", "duplicate_invoice_commissions"]
+            ).groupby("promoter_id", as_index=False).sum(),
+        ]
+
+        aggregates = frames[0]
+        for frame in frames[1:]:
+            aggregates = aggregates.merge(frame, on="promoter_id", how="outer")
+        return aggregates.reindex(columns=["promoter_id"] + AMOUNT_COLUMNS)
+
+    @staticmethod
+    def find_discrepancies(aggregates: pd.DataFrame) -> pd.DataFrame:
+        """
+        Compares per-promoter ledger aggregates and returns the promoters with discrepancies.
+
+        The checks are:
+            - `negative_balance`: the payouts exceed the earned commissions.
+            - `paid_without_payout`: commissions marked as paid (net of refunds) exceed the payouts.
+            - `duplicate_referral_commission`: a referral produced more than one positive commission.
+            - `duplicate_invoice_commission`: an invoice produced more than one positive commission.
+
+        Args:
+            aggregates (pd.DataFrame): A frame with a `promoter_id` column and the `AMOUNT_COLUMNS`.
+
+        Returns:
+            pd.DataFrame: One row per promoter with at least one issue, with `REPORT_COLUMNS` columns.
+        """
+        df = aggregates.copy()
+        df[AMOUNT_COLUMNS] = df[AMOUNT_COLUMNS].fillna(0).astype(np.int64)
+
+        df["balance"] = df["total_earned"] - df["total_payouts"]
+        df["uncovered_paid_amount"] = np.maximum(
+            df["paid_commissions"] + df["refunded_commissions"] - df["total_payouts"], 0
+        )
+        checks = {
+            "negative_balance": df["balance"] < 0,
+            "paid_without_payout": df["uncovered_paid_amount"] > 0,
+            "duplicate_referral_commission": df["duplicate_referral_commissions"] > 0,
+            "duplicate_invoice_commission": df["duplicate_invoice_commissions"] > 0,
+        }
+
+        issues = pd.Series("", index=df.index)
+        for name, mask in checks.items():
+            issues = issues.where(~mask, issues + name + ";")
+        df["issues"] = issues.str.rstrip(";")
+
+        return df.loc[df["issues"] != "", REPORT_COLUMNS].sort_values("promoter_id").reset_index(drop=True)
+
+    def reconcile_range(self, id_from: int, id_to: int) -> pd.DataFrame:
+        """
+        Reconciles the promoters with an ID in the half-open `[id_from, id_to)` range.
+        """
+        return self.find_discrepancies(self._get_range_aggregates(id_from, id_to))
+
+    def reconcile(self, chunk_size: int = 100_000, workers: int = 1,
+                  id_ranges: Optional[list[tuple[int, int]]] = None) -> pd.DataFrame:
+        """
+        Reconciles the ledger of all promoters and returns a discrepancy report.
+
+        Args:
+            chunk_size (int): The number of promoter IDs reconciled per range.
+            workers (int): The number of worker processes. With 1 worker the ranges are processed in-process.
+            id_ranges (Optional[list[tuple[int, int]]]): Explicit promoter ID ranges to reconcile.
+
+        Returns:
+            pd.DataFrame: The discrepancy report, see `find_discrepancies`.
+        """
+        id_ranges = list(id_ranges or promoter_repository.get_id_ranges(chunk_size))
+
+        if workers > 1 and len(id_ranges) > 1:
+            # Worker processes must open their own database connections.
+            connections.close_all()
+            with ProcessPoolExecutor(max_workers=workers, initializer=django.setup) as executor:
+                reports = list(executor.map(_reconcile_range, id_ranges))
+        else:
+            reports = [self.reconcile_range(id_from, id_to) for id_from, id_to in id_ranges]
+
+        reports = [report for report in reports if not report.empty]
+        if not reports:
+            return pd.DataFrame(columns=REPORT_COLUMNS)
+        report = pd.concat(reports, ignore_index=True)
+        logger.info(f"Reconciled {len(id_ranges)} promoter ranges, found {len(report)} promoters with discrepancies")
+        return report
+
+
+def _reconcile_range(id_range: tuple[int, int]) -> pd.DataFrame:
+    return reconciliation_service.reconcile_range(*id_range)
+
+
+reconciliation_service = ReconciliationService()
@@ -0,0 +1,222 @@
+import csv
+import json
+import logging
+from datetime import datetime
+from itertools import islice
+from typing import Callable, Iterable, Iterator, Optional, TextIO
+
+from django.contrib.auth.models import User
+from django.db import transaction
+from django.utils import timezone
+
+from referrals.choices import ExportFormatChoices, InvitationMethodChoices, ReferralStateChoices
+from referrals.models import Referral, ReferralProgram, ReferralTreePath
+from referrals.repositories import promoter_repository, referral_repository
+from referrals.services.commission_tier_service import commission_tier_service
+from referrals.services.outbox_service import outbox_service
+from referrals.services.referral_token_service import referral_token_service
+
+logger = logging.getLogger(__name__)
+
+IMPORT_FIELDS = ("email", "referral_token", "invitation_method", "status", "created")
+
+ImportRow = tuple[int, Optional[dict]]
+RejectHandler = Callable[[int, Optional[dict], str], None]
+
+
+class ReferralImportService:
+    """
+    Service class that imports referrals migrated from another affiliate platform.
+
+    Rows are read as a stream and processed in chunks. Every chunk resolves its users, promoters and existing
+    referrals with one `IN` query each, validates the rows in memory and inserts the valid ones with a single
+    bulk INSERT, so memory is bounded by the chunk size and the number of queries by the number of chunks.
+
+    `bulk_create` bypasses `Referral.save()` and the status transitions, so every chunk links its inserted
+    referrals into the referral tree with `ReferralTreePath.add_referrals` and recounts the active referrals of
+    the promoters it imported active referrals for. These and the outbox events of the imported referrals are
+    written in the transaction of their chunk.
+    """
+
+    @staticmethod
+    def read_rows(file: TextIO, file_format: str = ExportFormatChoices.CSV) -> Iterator[ImportRow]:
+        """
+        Lazily reads `(line number, row)` pairs from a CSV file with a header or a JSONL file. Rows that can't be
+        parsed are returned as None.
+        """
+        if file_format == ExportFormatChoices.CSV:
+            reader = csv.DictReader(file)
+            for row in reader:
+                yield reader.line_num, row
+            return
+
+        for line_number, line in enumerate(file, start=1):
+            if not line.strip():
+                continue
+            try:
+                row = json.loads(line)
+            except ValueError:
+                row = None
+            yield line_number, row if isinstance(row, dict) else None
+
+    @staticmethod
+    def _parse_row(row: dict) -> dict:
+        email = (row.get("email") or "").strip()
+        referral_token = (row.get("referral_token") or "").strip()
+        if not email or not referral_token:
+            raise ValueError("email and referral_token are required")
+
+        invitation_method = row.get("invitation_method") or InvitationMethodChoices.LINK
+        if invitation_method not in InvitationMethodChoices.values:
+            raise ValueError(f"Unknown invitation method '{invitation_method}'")
+        status = row.get("status") or ReferralStateChoices.SIGNUP
+        if status not in ReferralStateChoices.values:
+            raise ValueError(f"Unknown status '{status}'")
+
+        created = None
+        if row.get("created"):
+            try:
+                created = datetime.fromisoformat(str(row["created"]))
+            except ValueError:
+                raise ValueError(f"Invalid created datetime '{row['created']}'")
+            if timezone.is_naive(created):
+                created = timezone.make_aware(created)
+
+        return {"email": email, "referral_token": referral_token, "invitation_method": invitation_method,
+                "status": status, "created": created}
+
+    @staticmethod
+    def _resolve_promoters(referral_tokens: set[str]) -> dict[str, tuple[int, int, Optional[int]]]:
+        """Maps referral tokens to `(promoter id, promoter user id, program id)`, with one query for all tokens."""
+        signed_ids = {}
+        legacy_tokens = set()
+        for token in referral_tokens:
+            if referral_token_service.is_signed_token(token):
+                promoter_id = referral_token_service.verify(token)
+                if promoter_id is not None:
+                    signed_ids[token] = promoter_id
+            else:
+                legacy_tokens.add(token)
+
+        by_id, by_token = {}, {}
+        for promoter_id, user_id, referral_token, legacy_referral_token, program_id in (
+            promoter_repository.get_by_ids_or_legacy_tokens(signed_ids.values(), legacy_tokens)
+        ):
+            by_id[promoter_id] = (promoter_id, user_id, program_id)
+            for token in (referral_token, legacy_referral_token):
+                if token in legacy_tokens:
+                    by_token[token] = by_id[promoter_id]
+
+        by_token.update({token: by_id[promoter_id] for token, promoter_id in signed_ids.items()
+                         if promoter_id in by_id})
+        return by_token
+
+    def _import_chunk(self, chunk: list[ImportRow], reject: RejectHandler) -> int:
+        parsed = []
+        for line_number, row in chunk:
+            if row is None:
+                reject(line_number, row, "Malformed row")
+                continue
+            try:
+                parsed.append((line_number, row, self._parse_row(row)))
+            except ValueError as e:
+                reject(line_number, row, str(e))
+
+        users = dict(
+            User.objects.filter(email__in={values["email"] for _, _, values in parsed})
+            .order_by("-id").values_list("email", "id")
+        )
+        promoters = self._resolve_promoters({values["referral_token"] for _, _, values in parsed})
+        referred_user_ids = set(
+            referral_repository.filter(user_id__in=users.values()).values_list("user_id", flat=True)
+        )
+
+        referrals, created = [], {}
+        for line_number, row, values in parsed:
+            user_id = users.get(values["email"])
+            promoter = promoters.get(values["referral_token"])
+            if user_id is None:
+                reject(line_number, row, "Unknown user")
+            elif promoter is None:
+                reject(line_number, row, "Unknown or invalid referral token")
+            elif promoter[1] == user_id:
+                reject(line_number, row, "Self-referral")
+            elif user_id in referred_user_ids:
+                reject(line_number, row, "User is already referred")
+            else:
+                referred_user_ids.add(user_id)
+                # The rate of the promoter's program, resolved from the program cache.
+                program = ReferralProgram.resolve(promoter[2])
+                referrals.append(Referral(user_id=user_id, promoter_id=promoter[0],
+                                          commission_rate=program.commission_rate if program else 0,
+                                          invitation_method=values["invitation_method"], status=values["status"]))
+                if values["created"]:
+                    created[user_id] = values["created"]
+
+        with transaction.atomic():
+            referral_repository.bulk_create(referrals, ignore_conflicts=True)
+            # Rows of users referred concurrently are skipped by `ignore_conflicts`. bulk_create set `created`
+            # on every object, so the inserted rows are the ones read back with the same promoter and timestamp.
+            inserted_at = {referral.user_id: (referral.promoter_id, referral.created) for referral in referrals}
+            inserted = [
+                referral for referral in referral_repository.filter(user_id__in=inserted_at).select_related("promoter")
+                .only("id", "user_id", "promoter_id", "created", "status", "invitation_method", "promoter__user_id")
+                if inserted_at[referral.user_id] == (referral.promoter_id, referral.created)
+            ]
+            # `created` is an auto_now_add field that bulk_create always sets to now, so the original
+            # timestamps are written back in one bulk UPDATE.
+            restored = [referral for referral in inserted if referral.user_id in created]
+            for referral in restored:
+                referral.created = created[referral.user_id]
+            if restored:
+                referral_repository.bulk_update(restored, ["created"])
+            ReferralTreePath.add_referrals(inserted)
+            active_promoter_ids = {referral.promoter_id for referral in inserted
+                                   if referral.status == ReferralStateChoices.ACTIVE}
+            if active_promoter_ids:
+                commission_tier_service.recompute(recount=True, promoter_ids=active_promoter_ids)
+            outbox_service.record_referrals(inserted)
+        return len(inserted)
+
+    def import_rows(self, rows: Iterable[ImportRow], chunk_size: int = 5000,
+                    on_reject: Optional[RejectHandler] = None,
+                    on_progress: Optional[Callable[[int, int, int], None]] = None) -> dict:
+        """
+        Imports referrals from `(line number, row)` pairs, e.g. from `read_rows`.
+
+        Rows need an `email` of an existing user and a `referral_token` of a promoter; `invitation_method`
+        (default link), `status` (default signup) and an ISO 8601 `created` are optional. Rows of unknown users
+        or promoters, self-referrals and users that are already referred are rejected, every chunk is committed
+        on its own, and a rerun of the same file rejects the rows imported before as already referred.
+
+        Args:
+            rows (Iterable[ImportRow]): The rows to import.
+            chunk_size (int): The number of rows validated and inserted at a time.
+            on_reject (Optional[RejectHandler]): Called with the line number, the row and the reason of every
+                rejected row.
+            on_progress (Optional[Callable[[int, int, int], None]]): Called after every chunk with the number of
+                rows read, imported and rejected so far.
+
+        Returns:
+            dict: The number of `imported` and `rejected` rows.
+        """
+        counts = {"imported": 0, "rejected": 0}
+
+        def reject(line_number: int, row: Optional[dict], reason: str) -> None:
+            counts["rejected"] += 1
+            if on_reject:
+                on_reject(line_number, row, reason)
+
+        rows = iter(rows)
+        read = 0
+        while chunk := list(islice(rows, chunk_size)):
+            counts["imported"] += self._import_chunk(chunk, reject)
+            read += len(chunk)
+            if on_progress:
+                on_progress(read, counts["imported"], counts["rejected"])
+
+        logger.info(f"Imported {counts['imported']} referrals, rejected {counts['rejected']} rows")
+        return counts
+
+
+referral_import_service = ReferralImportService()
@@ -13,8 +13,12 @@ from django.template.loader import get_template
 
 from referrals.choices import ReferralStateChoices
 from referrals.config import config
+from referrals.instrumentation import instrument
 from referrals.models import PromoterCommission, Promoter
 from referrals.serializers import PromoterCommissionSerializer
+from referrals.services.commission_tier_service import commission_tier_service
+from referrals.services.fraud_service import fraud_service
+from referrals.services.outbox_service import outbox_service
 from referrals.services.promoter_payout_service import promoter_payout_service
 from referrals.utils import append_query_params
 
@@ -68,6 +72,7 @@ class ReferralService:
             return False
 
     @staticmethod
+    @instrument
     def get_user_earnings(user: User):
         """
         Retrieves the earnings of a user within the last 7 days.
@@ -133,6 +138,9 @@ class ReferralService:
         Generate a unique referral code using the user's ID and the current timestamp,
         hashed for consistency in length and to obscure the user ID.
 
+        Legacy scheme, the code can be computed by anyone who knows the user ID. New promoters get signed
+        tokens from `ReferralTokenService`.
+
         :param user_id: The ID of the user from whom the referral code is being generated.
         :return: A unique referral code.
         """
@@ -151,6 +159,7 @@ class ReferralService:
         return append_query_params(base_referral_link, {"ref": referral_token})
 
     @staticmethod
+    @instrument
     def get_referrer_by_user_id(user_id: int) -> Optional[Promoter]:
         """
         Retrieve the promoter (referrer) associated with a given user ID.
@@ -165,17 +174,26 @@ class ReferralService:
             return None
 
     @staticmethod
+    @instrument
+    @transaction.atomic
     def handle_purchase_subscription(user: User,
                                      amount_paid: int,
-                                     invoice_external_id: Optional[int] = None) -> Optional[PromoterCommission]:
+                                     invoice_external_id: Optional[int] = None,
+                                     currency: Optional[str] = None,
+                                     payment_fingerprint: Optional[str] = None) -> Optional[PromoterCommission]:
         """
         Handles the process of updating a referral subscription status to 'Active'
         when a subscription is created for a referred user.
 
+        A payment fingerprint shared with the promoter or another of its referred users flags the referral
+        before its commissions are created, see `FraudService`.
+
         Args:
             user (User): The user whose subscription is being handled.
             amount_paid (int): The amount paid for the subscription in cents.
             invoice_external_id (Optional[int]): An external ID for the invoice (optional).
+            currency (Optional[str]): The currency the subscription was billed in, `BASE_CURRENCY` by default.
+            payment_fingerprint (Optional[str]): The fingerprint of the payment method, e.g. a card fingerprint.
 
         Returns:
             Optional[PromoterCommission]: The commission generated from the subscription, or None if no commission is generated.
@@ -186,13 +204,18 @@ class ReferralService:
             if user.referral.status == ReferralStateChoices.SIGNUP:
                 user.referral.status = ReferralStateChoices.ACTIVE
                 user.referral.save()
-                commission = promoter_payout_service.calculate_commission(user.id, amount_paid, invoice_external_id)
+                outbox_service.record_referral(user.referral)
+                commission_tier_service.record_active_referral(promoter)
+                fraud_service.screen_payment(user.referral, payment_fingerprint)
+                commission = promoter_payout_service.calculate_commission(user.id, amount_paid, invoice_external_id,
+                                                                          currency)
                 logger.info(f"User {user.email} became an active referral of {promoter.user.email}")
                 return commission
         except ObjectDoesNotExist:
             logger.warning(f"User with ID {user.id} has no referral associated.")
 
     @staticmethod
+    @instrument
     @transaction.atomic
     def handle_user_refund(user: User, amount_refunded: int, amount_paid: int,
                            invoice_external_id: Optional[int] = None) -> Optional[PromoterCommission]:
@@ -216,6 +239,8 @@ class ReferralService:
             if user.referral.status == ReferralStateChoices.ACTIVE:
                 user.referral.status = ReferralStateChoices.REFUND
                 user.referral.save()
+                outbox_service.record_referral(user.referral)
+                commission_tier_service.record_active_referral(user.referral.promoter, delta=-1)
                 commission = promoter_payout_service.calculate_refund(user.referral, amount_refunded, amount_paid,
                                                                       invoice_external_id)
                 logger.info(f"User {user.email} has been refunded {amount_refunded}.")
@@ -0,0 +1,133 @@
+import base64
+import hashlib
+import hmac
+import logging
+from typing import Optional
+
+from django.conf import settings
+
+from referrals.config import config
+
+logger = logging.getLogger(__name__)
+
+SEPARATOR = "."
+SIGNATURE_BYTES = 12
+DEFAULT_KEY_ID = "s"
+
+
+class ReferralTokenService:
+    """
+    Service class that issues and verifies self-verifying referral tokens.
+
+    A token has the form `<key id>.<promoter id in base 36>.<signature>`, e.g. `k1.2s.3Jq8Kx0cVn5tWb1a`, where the
+    signature is a truncated HMAC-SHA256 of the first two parts. Verifying a token and reading the promoter ID
+    from it doesn't need the database, so forged tokens are rejected before any query is made.
+
+    Signing keys are read from `REFERRAL_TOKEN_KEYS` (`kid:secret` pairs separated by commas). New tokens are
+    signed with the first key, and tokens of every listed key are accepted, so a key can be rotated by
+    prepending a new one and dropping the old one once its tokens are reissued. Without configured keys a key
+    derived from `SECRET_KEY` is used.
+    """
+
+    def __init__(self):
+        self._keys_source = None
+        self._keys: dict[str, bytes] = {}
+
+    @property
+    def keys(self) -> dict[str, bytes]:
+        """
+        The verification keys by key ID, the signing key first. Parsed again whenever the settings change.
+        """
+        source = (config.REFERRAL_TOKEN_KEYS, settings.SECRET_KEY)
+        if source != self._keys_source:
+            self._keys = self._parse_keys(*source)
+            self._keys_source = source
+        return self._keys
+
+    @staticmethod
+    def _parse_keys(token_keys: Optional[str], secret_key: str) -> dict[str, bytes]:
+        keys = {}
+        for pair in filter(None, (token_keys or "").split(",")):
+            key_id, _, secret = pair.strip().partition(":")
+            if not key_id or not secret or SEPARATOR in key_id:
+                raise ValueError(f"Invalid REFERRAL_TOKEN_KEYS entry for key id '{key_id}', expected kid:secret.")
+            keys[key_id] = secret.encode()
+        if not keys:
+            keys[DEFAULT_KEY_ID] = hashlib.sha256(f"referrals.token:{secret_key}".encode()).digest()
+        return keys
+
+    @property
+    def signing_key_id(self) -> str:
+        return next(iter(self.keys))
+
+    def _signature(self, key_id: str, payload: str) -> str:
+        digest = hmac.new(self.keys[key_id], payload.encode(), hashlib.sha256).digest()[:SIGNATURE_BYTES]
+        return base64.urlsafe_b64encode(digest).decode().rstrip("=")
+
+    def sign(self, promoter_id: int, key_id: Optional[str] = None) -> str:
+        """
+        Issues a referral token for a promoter.
+
+        Args:
+            promoter_id (int): The promoter the token attributes clicks and signups to.
+            key_id (Optional[str]): The signing key, the current signing key by default.
+
+        Returns:
+            str: The signed referral token.
+        """
+        key_id = key_id or self.signing_key_id
+        payload = f"{key_id}{SEPARATOR}{_to_base36(promoter_id)}"
+        return f"{payload}{SEPARATOR}{self._signature(key_id, payload)}"
+
+    @staticmethod
+    def is_signed_token(token: str) -> bool:
+        """
+        Whether the token has the signed token format. Legacy tokens never contain the separator.
+        """
+        return token.count(SEPARATOR) == 2
+
+    def verify(self, token: str) -> Optional[int]:
+        """
+        Verifies a signed referral token without touching the database.
+
+        Args:
+            token (str): The referral token.
+
+        Returns:
+            Optional[int]: The promoter ID carried by the token, or None if the token is malformed, signed with an
+            unknown key or forged.
+        """
+        if not self.is_signed_token(token):
+            return None
+
+        key_id, encoded_id, signature = token.split(SEPARATOR)
+        if key_id not in self.keys:
+            return None
+        if not hmac.compare_digest(signature, self._signature(key_id, f"{key_id}{SEPARATOR}{encoded_id}")):
+            logger.warning(f"Rejected referral token with an invalid signature for key '{key_id}'")
+            return None
+        try:
+            return int(encoded_id, 36)
+        except ValueError:
+            return None
+
+    def needs_reissue(self, token: Optional[str]) -> bool:
+        """
+        Whether a stored token is a legacy token or is signed with a key other than the current signing key.
+        """
+        return not token or not self.is_signed_token(token) or not token.startswith(
+            f"{self.signing_key_id}{SEPARATOR}"
+        )
+
+
+def _to_base36(value: int) -> str:
+    digits = "0123456789abcdefghijklmnopqrstuvwxyz"
+    encoded = ""
+    while True:
+        value, remainder = divmod(value, 36)
+        encoded = digits[remainder] + encoded
+        if not value:
+            return encoded
+
+
+referral_token_service = ReferralTokenService()
@@ -0,0 +1,100 @@
+import logging
+from itertools import islice
+from typing import Iterable
+
+from django.db import transaction
+from django.db.models import F
+
+from referrals.config import config
+from referrals.models import ReferralTreePath
+from referrals.repositories import referral_repository, referral_tree_repository
+
+logger = logging.getLogger(__name__)
+
+
+class ReferralTreeService:
+    """
+    Service class for the multi-level referral tree stored in the `ReferralTreePath` closure table.
+
+    New referrals are linked into the tree by `Referral.save`; this service reads the tree and rebuilds it
+    from the existing referrals, e.g. after upgrading or after bulk imports that bypass `save()`.
+    """
+
+    @staticmethod
+    def get_downline(promoter_id: int) -> dict:
+        """
+        Returns the size of a promoter's downline in total and per level.
+
+        Args:
+            promoter_id (int): The promoter at the top of the downline.
+
+        Returns:
+            dict: `total` users and a `levels` list of `{"level", "users"}` rows, level 1 being direct referrals.
+        """
+        levels = [
+            {"level": level, "users": users}
+            for level, users in referral_tree_repository.get_downline_counts(promoter_id)
+        ]
+        return {"total": sum(level["users"] for level in levels), "levels": levels}
+
+    @staticmethod
+    def _insert_paths(rows: Iterable[tuple[int, int]], depth: int, chunk_size: int) -> int:
+        rows = iter(rows)
+        inserted = 0
+        while chunk := list(islice(rows, chunk_size)):
+            referral_tree_repository.bulk_create(
+                [ReferralTreePath(ancestor_id=ancestor_id, descendant_id=descendant_id, depth=depth)
+                 for ancestor_id, descendant_id in chunk],
+                batch_size=chunk_size,
+                ignore_conflicts=True,
+            )
+            inserted += len(chunk)
+        return inserted
+
+    @transaction.atomic
+    def rebuild(self, chunk_size: int = 10_000) -> int:
+        """
+        Rebuilds the closure table from the referrals, one tree level per pass.
+
+        Level 1 are the referrals themselves; every following level is derived from the previous one with a
+        single join, so the number of queries grows with the tree depth, not with the number of referrals.
+
+        Args:
+            chunk_size (int): The number of rows inserted per batch.
+
+        Returns:
+            int: The number of paths written.
+        """
+        referral_tree_repository.get_all().delete()
+
+        written = self._insert_paths(
+            referral_repository.get_all().values_list("promoter_id", "user_id").iterator(chunk_size=chunk_size),
+            depth=1,
+            chunk_size=chunk_size,
+        )
+        for depth in range(2, config.REFERRAL_TREE_MAX_DEPTH + 1):
+            parent_paths = (
+                referral_tree_repository.filter(depth=depth - 1, ancestor__user__referral__isnull=False)
+                .exclude(ancestor__user__referral__promoter__user_id=F("descendant_id"))
+                .annotate(parent_promoter_id=F("ancestor__user__referral__promoter_id"))
+                .only("id", "descendant_id")
+            )
+            # Read by keyset chunks, the new level is inserted into the table that is being read.
+            inserted = self._insert_paths(
+                (
+                    (path.parent_promoter_id, path.descendant_id)
+                    for chunk in referral_tree_repository.iter_chunks(chunk_size, queryset=parent_paths)
+                    for path in chunk
+                ),
+                depth=depth,
+                chunk_size=chunk_size,
+            )
+            if not inserted:
+                break
+            written += inserted
+
+        logger.info(f"Rebuilt the referral tree with {written} paths")
+        return written
+
+
+referral_tree_service = ReferralTreeService()
@@ -1,20 +1,49 @@
+import csv
+import gzip
+import json
 import math
+import os
+import random
+import tempfile
+import time
 from datetime import datetime, timedelta
 from decimal import Decimal
+from io import StringIO
+from unittest import mock
 
 from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.db import DEFAULT_DB_ALIAS, connection, connections, models
+from django.db.models import Sum
 from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
+from django.utils import timezone
 from rest_framework import status
-from rest_framework.test import APITestCase, APIClient
+from rest_framework.test import APITestCase, APITransactionTestCase, APIClient
 
-from referrals.choices import InvitationMethodChoices, ReferralStateChoices, PromoterCommissionStatusChoices
+from referrals.choices import InvitationMethodChoices, ReferralStateChoices, PromoterCommissionStatusChoices, \
+    BulkActionJobStatusChoices, BulkActionChoices, FraudFlagReasonChoices
 from referrals.config import config
+from referrals.db_router import get_read_db_alias, read_replica, use_primary
 from referrals.exceptions import ViewException
-from referrals.models import ReferralProgram, Promoter, Referral, PromoterPayout, PromoterCommission
+from referrals.instrumentation import QUERY_DEBUG_HEADER, Histogram, QueryStats, metrics_registry, track_queries
+from referrals.models import ReferralProgram, Promoter, Referral, PromoterPayout, PromoterCommission, \
+    PromoterBalanceSnapshot, PayoutMethod, ReferralProgramLevel, ReferralTreePath, BulkActionJob, \
+    OutboxEvent, ReferralProgramTier, FxRate, ReferralFingerprint, ReferralClickFingerprint
+from referrals.repositories.base_repository import BaseRepository
+from referrals.repositories import promoter_repository, promoter_payout_repository, \
+    promoter_balance_snapshot_repository, referral_repository, referral_tree_repository
 from referrals.serializers import ReferralSerializer, PromoterSerializer, PromoterPayoutsSerializer
-from referrals.services import referral_service, promoter_service
+from referrals.services import referral_service, promoter_service, funnel_analytics_service, \
+    batch_commission_service, balance_snapshot_service, referral_tree_service, referral_token_service, \
+    referral_import_service, outbox_service, click_ingestion_service, commission_maturation_service, \
+    commission_tier_service, fx_rate_service, fraud_service, bulk_action_service
+from referrals.outbox_sinks import OutboxSink, StreamSink
 from referrals.services.promoter_payout_service import promoter_payout_service
+from referrals.services.reconciliation_service import reconciliation_service
 
 
 class ReferralProgramViewSetTestCase(APITestCase):
@@ -418,3 +447,2098 @@ class PromoterServiceTestCase(TestCase):
     def tearDownClass(cls):
         Promoter.objects.all().delete()
         User.objects.all().delete()
+        super().tearDownClass()
+
+
+class FunnelAnalyticsServiceTestCase(APITestCase):
+    def setUp(self):
+        self.referral_program = ReferralProgram.objects.create(name='test_program', commission_rate=20.00,
+                                                               is_active=True, min_withdrawal_balance=10)
+        self.user = User.objects.create_user(username='test-user', email='test@example.com', password='Password123')
+        self.promoter = Promoter.objects.create(user=self.user, referral_token='test-token', link_clicked=10)
+        statuses = [ReferralStateChoices.SIGNUP, ReferralStateChoices.ACTIVE, ReferralStateChoices.ACTIVE,
+                    ReferralStateChoices.REFUND]
+        for index, referral_status in enumerate(statuses):
+            referred_user = User.objects.create(username=f'referred-{index}', email=f'referred-{index}@example.com')
+            Referral.objects.create(
+                user=referred_user,
+                promoter=self.promoter,
+                status=referral_status,
+                invitation_method=InvitationMethodChoices.EMAIL if index else InvitationMethodChoices.LINK,
+            )
+
+    def test_get_funnel_program_wide(self):
+        result = funnel_analytics_service.get_funnel()
+
+        self.assertEqual(len(result), 1)
+        self.assertEqual(result[0]['clicks'], 10)
+        self.assertEqual(result[0]['signups'], 4)
+        self.assertEqual(result[0]['active'], 3)
+        self.assertEqual(result[0]['refunded'], 1)
+        self.assertEqual(result[0]['signup_rate'], 0.4)
+        self.assertEqual(result[0]['activation_rate'], 0.75)
+        self.assertEqual(result[0]['refund_rate'], 0.3333)
+
+    def test_get_funnel_by_invitation_method(self):
+        result = funnel_analytics_service.get_funnel(group_by='invitation_method')
+
+        rows = {row['invitation_method']: row for row in result}
+        self.assertEqual(rows['link']['signups'], 1)
+        self.assertEqual(rows['link']['activation_rate'], 0.0)
+        self.assertEqual(rows['email']['signups'], 3)
+        self.assertEqual(rows['email']['activation_rate'], 1.0)
+
+    def test_get_funnel_date_range_excludes_referrals(self):
+        tomorrow = datetime.today().date() + timedelta(days=1)
+        result = funnel_analytics_service.get_funnel(group_by='promoter', date_from=tomorrow)
+
+        self.assertEqual(result, [])
+
+    def test_funnel_endpoint_is_limited_to_own_promoter(self):
+        other_user = User.objects.create(username='other-user', email='other@example.com')
+        self.client.force_authenticate(user=other_user)
+
+        response = self.client.get(reverse('referrals-funnel'), {'group_by': 'promoter'})
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data, [])
+
+    def test_funnel_endpoint_invalid_date_range(self):
+        self.client.force_authenticate(user=self.user)
+
+        response = self.client.get(reverse('referrals-funnel'), {'date_from': '2024-02-01', 'date_to': '2024-01-01'})
+
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+class BatchCommissionServiceTestCase(TestCase):
+    def setUp(self):
+        self.random = random.Random(42)
+
+    def test_commission_amounts_match_scalar_path(self):
+        amounts_paid = [self.random.randint(0, 10_000_000) for _ in range(20_000)]
+        commission_rates = [Decimal(self.random.randint(1, 99_999)) / 100 for _ in range(20_000)]
+
+        result = batch_commission_service.calculate_commission_amounts(amounts_paid, commission_rates)
+
+        expected = [
+            promoter_payout_service.calculate_commission_amount(amount_paid, commission_rate)
+            for amount_paid, commission_rate in zip(amounts_paid, commission_rates)
+        ]
+        self.assertEqual(result.tolist(), expected)
+
+    def test_refund_amounts_match_scalar_formula(self):
+        amounts_paid = [self.random.randint(1, 10_000_000) for _ in range(20_000)]
+        amounts_refunded = [self.random.randint(0, amount_paid) for amount_paid in amounts_paid]
+        commissions_paid = [self.random.randint(0, 100_000) for _ in range(20_000)]
+
+        result = batch_commission_service.calculate_refund_amounts(commissions_paid, amounts_refunded, amounts_paid)
+
+        expected = [
+            -math.floor(Decimal(commission_paid) * amount_refunded / amount_paid)
+            for commission_paid, amount_refunded, amount_paid in zip(commissions_paid, amounts_refunded, amounts_paid)
+        ]
+        self.assertEqual(result.tolist(), expected)
+
+    def test_commission_amounts_with_single_rate(self):
+        result = batch_commission_service.calculate_commission_amounts([15000, 999, 0], Decimal("20.00"))
+
+        self.assertEqual(result.tolist(), [30, 1, 0])
+
+    def test_commission_amounts_overflow(self):
+        with self.assertRaises(ValueError):
+            batch_commission_service.calculate_commission_amounts([2 ** 62], [Decimal("50.00")])
+
+    def test_create_commissions(self):
+        ReferralProgram.objects.create(name='test_program', commission_rate=20.00, is_active=True)
+        promoter_user = User.objects.create(username='promoter', email='promoter@example.com')
+        promoter = Promoter.objects.create(user=promoter_user, referral_token='test-token')
+        referrals = [
+            Referral.objects.create(
+                user=User.objects.create(username=f'referred-{index}', email=f'referred-{index}@example.com'),
+                promoter=promoter,
+                status=ReferralStateChoices.ACTIVE,
+            )
+            for index in range(3)
+        ]
+
+        batch_commission_service.create_commissions(referrals, [15000, 10000, 5000], ['inv-1', 'inv-2', None])
+
+        amounts = list(PromoterCommission.objects.order_by('id').values_list('amount', 'invoice_external_id'))
+        self.assertEqual(amounts, [(30, 'inv-1'), (20, 'inv-2'), (10, None)])
+
+
+class ExportTestCase(APITestCase):
+    def setUp(self):
+        ReferralProgram.objects.create(name='test_program', commission_rate=20.00, is_active=True)
+        self.staff_user = User.objects.create(username='staff', email='staff@example.com', is_staff=True)
+        self.user = User.objects.create(username='test-user', email='test@example.com')
+        self.user2 = User.objects.create(username='test-user2', email='test2@example.com')
+        self.promoter = Promoter.objects.create(user=self.user, referral_token='test-token')
+        self.referral = Referral.objects.create(user=self.user2, promoter=self.promoter,
+                                                status=ReferralStateChoices.ACTIVE)
+        self.commission = PromoterCommission.objects.create(promoter=self.promoter, referral=self.referral,
+                                                            amount=100, invoice_external_id='inv-1')
+        PromoterCommission.objects.create(promoter=self.promoter, referral=self.referral, amount=-50,
+                                          status=PromoterCommissionStatusChoices.REFUND)
+
+    def test_export_endpoint_streams_csv(self):
+        self.client.force_authenticate(user=self.staff_user)
+
+        response = self.client.get(reverse('referrals-export'), {'dataset': 'commissions', 'status': 'pending'})
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response['Content-Type'], 'text/csv')
+        lines = b''.join(response.streaming_content).decode().splitlines()
+        self.assertEqual(lines[0].split(',')[:3], ['id', 'created', 'updated'])
+        self.assertEqual(len(lines), 2)
+        self.assertIn('inv-1', lines[1])
+
+    def test_export_endpoint_streams_gzipped_jsonl(self):
+        self.client.force_authenticate(user=self.staff_user)
+
+        response = self.client.get(reverse('referrals-export'),
+                                   {'dataset': 'referrals', 'file_format': 'jsonl', 'gzip': 'true'})
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        content = gzip.decompress(b''.join(response.streaming_content)).decode()
+        records = [json.loads(line) for line in content.splitlines()]
+        self.assertEqual(len(records), 1)
+        self.assertEqual(records[0]['user_id'], self.user2.id)
+        self.assertEqual(records[0]['commission_rate'], '20.00')
+
+    def test_export_endpoint_rejects_status_for_payouts(self):
+        self.client.force_authenticate(user=self.staff_user)
+
+        response = self.client.get(reverse('referrals-export'), {'dataset': 'payouts', 'status': 'paid'})
+
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_export_endpoint_rejects_status_of_another_dataset(self):
+        self.client.force_authenticate(user=self.staff_user)
+
+        response = self.client.get(reverse('referrals-export'), {'dataset': 'referrals', 'status': 'paid'})
+
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn('status', response.data)
+
+    def test_export_endpoint_is_staff_only(self):
+        self.client.force_authenticate(user=self.user)
+
+        response = self.client.get(reverse('referrals-export'), {'dataset': 'commissions'})
+
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+
+    def test_export_command_writes_file(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'commissions.csv')
+            call_command('export_referral_data', dataset='commissions', output=path, stdout=StringIO())
+
+            with open(path) as file:
+                lines = file.read().splitlines()
+
+        self.assertEqual(len(lines), 3)
+
+
+class ReconciliationServiceTestCase(TestCase):
+    def setUp(self):
+        ReferralProgram.objects.create(name='test_program', commission_rate=20.00, is_active=True)
+        self.promoters = [
+            Promoter.objects.create(user=User.objects.create(username=f'promoter-{index}'),
+                                    referral_token=f'token-{index}')
+            for index in range(3)
+        ]
+        self.referrals = [
+            Referral.objects.create(user=User.objects.create(username=f'referred-{index}'),
+                                    promoter=self.promoters[index], status=ReferralStateChoices.ACTIVE)
+            for index in range(3)
+        ]
+
+    def test_reconcile_reports_discrepancies(self):
+        healthy, overpaid, duplicated = self.promoters
+        PromoterCommission.objects.create(promoter=healthy, referral=self.referrals[0], amount=100,
+                                          status=PromoterCommissionStatusChoices.PAID)
+        PromoterPayout.objects.create(promoter=healthy, amount=100, payout_method='wise')
+
+        PromoterCommission.objects.create(promoter=overpaid, referral=self.referrals[1], amount=100,
+                                          status=PromoterCommissionStatusChoices.PAID)
+        PromoterPayout.objects.create(promoter=overpaid, amount=150, payout_method='wise')
+
+        for _ in range(2):
+            PromoterCommission.objects.create(promoter=duplicated, referral=self.referrals[2], amount=30,
+                                              invoice_external_id='inv-1',
+                                              status=PromoterCommissionStatusChoices.PAID)
+
+        report = reconciliation_service.reconcile(chunk_size=2)
+        rows = {row['promoter_id']: row for row in report.to_dict(orient='records')}
+
+        self.assertNotIn(healthy.id, rows)
+        self.assertEqual(rows[overpaid.id]['balance'], -50)
+        self.assertEqual(rows[overpaid.id]['issues'], 'negative_balance')
+        self.assertEqual(rows[duplicated.id]['uncovered_paid_amount'], 60)
+        self.assertEqual(
+            rows[duplicated.id]['issues'],
+            'paid_without_payout;duplicate_referral_commission;duplicate_invoice_commission',
+        )
+
+    def test_reconcile_without_discrepancies(self):
+        report = reconciliation_service.reconcile()
+
+        self.assertTrue(report.empty)
+
+    def test_reconcile_ledger_command(self):
+        out = StringIO()
+        call_command('reconcile_ledger', stdout=out)
+
+        self.assertIn('No discrepancies found', out.getvalue())
+
+
+class BalanceSnapshotTestCase(APITestCase):
+    def setUp(self):
+        ReferralProgram.objects.create(name='test_program', commission_rate=20.00, is_active=True)
+        self.user = User.objects.create(username='test-user', email='test@example.com')
+        self.user2 = User.objects.create(username='test-user2', email='test2@example.com')
+        self.promoter = Promoter.objects.create(user=self.user, referral_token='test-token')
+        self.referral = Referral.objects.create(user=self.user2, promoter=self.promoter,
+                                                status=ReferralStateChoices.ACTIVE)
+
+        self.january = datetime(2024, 1, 15).date()
+        self.february = datetime(2024, 2, 15).date()
+        self._create_commission(100, self.january)
+        self._create_payout(60, self.january)
+        self._create_commission(40, self.february)
+
+    def _create_commission(self, amount, day):
+        commission = PromoterCommission.objects.create(promoter=self.promoter, referral=self.referral, amount=amount)
+        PromoterCommission.objects.filter(pk=commission.pk).update(created=timezone.make_aware(
+            datetime.combine(day, datetime.min.time())))
+
+    def _create_payout(self, amount, day):
+        payout = PromoterPayout.objects.create(promoter=self.promoter, amount=amount, payout_method='wise')
+        PromoterPayout.objects.filter(pk=payout.pk).update(created=timezone.make_aware(
+            datetime.combine(day, datetime.min.time())))
+
+    def test_balance_as_of_without_snapshots(self):
+        self.assertEqual(self.promoter.balance_as_of(self.january), 40)
+        self.assertEqual(self.promoter.balance_as_of(self.february), 80)
+
+    def test_take_snapshots_and_balance_as_of(self):
+        written = balance_snapshot_service.take_snapshots(datetime(2024, 1, 31).date())
+        balance_snapshot_service.take_snapshots(datetime(2024, 2, 29).date())
+
+        self.assertEqual(written, 1)
+        snapshots = PromoterBalanceSnapshot.objects.order_by('as_of')
+        self.assertEqual([snapshot.balance for snapshot in snapshots], [40, 80])
+
+        self._create_commission(5, datetime(2024, 3, 1).date())
+        self.assertEqual(self.promoter.balance_as_of(datetime(2024, 3, 1).date()), 85)
+        self.assertEqual(self.promoter.balance_as_of(self.february), 80)
+
+    def test_take_snapshots_is_idempotent(self):
+        balance_snapshot_service.take_snapshots(self.february)
+        balance_snapshot_service.take_snapshots(self.february)
+
+        self.assertEqual(PromoterBalanceSnapshot.objects.count(), 1)
+
+    def test_balances_as_of_endpoint(self):
+        balance_snapshot_service.take_snapshots(datetime(2024, 1, 31).date())
+        staff_user = User.objects.create(username='staff', email='staff@example.com', is_staff=True)
+        self.client.force_authenticate(user=staff_user)
+
+        response = self.client.get(reverse('referrals-balances-as-of'), {'date': '2024-02-20'})
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['count'], 1)
+        self.assertEqual(response.data['results'], [
+            {'promoter_id': self.promoter.id, 'total_earned': 140, 'total_paid': 60, 'balance': 80}
+        ])
+
+
+class QueryIndexUsageTestCase(TestCase):
+    def setUp(self):
+        ReferralProgram.objects.create(name='test_program', commission_rate=20.00, is_active=True)
+        self.user = User.objects.create(username='test-user', email='test@example.com')
+        self.promoter = Promoter.objects.create(user=self.user, referral_token='test-token')
+        self.referral = Referral.objects.create(user=User.objects.create(username='test-user2'),
+                                                promoter=self.promoter, status=ReferralStateChoices.ACTIVE)
+        if connection.vendor == 'postgresql':
+            with connection.cursor() as cursor:
+                cursor.execute('SET enable_seqscan = off')
+
+    def assertUsesIndex(self, queryset, index_name=None):
+        plan = queryset.explain()
+        if connection.vendor == 'postgresql':
+            self.assertIn('Index', plan)
+        else:
+            self.assertRegex(plan, r'USING (COVERING )?INDEX')
+        if index_name:
+            self.assertIn(index_name, plan)
+
+    def test_commissions_by_promoter_and_status_use_index(self):
+        self.assertUsesIndex(
+            PromoterCommission.objects.filter(promoter=self.promoter, status__in=['pending', 'failed']),
+            'commission_prom_status_idx',
+        )
+
+    def test_commission_balance_sum_uses_covering_index(self):
+        queryset = PromoterCommission.objects.filter(promoter=self.promoter, status='paid').values(
+            'promoter').annotate(total=Sum('amount'))
+        self.assertUsesIndex(queryset, 'commission_prom_status_idx')
+
+    def test_commissions_by_referral_and_status_use_index(self):
+        self.assertUsesIndex(
+            PromoterCommission.objects.filter(referral=self.referral, status__in=['pending', 'paid']),
+            'commission_ref_status_idx',
+        )
+
+    def test_recent_commissions_use_index(self):
+        self.assertUsesIndex(
+            PromoterCommission.objects.filter(promoter=self.promoter, created__gte=timezone.now()),
+            'commission_prom_created_idx',
+        )
+
+    def test_referral_list_uses_index(self):
+        self.assertUsesIndex(
+            Referral.objects.filter(promoter=self.promoter).order_by('-created'),
+            'referral_promoter_created_idx',
+        )
+
+    def test_payout_history_uses_index(self):
+        self.assertUsesIndex(
+            PromoterPayout.objects.filter(promoter=self.promoter).order_by('-created'),
+            'payout_promoter_created_idx',
+        )
+
+    def test_payout_sum_uses_covering_index(self):
+        queryset = PromoterPayout.objects.filter(promoter=self.promoter).values('promoter').annotate(
+            total=Sum('amount'))
+        self.assertUsesIndex(queryset, 'payout_promoter_amount_idx')
+
+
+class QueryBudgetTestCase(APITestCase):
+    """Query budgets per endpoint; the query count must not grow with the page size or the amount of data."""
+
+    QUERY_BUDGETS = {
+        'referrals-list': 4,
+        'referrals-retrieve-promoter': 4,
+        'referrals-get-referral-link': 1,
+        'referrals-promoter-recent-earnings': 1,
+        'referrals-promoter-payment-history': 1,
+        'referrals-funnel': 3,
+    }
+
+    def setUp(self):
+        ReferralProgram.objects.create(name='test_program', commission_rate=20.00, is_active=True)
+        self.user = User.objects.create(username='test-user', email='test@example.com')
+        self.promoter = Promoter.objects.create(user=self.user, referral_token='test-token')
+        self.client.force_authenticate(user=self.user)
+        self.size = 0
+
+    def _grow_data(self, size):
+        for index in range(self.size, size):
+            referral = Referral.objects.create(
+                user=User.objects.create(username=f'referred-{index}', email=f'referred-{index}@example.com'),
+                promoter=self.promoter,
+                status=ReferralStateChoices.ACTIVE,
+            )
+            PromoterCommission.objects.create(promoter=self.promoter, referral=referral, amount=10)
+            PromoterPayout.objects.create(promoter=self.promoter, amount=5, payout_method='wise')
+        self.size = size
+
+    def _count_queries(self, url_name, page_size):
+        with track_queries(url_name) as stats:
+            response = self.client.get(reverse(url_name), {'page_size': page_size})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return stats.count
+
+    def test_query_budgets(self):
+        counts = {}
+        for page_size in (10, 100):
+            self._grow_data(page_size)
+            for url_name in self.QUERY_BUDGETS:
+                counts[url_name, page_size] = self._count_queries(url_name, page_size)
+
+        for url_name, budget in self.QUERY_BUDGETS.items():
+            with self.subTest(url_name=url_name):
+                self.assertLessEqual(counts[url_name, 10], budget)
+                self.assertEqual(counts[url_name, 10], counts[url_name, 100])
+
+    def test_list_page_has_commissions(self):
+        self._grow_data(3)
+
+        response = self.client.get(reverse('referrals-list'))
+
+        self.assertEqual([row['commissionAmount'] for row in response.data['results']], [10, 10, 10])
+
+    @mock.patch.object(config, 'QUERY_DEBUG_HEADER_ENABLED', True)
+    @mock.patch.object(config, 'QUERY_INSTRUMENTATION_ENABLED', True)
+    def test_debug_header(self):
+        with self.assertLogs('referrals.instrumentation', level='INFO') as logs:
+            response = self.client.get(reverse('referrals-promoter-payment-history'))
+
+        self.assertRegex(response[QUERY_DEBUG_HEADER], r'^count=1; duration_ms=\d+\.\d{2}$')
+        self.assertIn('ReferralProgramViewSet.promoter_payment_history: 1 queries', logs.output[0])
+
+    @mock.patch.object(config, 'QUERY_INSTRUMENTATION_ENABLED', False)
+    def test_debug_header_disabled(self):
+        response = self.client.get(reverse('referrals-promoter-payment-history'))
+
+        self.assertNotIn(QUERY_DEBUG_HEADER, response)
+
+
+class SyntheticDataBenchmarkTestCase(TestCase):
+    def test_generate_referral_data(self):
+        call_command('generate_referral_data', users=30, promoters=5, referrals=20, commissions=40, payouts=5,
+                     batch_size=7, stdout=StringIO())
+
+        self.assertEqual(User.objects.count(), 30)
+        self.assertEqual(Promoter.objects.count(), 5)
+        self.assertEqual(Referral.objects.count(), 20)
+        self.assertEqual(PromoterCommission.objects.count(), 40)
+        self.assertEqual(PromoterPayout.objects.count(), 5)
+        self.assertGreater(PayoutMethod.objects.count(), 0)
+        self.assertEqual(Promoter.objects.filter(active_payout_method__method='wise').count(),
+                         PayoutMethod.objects.count())
+        self.assertFalse(Referral.objects.filter(promoter__user=models.F('user')).exists())
+        self.assertFalse(PromoterCommission.objects.exclude(promoter=models.F('referral__promoter')).exists())
+
+    def test_generate_referral_data_validates_volumes(self):
+        with self.assertRaises(CommandError):
+            call_command('generate_referral_data', users=5, promoters=10, referrals=0, commissions=0, payouts=0,
+                         stdout=StringIO())
+
+    def test_benchmark_referrals(self):
+        call_command('generate_referral_data', users=30, promoters=3, referrals=20, commissions=20, payouts=0,
+                     stdout=StringIO())
+        out = StringIO()
+
+        call_command('benchmark_referrals', iterations=3, payout_iterations=1, stdout=out)
+
+        report = json.loads(out.getvalue())
+        self.assertEqual(report['dataset']['referrals'], 20)
+        self.assertEqual(set(report['scenarios']), {
+            'list_referrals_first_page', 'list_referrals_last_page', 'retrieve_promoter',
+            'promoter_recent_earnings', 'increment_link_clicked', 'create_referral', 'wise_payout_run',
+        })
+        for result in report['scenarios'].values():
+            self.assertLessEqual(result['p50_ms'], result['p95_ms'])
+            self.assertLessEqual(result['p95_ms'], result['p99_ms'])
+        self.assertEqual(Referral.objects.count(), 20)
+
+
+class LatencyMetricsTestCase(APITestCase):
+    def setUp(self):
+        metrics_registry.reset()
+        self.addCleanup(metrics_registry.reset)
+        self.user = User.objects.create(username='test-user', email='test@example.com')
+        self.promoter = Promoter.objects.create(user=self.user, referral_token='test-token')
+        self.staff_user = User.objects.create(username='staff', email='staff@example.com', is_staff=True)
+
+    def test_histogram_buckets(self):
+        histogram = Histogram(buckets=(0.1, 1.0))
+        for value in (0.05, 0.1, 0.5, 2.0):
+            histogram.observe(value)
+
+        self.assertEqual(histogram.cumulative_counts(), [('0.1', 2), ('1', 3), ('+Inf', 4)])
+        self.assertEqual(histogram.count, 4)
+        self.assertAlmostEqual(histogram.sum, 2.65)
+
+    @mock.patch.object(config, 'METRICS_ENABLED', True)
+    def test_view_and_service_metrics(self):
+        self.client.force_authenticate(user=self.user)
+        self.client.get(reverse('referrals-promoter-payment-history'))
+        referral_service.get_referrer_by_user_id(self.user.id)
+
+        view = metrics_registry.get_histogram('referrals_view_duration_seconds', action='promoter_payment_history')
+        db = metrics_registry.get_histogram('referrals_view_db_duration_seconds', action='promoter_payment_history')
+        python = metrics_registry.get_histogram('referrals_view_python_duration_seconds',
+                                                action='promoter_payment_history')
+        self.assertEqual(view.count, 1)
+        self.assertAlmostEqual(db.sum + python.sum, view.sum)
+        self.assertEqual(
+            metrics_registry.get_histogram('referrals_service_duration_seconds',
+                                           method='ReferralService.get_referrer_by_user_id').count,
+            1,
+        )
+
+        self.client.force_authenticate(user=self.staff_user)
+        response = self.client.get(reverse('referrals-metrics'))
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertTrue(response['Content-Type'].startswith('text/plain; version=0.0.4'))
+        body = response.content.decode()
+        self.assertIn('# TYPE referrals_view_duration_seconds histogram', body)
+        self.assertIn('referrals_view_duration_seconds_bucket{action="promoter_payment_history",le="+Inf"} 1', body)
+        self.assertIn('referrals_view_queries_total{action="promoter_payment_history"} 1', body)
+        self.assertIn('referrals_service_queries_total{method="ReferralService.get_referrer_by_user_id"} 1', body)
+
+    @mock.patch.object(config, 'METRICS_ENABLED', False)
+    def test_metrics_disabled(self):
+        self.client.force_authenticate(user=self.user)
+        self.client.get(reverse('referrals-promoter-payment-history'))
+
+        self.assertEqual(metrics_registry.render(), '')
+
+    def test_metrics_requires_staff(self):
+        self.client.force_authenticate(user=self.user)
+
+        response = self.client.get(reverse('referrals-metrics'))
+
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+
+
+class RepositoryBulkOperationsTestCase(TestCase):
+    def setUp(self):
+        self.promoters = [
+            Promoter.objects.create(user=User.objects.create(username=f'user-{index}', email=f'user-{index}@x.com'),
+                                    referral_token=f'token-{index}')
+            for index in range(5)
+        ]
+
+    def test_iter_chunks(self):
+        with track_queries() as stats:
+            chunks = list(promoter_repository.iter_chunks(2))
+
+        self.assertEqual([len(chunk) for chunk in chunks], [2, 2, 1])
+        self.assertEqual([promoter.id for chunk in chunks for promoter in chunk],
+                         [promoter.id for promoter in self.promoters])
+        self.assertEqual(stats.count, 3)
+
+    def test_iter_chunks_with_queryset(self):
+        queryset = promoter_repository.filter(referral_token__in=['token-1', 'token-3'])
+
+        chunks = list(promoter_repository.iter_chunks(2, queryset=queryset))
+
+        self.assertEqual([[promoter.referral_token for promoter in chunk] for chunk in chunks],
+                         [['token-1', 'token-3']])
+
+    def test_bulk_create_batches(self):
+        payouts = [PromoterPayout(promoter=self.promoters[0], amount=index, payout_method='wise') for index in range(5)]
+
+        with track_queries() as stats:
+            promoter_payout_repository.bulk_create(payouts, batch_size=2)
+
+        self.assertEqual(PromoterPayout.objects.count(), 5)
+        self.assertEqual(stats.count, 3)
+
+    def test_bulk_create_conflicts(self):
+        as_of = timezone.now()
+        promoter_balance_snapshot_repository.bulk_create([
+            PromoterBalanceSnapshot(promoter=self.promoters[0], as_of=as_of, total_earned=10, total_paid=0),
+        ])
+
+        promoter_balance_snapshot_repository.bulk_create(
+            [PromoterBalanceSnapshot(promoter=self.promoters[0], as_of=as_of, total_earned=20, total_paid=5)],
+            ignore_conflicts=True,
+        )
+        self.assertEqual(PromoterBalanceSnapshot.objects.get().total_earned, 10)
+
+        promoter_balance_snapshot_repository.bulk_create(
+            [PromoterBalanceSnapshot(promoter=self.promoters[0], as_of=as_of, total_earned=20, total_paid=5),
+             PromoterBalanceSnapshot(promoter=self.promoters[1], as_of=as_of, total_earned=1, total_paid=0)],
+            update_conflicts=True,
+            unique_fields=['promoter', 'as_of'],
+            update_fields=['total_earned', 'total_paid'],
+        )
+        snapshot = PromoterBalanceSnapshot.objects.get(promoter=self.promoters[0])
+        self.assertEqual((snapshot.total_earned, snapshot.total_paid), (20, 5))
+        self.assertEqual(PromoterBalanceSnapshot.objects.count(), 2)
+
+    def test_bulk_update(self):
+        for promoter in self.promoters:
+            promoter.link_clicked = 7
+
+        updated = promoter_repository.bulk_update(self.promoters, ['link_clicked'], batch_size=2)
+
+        self.assertEqual(updated, 5)
+        self.assertEqual(set(Promoter.objects.values_list('link_clicked', flat=True)), {7})
+
+    def test_update_where(self):
+        before = Promoter.objects.get(pk=self.promoters[0].pk).updated
+
+        with track_queries() as stats:
+            updated = promoter_repository.update_where({'link_clicked': models.F('link_clicked') + 3},
+                                                       pk__in=[self.promoters[0].pk, self.promoters[1].pk])
+
+        self.assertEqual(updated, 2)
+        self.assertEqual(stats.count, 1)
+        promoter = Promoter.objects.get(pk=self.promoters[0].pk)
+        self.assertEqual(promoter.link_clicked, 3)
+        self.assertGreater(promoter.updated, before)
+
+    def test_update_saves_only_given_fields(self):
+        Promoter.objects.filter(pk=self.promoters[0].pk).update(link_clicked=9)
+
+        promoter = promoter_repository.update({'referral_token': 'new-token'}, pk=self.promoters[0].pk)
+
+        self.assertEqual(promoter.referral_token, 'new-token')
+        self.assertEqual(Promoter.objects.get(pk=promoter.pk).link_clicked, 9)
+
+
+class WisePayoutTestCase(TestCase):
+    def setUp(self):
+        self.promoters = []
+        for index in range(3):
+            user = User.objects.create(username=f'user-{index}', email=f'user-{index}@x.com', first_name=f'Name{index}')
+            payout_method = PayoutMethod.objects.create(method='wise', payment_address=f'user-{index}@x.com')
+            promoter = Promoter.objects.create(user=user, referral_token=f'token-{index}',
+                                               active_payout_method=payout_method)
+            referral = Referral.objects.create(
+                user=User.objects.create(username=f'referred-{index}', email=f'referred-{index}@x.com'),
+                promoter=promoter,
+            )
+            PromoterCommission.objects.create(promoter=promoter, referral=referral, amount=100 * (index + 1))
+            self.promoters.append(promoter)
+        PromoterPayout.objects.create(promoter=self.promoters[0], amount=100, payout_method='wise')
+
+    def test_send_wise_csv_for_promoters_payouts(self):
+        with track_queries() as stats:
+            csv = promoter_payout_service.send_wise_csv_for_promoters_payouts(chunk_size=2)
+
+        self.assertEqual(csv.splitlines()[1:], [
+            'Name1,user-1@x.com,200.0,USD,USD,target,EMAIL',
+            'Name2,user-2@x.com,300.0,USD,USD,target,EMAIL',
+        ])
+        self.assertEqual(
+            list(PromoterPayout.objects.filter(promoter__in=self.promoters[1:]).order_by('promoter_id')
+                 .values_list('amount', flat=True)),
+            [200, 300],
+        )
+        self.assertFalse(PromoterCommission.objects.filter(promoter__in=self.promoters[1:]).exclude(
+            status=PromoterCommissionStatusChoices.PAID).exists())
+        self.assertEqual(PromoterCommission.objects.get(promoter=self.promoters[0]).status,
+                         PromoterCommissionStatusChoices.MATURED)
+        # Maturing the due commissions (program, due IDs, UPDATE), then per chunk: the promoter SELECT, one
+        # payout INSERT and one commission UPDATE inside a savepoint.
+        self.assertEqual(stats.count, 3 + 2 * 5)
+
+        self.assertIsNone(promoter_payout_service.send_wise_csv_for_promoters_payouts())
+
+
+@mock.patch.object(config, 'READ_REPLICA_DB_ALIAS', 'replica')
+class ReadReplicaRoutingTestCase(APITransactionTestCase):
+    databases = {'default', 'replica'}
+
+    def setUp(self):
+        self.user = User.objects.create(username='test-user', email='test@example.com')
+        self.promoter = Promoter.objects.create(user=self.user, referral_token='test-token')
+        PromoterPayout.objects.create(promoter=self.promoter, amount=5, payout_method='wise')
+        self.client.force_authenticate(user=self.user)
+
+    def _count_replica_queries(self, func):
+        with track_queries() as all_stats:
+            replica_stats = QueryStats()
+            with connections['replica'].execute_wrapper(replica_stats):
+                result = func()
+        return result, replica_stats.count, all_stats.count
+
+    def test_read_only_actions_use_replica(self):
+        response, replica, total = self._count_replica_queries(
+            lambda: self.client.get(reverse('referrals-promoter-payment-history'))
+        )
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(response.data), 1)
+        self.assertEqual((replica, total), (1, 1))
+
+    def test_list_reads_promoter_from_primary(self):
+        response, replica, total = self._count_replica_queries(lambda: self.client.get(reverse('referrals-list')))
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertGreater(replica, 0)
+        # `get_or_create_promoter` is a read-then-write path and stays on the primary.
+        self.assertEqual(total - replica, 1)
+
+    def test_writes_use_primary(self):
+        response, replica, _ = self._count_replica_queries(
+            lambda: self.client.post(reverse('referrals-increment-link-clicked'), {'referral_token': 'test-token'})
+        )
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(replica, 0)
+
+    def test_replica_instances_are_saved_to_primary(self):
+        with read_replica():
+            promoter = Promoter.objects.get(pk=self.promoter.pk)
+        self.assertEqual(promoter._state.db, 'replica')
+
+        promoter.link_clicked = 3
+        _, replica, _ = self._count_replica_queries(promoter.save)
+
+        self.assertEqual(replica, 0)
+        self.assertEqual(promoter._state.db, DEFAULT_DB_ALIAS)
+
+    def test_use_primary(self):
+        with read_replica():
+            self.assertEqual(Promoter.objects.all().db, 'replica')
+            with use_primary():
+                self.assertEqual(Promoter.objects.all().db, DEFAULT_DB_ALIAS)
+        self.assertEqual(Promoter.objects.all().db, DEFAULT_DB_ALIAS)
+
+    @mock.patch.object(config, 'STICKY_PRIMARY_SECONDS', 5.0)
+    def test_sticky_primary_after_write(self):
+        now = time.monotonic()
+        with mock.patch('referrals.db_router.time.monotonic', return_value=now):
+            Promoter.objects.filter(pk=self.promoter.pk).update(link_clicked=1)
+            self.assertEqual(get_read_db_alias(), DEFAULT_DB_ALIAS)
+
+        with mock.patch('referrals.db_router.time.monotonic', return_value=now + 6):
+            self.assertEqual(get_read_db_alias(), 'replica')
+
+    def test_unknown_replica_alias(self):
+        with mock.patch.object(config, 'READ_REPLICA_DB_ALIAS', 'missing'), read_replica():
+            self.assertEqual(Promoter.objects.all().db, DEFAULT_DB_ALIAS)
+
+
+class ReferralTreeTestCase(APITestCase):
+    def setUp(self):
+        self.program = ReferralProgram.objects.create(name='tiered', commission_rate=Decimal('10.00'), is_active=True)
+        ReferralProgramLevel.objects.create(program=self.program, level=2, commission_rate=Decimal('3.00'))
+        ReferralProgramLevel.objects.create(program=self.program, level=3, commission_rate=Decimal('1.00'))
+
+        # a -> b -> c -> d, every user except d is a promoter
+        self.users = {name: User.objects.create(username=name, email=f'{name}@example.com') for name in 'abcd'}
+        self.promoters = {
+            name: Promoter.objects.create(user=self.users[name], referral_token=f'token-{name}') for name in 'abc'
+        }
+        for promoter, user in (('a', 'b'), ('b', 'c'), ('c', 'd')):
+            Referral.objects.create(user=self.users[user], promoter=self.promoters[promoter],
+                                    status=ReferralStateChoices.SIGNUP)
+
+    def _paths(self):
+        return set(ReferralTreePath.objects.values_list('ancestor__user__username', 'descendant__username', 'depth'))
+
+    def test_paths_are_maintained_on_referral_creation(self):
+        self.assertEqual(self._paths(), {
+            ('a', 'b', 1), ('b', 'c', 1), ('c', 'd', 1), ('a', 'c', 2), ('b', 'd', 2), ('a', 'd', 3),
+        })
+
+    def test_existing_downline_is_attached(self):
+        e, f = (User.objects.create(username=name, email=f'{name}@example.com') for name in 'ef')
+        promoter_e = Promoter.objects.create(user=e, referral_token='token-e')
+        Referral.objects.create(user=f, promoter=promoter_e)
+
+        Referral.objects.create(user=e, promoter=self.promoters['c'])
+
+        self.assertTrue({('c', 'f', 2), ('b', 'f', 3), ('a', 'f', 4), ('a', 'e', 3)} <= self._paths())
+
+    def test_cycles_only_get_the_direct_link(self):
+        promoter_d = Promoter.objects.create(user=self.users['d'], referral_token='token-d')
+
+        Referral.objects.create(user=self.users['a'], promoter=promoter_d)
+
+        self.assertEqual(set(ReferralTreePath.objects.filter(descendant=self.users['a'])
+                             .values_list('ancestor_id', 'depth')), {(promoter_d.id, 1)})
+
+    @mock.patch.object(config, 'REFERRAL_TREE_MAX_DEPTH', 2)
+    def test_max_depth(self):
+        ReferralTreePath.objects.all().delete()
+
+        referral_tree_service.rebuild()
+
+        self.assertNotIn(('a', 'd', 3), self._paths())
+        self.assertIn(('b', 'd', 2), self._paths())
+
+    def test_rebuild(self):
+        expected = self._paths()
+        ReferralTreePath.objects.all().delete()
+
+        written = referral_tree_service.rebuild(chunk_size=2)
+
+        self.assertEqual(written, 6)
+        self.assertEqual(self._paths(), expected)
+
+    def test_level_commissions_and_refunds(self):
+        with track_queries() as stats:
+            referral_tree_repository.get_upline_level_rates(self.users['d'].id)
+        self.assertEqual(stats.count, 1)
+
+        commission = referral_service.handle_purchase_subscription(self.users['d'], amount_paid=10000)
+
+        self.assertEqual((commission.promoter, commission.amount, commission.level), (self.promoters['c'], 10, 1))
+        self.assertEqual(
+            list(PromoterCommission.objects.order_by('level').values_list('promoter__user__username', 'amount', 'level')),
+            [('c', 10, 1), ('b', 3, 2), ('a', 1, 3)],
+        )
+
+        refund = referral_service.handle_user_refund(self.users['d'], amount_refunded=5000, amount_paid=10000)
+
+        self.assertEqual((refund.promoter, refund.amount), (self.promoters['c'], -5))
+        self.assertEqual(
+            list(PromoterCommission.objects.filter(status=PromoterCommissionStatusChoices.REFUND).order_by('level')
+                 .values_list('promoter__user__username', 'amount', 'level')),
+            [('c', -5, 1), ('b', -1, 2), ('a', 0, 3)],
+        )
+
+    def test_batch_commissions_credit_the_upline(self):
+        referrals = list(Referral.objects.filter(user__username__in='cd').order_by('user__username'))
+
+        with track_queries() as stats:
+            commissions = batch_commission_service.create_commissions(referrals, [10000, 20000])
+
+        # Tier rates, upline and the bulk INSERT, plus the transaction.
+        self.assertEqual(stats.count, 5)
+        self.assertEqual(
+            [(commission.promoter_id, commission.amount, commission.level) for commission in commissions],
+            [(self.promoters['b'].id, 10, 1), (self.promoters['a'].id, 3, 2),
+             (self.promoters['c'].id, 20, 1), (self.promoters['b'].id, 6, 2), (self.promoters['a'].id, 2, 3)],
+        )
+
+    def test_downline_endpoint(self):
+        self.client.force_authenticate(user=self.users['a'])
+
+        with track_queries() as stats:
+            response = self.client.get(reverse('referrals-downline'))
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data, {
+            'total': 3,
+            'levels': [{'level': 1, 'users': 1}, {'level': 2, 'users': 1}, {'level': 3, 'users': 1}],
+        })
+        self.assertEqual(stats.count, 2)
+
+    def test_create_referral_program_with_level_rates(self):
+        call_command('create_referral_program', name='three-levels', commission_rate=Decimal('8.00'),
+                     level_rates=['2=2.50', '3=0.50'], stdout=StringIO())
+
+        program = ReferralProgram.objects.get(name='three-levels')
+        self.assertEqual(list(program.levels.order_by('level').values_list('level', 'commission_rate')),
+                         [(2, Decimal('2.50')), (3, Decimal('0.50'))])
+
+
+@mock.patch.object(config, 'REFERRAL_TOKEN_KEYS', 'k1:first-secret')
+class SignedReferralTokenTestCase(APITestCase):
+    def setUp(self):
+        self.user = User.objects.create(username='promoter', email='promoter@example.com')
+        self.promoter = Promoter.objects.create(user=self.user, referral_token='LEGACY0001')
+
+    def test_sign_and_verify(self):
+        token = referral_token_service.sign(12345)
+
+        self.assertTrue(token.startswith('k1.9ix.'))
+        self.assertEqual(referral_token_service.verify(token), 12345)
+
+    def test_forged_tokens(self):
+        key_id, encoded_id, signature = referral_token_service.sign(12345).split('.')
+
+        for token in (f'{key_id}.9iy.{signature}', f'{key_id}.{encoded_id}.{signature[:-1]}A',
+                      f'k9.{encoded_id}.{signature}', 'k1..', 'LEGACY0001'):
+            with self.subTest(token=token):
+                self.assertIsNone(referral_token_service.verify(token))
+
+    def test_key_rotation(self):
+        old_token = referral_token_service.sign(7)
+
+        with mock.patch.object(config, 'REFERRAL_TOKEN_KEYS', 'k2:second-secret,k1:first-secret'):
+            self.assertEqual(referral_token_service.verify(old_token), 7)
+            self.assertTrue(referral_token_service.sign(7).startswith('k2.'))
+            self.assertTrue(referral_token_service.needs_reissue(old_token))
+
+        with mock.patch.object(config, 'REFERRAL_TOKEN_KEYS', 'k2:second-secret'):
+            self.assertIsNone(referral_token_service.verify(old_token))
+
+    def test_new_promoters_get_signed_tokens(self):
+        user = User.objects.create(username='new', email='new@example.com')
+
+        promoter = promoter_service.create_new_promoter(user)
+
+        self.assertEqual(referral_token_service.verify(promoter.referral_token), promoter.id)
+        self.assertTrue(promoter.referral_link.endswith(f'ref={promoter.referral_token}'))
+
+    def test_increment_link_clicked_without_lookup(self):
+        token = referral_token_service.sign(self.promoter.id)
+
+        with track_queries() as stats:
+            response = self.client.post(reverse('referrals-increment-link-clicked'), {'referral_token': token})
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(stats.count, 1)
+        self.promoter.refresh_from_db()
+        self.assertEqual(self.promoter.link_clicked, 1)
+
+    def test_forged_token_is_rejected_without_queries(self):
+        key_id, encoded_id, _ = referral_token_service.sign(self.promoter.id).split('.')
+
+        with track_queries() as stats:
+            response = self.client.post(reverse('referrals-increment-link-clicked'),
+                                        {'referral_token': f'{key_id}.{encoded_id}.forged'})
+
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+        self.assertEqual(stats.count, 0)
+
+    def test_legacy_tokens(self):
+        url = reverse('referrals-increment-link-clicked')
+
+        self.assertEqual(self.client.post(url, {'referral_token': 'LEGACY0001'}).status_code, status.HTTP_200_OK)
+        with mock.patch.object(config, 'ACCEPT_LEGACY_REFERRAL_TOKENS', False):
+            self.assertEqual(self.client.post(url, {'referral_token': 'LEGACY0001'}).status_code,
+                             status.HTTP_404_NOT_FOUND)
+
+    def test_reissue_referral_tokens(self):
+        call_command('reissue_referral_tokens', stdout=StringIO())
+
+        self.promoter.refresh_from_db()
+        self.assertEqual(self.promoter.legacy_referral_token, 'LEGACY0001')
+        self.assertEqual(referral_token_service.verify(self.promoter.referral_token), self.promoter.id)
+        self.assertEqual(promoter_service.resolve_referral_token('LEGACY0001'), self.promoter.id)
+
+        referred = User.objects.create(username='referred', email='referred@example.com')
+        response = self.client.post(reverse('referrals-list'),
+                                    {'email': referred.email, 'referral_token': self.promoter.referral_token})
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(Referral.objects.get(user=referred).promoter, self.promoter)
+
+
+class BulkPromoterOnboardingTestCase(APITestCase):
+    def setUp(self):
+        ReferralProgram.objects.create(name='Program', commission_rate=Decimal('10.00'),
+                                       min_withdrawal_balance=Decimal('25.00'), is_active=True)
+        self.users = [User.objects.create(username=f'user{i}', email=f'user{i}@example.com') for i in range(5)]
+        self.existing = promoter_service.create_new_promoter(self.users[0])
+
+    def test_onboard_user_queryset(self):
+        progress = []
+
+        created = promoter_service.onboard_promoters(User.objects.all(), chunk_size=2,
+                                                     on_progress=lambda *args: progress.append(args))
+
+        self.assertEqual(created, 4)
+        self.assertEqual(progress, [(2, 1), (4, 3), (5, 4)])
+        for promoter in Promoter.objects.exclude(pk=self.existing.pk):
+            self.assertEqual(referral_token_service.verify(promoter.referral_token), promoter.id)
+            self.assertTrue(promoter.referral_link.endswith(f'ref={promoter.referral_token}'))
+            self.assertEqual(promoter.min_withdrawal_balance, Decimal('25.00'))
+
+        self.existing.refresh_from_db()
+        self.assertEqual(promoter_service.onboard_promoters(User.objects.all()), 0)
+
+    def test_queries_per_chunk_are_constant(self):
+        user_ids = [user.id for user in self.users]
+
+        with track_queries() as stats:
+            promoter_service.onboard_promoters(user_ids + [999_999], chunk_size=10)
+
+        # Active program, user selection, bulk insert, read back and token update, plus the transaction.
+        self.assertLessEqual(stats.count, 7)
+        self.assertEqual(Promoter.objects.count(), 5)
+
+    def test_onboard_promoters_command(self):
+        with tempfile.NamedTemporaryFile('w', suffix='.txt', delete=False) as ids_file:
+            ids_file.write(f'{self.users[1].id}\n{self.users[2].id}\n\n')
+
+        out = StringIO()
+        call_command('onboard_promoters', '--ids-file', ids_file.name, stdout=out)
+        os.unlink(ids_file.name)
+
+        self.assertIn('Onboarded 2 new promoters.', out.getvalue())
+        self.assertEqual(Promoter.objects.count(), 3)
+
+    def test_onboard_promoters_api(self):
+        url = reverse('referrals-onboard-promoters')
+        user_ids = [user.id for user in self.users]
+
+        self.client.force_authenticate(self.users[1])
+        self.assertEqual(self.client.post(url, {'user_ids': user_ids}, format='json').status_code,
+                         status.HTTP_403_FORBIDDEN)
+
+        self.client.force_authenticate(User.objects.create(username='staff', email='staff@example.com',
+                                                           is_staff=True))
+        response = self.client.post(url, {'user_ids': user_ids}, format='json')
+
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(response.data, {'processed': 5, 'created': 4})
+
+
+class ReferralImportTestCase(TestCase):
+    def setUp(self):
+        ReferralProgram.objects.create(name='Program', commission_rate=Decimal('12.50'), is_active=True)
+        self.promoter_user = User.objects.create(username='promoter', email='promoter@example.com')
+        self.promoter = promoter_service.create_new_promoter(self.promoter_user)
+        self.legacy_promoter = Promoter.objects.create(
+            user=User.objects.create(username='legacy', email='legacy@example.com'), referral_token='LEGACY0001'
+        )
+        for index in range(4):
+            User.objects.create(username=f'user{index}', email=f'user{index}@example.com')
+        tmp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp_dir.cleanup)
+        self.tmp_dir = tmp_dir.name
+
+    def _write(self, name, content):
+        path = os.path.join(self.tmp_dir, name)
+        with open(path, 'w') as file:
+            file.write(content)
+        return path
+
+    def test_import_csv_with_rejects(self):
+        token = self.promoter.referral_token
+        path = self._write('referrals.csv', '\n'.join([
+            'email,referral_token,invitation_method,status,created',
+            f'user0@example.com,{token},email,active,2023-05-01T10:00:00+00:00',
+            'user1@example.com,LEGACY0001,,,',
+            f'user0@example.com,{token},,,',
+            f'promoter@example.com,{token},,,',
+            'missing@example.com,LEGACY0001,,,',
+            f'user2@example.com,{token[:-1]}x,,,',
+            f'user3@example.com,{token},carrier-pigeon,,',
+        ]) + '\n')
+        rejects_path = os.path.join(self.tmp_dir, 'rejects.csv')
+
+        out = StringIO()
+        call_command('import_referrals', path, '--rejects', rejects_path, '--chunk-size', '3', stdout=out)
+
+        self.assertIn('Imported 2 referrals, rejected 5 rows.', out.getvalue())
+        referral = Referral.objects.get(user__email='user0@example.com')
+        self.assertEqual((referral.promoter, referral.status, referral.invitation_method),
+                         (self.promoter, ReferralStateChoices.ACTIVE, InvitationMethodChoices.EMAIL))
+        self.assertEqual(referral.created.isoformat(), '2023-05-01T10:00:00+00:00')
+        self.assertEqual(referral.commission_rate, Decimal('12.50'))
+        self.assertEqual(Referral.objects.get(user__email='user1@example.com').promoter, self.legacy_promoter)
+        self.assertTrue(ReferralTreePath.objects.filter(ancestor=self.promoter, descendant=referral.user).exists())
+
+        with open(rejects_path) as rejects_file:
+            rejects = list(csv.DictReader(rejects_file))
+        self.assertEqual(
+            [(row['line'], row['error']) for row in rejects],
+            [('4', 'User is already referred'), ('5', 'Self-referral'), ('6', 'Unknown user'),
+             ('7', 'Unknown or invalid referral token'), ('8', "Unknown invitation method 'carrier-pigeon'")],
+        )
+
+    def test_import_jsonl_with_constant_queries_per_chunk(self):
+        lines = [json.dumps({'email': f'user{index}@example.com', 'referral_token': self.promoter.referral_token})
+                 for index in range(4)]
+        rejected = []
+
+        with track_queries() as stats:
+            counts = referral_import_service.import_rows(
+                referral_import_service.read_rows(StringIO('\n'.join(lines + ['{not json']) + '\n'), 'jsonl'),
+                on_reject=lambda *args: rejected.append(args),
+            )
+
+        self.assertEqual(counts, {'imported': 4, 'rejected': 1})
+        self.assertEqual(rejected, [(5, None, 'Malformed row')])
+        # Active program, users, promoters, existing referrals, the bulk INSERT and its read-back, the tree
+        # paths above and below the imported users and their INSERT, plus the transaction.
+        self.assertLessEqual(stats.count, 11)
+
+    def test_imports_link_the_tree_and_recount_only_the_imported_promoters(self):
+        idle_promoter = Promoter.objects.create(user=User.objects.get(email='user3@example.com'),
+                                                referral_token='IDLE0001', active_referrals_count=7)
+        rows = [
+            'user0@example.com,LEGACY0001,,active,',
+            f'legacy@example.com,{self.promoter.referral_token},,active,',
+            f'user1@example.com,{self.promoter.referral_token},,,',
+        ]
+
+        counts = referral_import_service.import_rows(referral_import_service.read_rows(
+            StringIO('\n'.join(['email,referral_token,invitation_method,status,created'] + rows) + '\n')
+        ))
+
+        self.assertEqual(counts, {'imported': 3, 'rejected': 0})
+        paths = set(ReferralTreePath.objects.values_list('ancestor_id', 'descendant__email', 'depth'))
+        self.assertEqual(paths, {
+            (self.legacy_promoter.id, 'user0@example.com', 1),
+            (self.promoter.id, 'legacy@example.com', 1),
+            (self.promoter.id, 'user0@example.com', 2),
+            (self.promoter.id, 'user1@example.com', 1),
+        })
+        referral_tree_service.rebuild()
+        self.assertEqual(set(ReferralTreePath.objects.values_list('ancestor_id', 'descendant__email', 'depth')),
+                         paths)
+        self.assertEqual(
+            dict(Promoter.objects.values_list('id', 'active_referrals_count')),
+            {self.promoter.id: 1, self.legacy_promoter.id: 1, idle_promoter.id: 7},
+        )
+
+    def test_concurrently_referred_users_are_not_counted(self):
+        bulk_create = referral_repository.bulk_create
+
+        def bulk_create_after_concurrent_signup(objs, **kwargs):
+            Referral.objects.create(user=User.objects.get(email='user1@example.com'), promoter=self.legacy_promoter,
+                                    status=ReferralStateChoices.SIGNUP)
+            return bulk_create(objs, **kwargs)
+
+        rows = [f'user{index}@example.com,{self.promoter.referral_token},,,2023-05-01T10:00:00+00:00'
+                for index in range(2)]
+        with mock.patch.object(referral_repository, 'bulk_create', bulk_create_after_concurrent_signup):
+            counts = referral_import_service.import_rows(referral_import_service.read_rows(
+                StringIO('\n'.join(['email,referral_token,invitation_method,status,created'] + rows) + '\n')
+            ))
+
+        self.assertEqual(counts, {'imported': 1, 'rejected': 0})
+        concurrent = Referral.objects.get(user__email='user1@example.com')
+        self.assertEqual(concurrent.promoter, self.legacy_promoter)
+        self.assertNotEqual(concurrent.created.year, 2023)
+
+
+class AdminChangelistTestCase(TestCase):
+    def setUp(self):
+        self.admin_user = User.objects.create_superuser(username='admin', email='admin@example.com', password='pw')
+        self.client.force_login(self.admin_user)
+        self.program = ReferralProgram.objects.create(name='Program', commission_rate=Decimal('10.00'), is_active=True)
+
+    def _add_promoters(self, count):
+        offset = Promoter.objects.count()
+        for index in range(offset, offset + count):
+            promoter = Promoter.objects.create(
+                user=User.objects.create(username=f'promoter{index}', email=f'promoter{index}@example.com'),
+                referral_token=f'TOKEN{index}', referral_link=f'http://localhost:8000/?ref=TOKEN{index}',
+            )
+            referral = Referral.objects.create(
+                user=User.objects.create(username=f'referred{index}', email=f'referred{index}@example.com'),
+                promoter=promoter, invitation_method=InvitationMethodChoices.LINK, status=ReferralStateChoices.ACTIVE,
+            )
+            PromoterCommission.objects.create(promoter=promoter, referral=referral, amount=50 + index)
+            PromoterPayout.objects.create(promoter=promoter, amount=20, payout_method='wise')
+
+    def _count_queries(self, url):
+        with track_queries() as stats:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return stats.count
+
+    def test_changelists_run_a_constant_number_of_queries(self):
+        urls = [reverse(f'admin:referrals_{model}_changelist')
+                for model in ('promoter', 'referral', 'promotercommission', 'promoterpayout')]
+
+        self._add_promoters(2)
+        baseline = {url: self._count_queries(url) for url in urls}
+        self._add_promoters(8)
+
+        for url in urls:
+            with self.subTest(url=url):
+                self.assertEqual(self._count_queries(url), baseline[url])
+
+    def test_promoter_changelist_shows_annotated_balances(self):
+        self._add_promoters(1)
+
+        response = self.client.get(reverse('admin:referrals_promoter_changelist'), {'o': '-8'})
+
+        promoter = response.context['cl'].result_list[0]
+        self.assertEqual((promoter.referrals_count, promoter.total_earned, promoter.total_paid, promoter.balance),
+                         (1, 50, 20, 30))
+
+    def test_email_searches_match_the_whole_address(self):
+        self._add_promoters(2)
+
+        for model in ('promoter', 'promotercommission', 'promoterpayout'):
+            url = reverse(f'admin:referrals_{model}_changelist')
+            self.assertEqual(self.client.get(url, {'q': 'PROMOTER1@example.com'}).context['cl'].result_count, 1)
+            self.assertEqual(self.client.get(url, {'q': 'promoter1'}).context['cl'].result_count, 0)
+
+    def test_amount_range_filter(self):
+        self._add_promoters(3)
+
+        response = self.client.get(reverse('admin:referrals_promotercommission_changelist'),
+                                   {'amount_range': '10-100', 'status': 'pending'})
+
+        self.assertEqual(response.context['cl'].result_count, 3)
+
+    def test_estimated_count_for_large_unfiltered_tables(self):
+        self._add_promoters(1)
+        url = reverse('admin:referrals_referral_changelist')
+
+        with mock.patch.object(BaseRepository, 'get_estimated_count', return_value=2_000_000):
+            self.assertEqual(self.client.get(url).context['cl'].result_count, 2_000_000)
+            self.assertEqual(self.client.get(url, {'status': 'active'}).context['cl'].result_count, 1)
+
+
+class AdminBulkActionsTestCase(TestCase):
+    def setUp(self):
+        self.client.force_login(User.objects.create_superuser(username='admin', email='admin@example.com',
+                                                              password='pw'))
+        self.wise = PayoutMethod.objects.create(method='wise', payment_address='wise@example.com')
+        self.promoters, self.commissions = [], []
+        for index in range(3):
+            promoter = Promoter.objects.create(
+                user=User.objects.create(username=f'promoter{index}', email=f'promoter{index}@example.com'),
+                referral_token=f'TOKEN{index}', active_payout_method=self.wise if index else None,
+            )
+            referral = Referral.objects.create(
+                user=User.objects.create(username=f'referred{index}', email=f'referred{index}@example.com'),
+                promoter=promoter, invitation_method=InvitationMethodChoices.LINK, status=ReferralStateChoices.ACTIVE,
+            )
+            self.promoters.append(promoter)
+            self.commissions.append(PromoterCommission.objects.create(
+                promoter=promoter, referral=referral, amount=100 * (index + 1),
+                status=PromoterCommissionStatusChoices.MATURED,
+            ))
+
+    def _post_action(self, model, action, objects, **data):
+        return self.client.post(reverse(f'admin:referrals_{model}_changelist'), {
+            'action': action, '_selected_action': [obj.pk for obj in objects], **data,
+        }, follow=True)
+
+    def test_pay_selected_promoters(self):
+        self._post_action('promoter', 'pay_selected_promoters', self.promoters[:2])
+
+        self.assertEqual(
+            sorted(PromoterPayout.objects.values_list('promoter_id', 'amount', 'payout_method')),
+            [(self.promoters[0].id, 100, 'manual'), (self.promoters[1].id, 200, 'wise')],
+        )
+        self.assertEqual(
+            list(PromoterCommission.objects.order_by('id').values_list('status', flat=True)),
+            [PromoterCommissionStatusChoices.PAID, PromoterCommissionStatusChoices.PAID,
+             PromoterCommissionStatusChoices.MATURED],
+        )
+
+    def test_mark_failed_with_reason_and_retry(self):
+        response = self._post_action('promotercommission', 'mark_failed_with_reason', self.commissions[:2])
+        self.assertContains(response, 'Enter a failure reason')
+        self.assertFalse(PromoterCommission.objects.filter(status=PromoterCommissionStatusChoices.FAILED).exists())
+
+        self._post_action('promotercommission', 'mark_failed_with_reason', self.commissions[:2],
+                          failure_reason='Invalid IBAN')
+        self.assertEqual(
+            list(PromoterCommission.objects.filter(status=PromoterCommissionStatusChoices.FAILED)
+                 .values_list('failure_reason', flat=True)),
+            ['Invalid IBAN', 'Invalid IBAN'],
+        )
+
+        self._post_action('promotercommission', 'retry_failed', self.commissions)
+        self.assertFalse(PromoterCommission.objects.exclude(status=PromoterCommissionStatusChoices.MATURED).exists())
+        self.assertFalse(PromoterCommission.objects.filter(failure_reason__isnull=False).exists())
+
+    def test_large_selections_run_as_background_jobs(self):
+        with mock.patch.object(config, 'ADMIN_BULK_ACTION_SYNC_LIMIT', 2):
+            response = self._post_action('promotercommission', 'mark_failed_with_reason', self.commissions,
+                                         failure_reason='Chargeback')
+
+        job = BulkActionJob.objects.get()
+        self.assertContains(response, f'bulk action job #{job.id}')
+        self.assertEqual(job.status, BulkActionJobStatusChoices.PENDING)
+        self.assertFalse(PromoterCommission.objects.filter(status=PromoterCommissionStatusChoices.FAILED).exists())
+
+        call_command('run_bulk_action_jobs', stdout=StringIO())
+
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.processed), (BulkActionJobStatusChoices.DONE, 3))
+        self.assertEqual(PromoterCommission.objects.filter(status=PromoterCommissionStatusChoices.FAILED).count(), 3)
+
+
+class CommissionMaturationTestCase(TestCase):
+    def setUp(self):
+        self.program = ReferralProgram.objects.create(name='Program', commission_rate=Decimal('10.00'),
+                                                      commission_hold_days=30, is_active=True)
+        self.promoter = Promoter.objects.create(
+            user=User.objects.create(username='promoter', email='promoter@example.com', first_name='Promoter'),
+            referral_token='TOKEN', active_payout_method=PayoutMethod.objects.create(
+                method='wise', payment_address='promoter@example.com'),
+        )
+        self.referral = Referral.objects.create(
+            user=User.objects.create(username='referred', email='referred@example.com'), promoter=self.promoter,
+        )
+
+    def _create_commission(self, amount, days_ago, **kwargs):
+        commission = PromoterCommission.objects.create(promoter=self.promoter, referral=self.referral, amount=amount,
+                                                       **kwargs)
+        PromoterCommission.objects.filter(pk=commission.pk).update(created=timezone.now() - timedelta(days=days_ago))
+        return commission
+
+    def test_mature_due_commissions_in_chunks(self):
+        old = [self._create_commission(10, days_ago=40 + index) for index in range(5)]
+        recent = self._create_commission(10, days_ago=5)
+
+        out = StringIO()
+        call_command('mature_commissions', '--chunk-size', '2', stdout=out)
+
+        self.assertIn('Matured 5 commissions.', out.getvalue())
+        self.assertEqual(
+            set(PromoterCommission.objects.filter(status=PromoterCommissionStatusChoices.MATURED)
+                .values_list('id', flat=True)),
+            {commission.id for commission in old},
+        )
+        recent.refresh_from_db()
+        self.assertEqual(recent.status, PromoterCommissionStatusChoices.PENDING)
+
+    def test_payouts_only_pay_matured_commissions(self):
+        self._create_commission(300, days_ago=40)
+        held = self._create_commission(200, days_ago=5)
+        # A refund within the hold period is deducted from the next payout right away.
+        self._create_commission(-50, days_ago=1, status=PromoterCommissionStatusChoices.REFUND)
+
+        promoter = Promoter.objects.get(pk=self.promoter.pk)
+        self.assertEqual((promoter.current_balance, promoter.payable_balance), (450, -50))
+
+        csv = promoter_payout_service.send_wise_csv_for_promoters_payouts()
+
+        self.assertEqual(csv.splitlines()[1:], ['Promoter,promoter@example.com,250.0,USD,USD,target,EMAIL'])
+        held.refresh_from_db()
+        self.assertEqual(held.status, PromoterCommissionStatusChoices.PENDING)
+        promoter = Promoter.objects.get(pk=self.promoter.pk)
+        self.assertEqual((promoter.current_balance, promoter.payable_balance), (200, 0))
+
+
+    def test_held_commissions_cannot_fail(self):
+        held = self._create_commission(200, days_ago=5)
+        matured = self._create_commission(300, days_ago=40, status=PromoterCommissionStatusChoices.MATURED)
+
+        self.assertEqual(bulk_action_service.run(BulkActionChoices.FAIL_COMMISSIONS, [held.id, matured.id],
+                                                 failure_reason='Invalid IBAN'), 1)
+
+        self.assertEqual(PromoterCommission.objects.get(pk=held.pk).status, PromoterCommissionStatusChoices.PENDING)
+        self.assertEqual(Promoter.objects.get(pk=self.promoter.pk).payable_balance, 300)
+
+@mock.patch.object(config, 'OUTBOX_ENABLED', True)
+class OutboxTestCase(APITestCase):
+    def setUp(self):
+        ReferralProgram.objects.create(name='Program', commission_rate=Decimal('10.00'), is_active=True)
+        self.promoter = Promoter.objects.create(
+            user=User.objects.create(username='promoter', email='promoter@example.com', first_name='Promoter'),
+            referral_token='TOKEN', active_payout_method=PayoutMethod.objects.create(
+                method='wise', payment_address='promoter@example.com'),
+        )
+        self.user = User.objects.create(username='referred', email='referred@example.com')
+
+    def _event_types(self):
+        return list(OutboxEvent.objects.order_by('id').values_list('event_type', flat=True))
+
+    def test_lifecycle_events_are_recorded_with_their_changes(self):
+        response = self.client.post(reverse('referrals-list'), {'email': self.user.email, 'referral_token': 'TOKEN'})
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+
+        referral_service.handle_purchase_subscription(self.user, amount_paid=10000)
+        promoter_payout_service.send_wise_csv_for_promoters_payouts()
+        referral_service.handle_user_refund(self.user, amount_refunded=5000, amount_paid=10000)
+
+        self.assertEqual(self._event_types(), [
+            'referral.signup', 'referral.active', 'commission.created', 'payout.created', 'referral.refund',
+            'commission.created',
+        ])
+        events = list(OutboxEvent.objects.order_by('id'))
+        self.assertEqual(events[0].payload['promoter_id'], self.promoter.id)
+        self.assertEqual((events[2].payload['amount'], events[2].payload['level']), (10, 1))
+        self.assertEqual(events[3].aggregate_id, PromoterPayout.objects.get().id)
+        self.assertEqual(events[5].payload['amount'], -5)
+
+    def test_imports_and_backfills_record_events(self):
+        counts = referral_import_service.import_rows(referral_import_service.read_rows(
+            StringIO(f'email,referral_token,invitation_method,status,created\n{self.user.email},TOKEN,,active,\n')
+        ))
+        self.assertEqual(counts['imported'], 1)
+        referral = Referral.objects.get(user=self.user)
+
+        commissions = batch_commission_service.create_commissions([referral], [10000])
+
+        self.assertEqual(self._event_types(), ['referral.active', 'commission.created'])
+        events = list(OutboxEvent.objects.order_by('id'))
+        self.assertEqual((events[0].aggregate_id, events[0].payload['status']), (referral.id, 'active'))
+        self.assertEqual((events[1].aggregate_id, events[1].payload['amount']), (commissions[0].id, 10))
+
+    def test_events_reference_their_aggregate_without_bulk_insert_returning(self):
+        referral = Referral.objects.create(user=self.user, promoter=self.promoter, status=ReferralStateChoices.ACTIVE)
+        PromoterCommission.objects.create(promoter=self.promoter, referral=referral, amount=50,
+                                          status=PromoterCommissionStatusChoices.MATURED)
+
+        # MySQL doesn't return the primary keys of bulk-inserted rows.
+        with mock.patch.object(type(connection.features), 'can_return_rows_from_bulk_insert', False):
+            commissions = batch_commission_service.create_commissions([referral], [10000])
+            promoter_payout_service.pay_promoters([self.promoter.id])
+
+        events = OutboxEvent.objects.exclude(event_type='referral.active').order_by('id')
+        self.assertEqual(
+            list(events.values_list('event_type', 'aggregate_id')),
+            [('commission.created', commissions[0].id), ('payout.created', PromoterPayout.objects.get().id)],
+        )
+        self.assertIsNotNone(commissions[0].id)
+
+    def test_events_roll_back_with_their_change(self):
+        Referral.objects.create(user=self.user, promoter=self.promoter, status=ReferralStateChoices.ACTIVE)
+
+        with mock.patch.object(promoter_payout_service, 'calculate_refund', side_effect=RuntimeError('failed')):
+            with self.assertRaises(RuntimeError):
+                referral_service.handle_user_refund(self.user, amount_refunded=5000, amount_paid=10000)
+
+        self.assertEqual(self._event_types(), [])
+        self.assertEqual(Referral.objects.get(user=self.user).status, ReferralStateChoices.ACTIVE)
+
+    def test_nothing_is_recorded_when_disabled(self):
+        with mock.patch.object(config, 'OUTBOX_ENABLED', False):
+            self.client.post(reverse('referrals-list'), {'email': self.user.email, 'referral_token': 'TOKEN'})
+
+        self.assertFalse(OutboxEvent.objects.exists())
+
+    def test_relay_publishes_and_acknowledges_batches(self):
+        promoter_payout_service.create_level_commissions(
+            Referral.objects.create(user=self.user, promoter=self.promoter), amount_paid=10000
+        )
+        for _ in range(4):
+            outbox_service.record_payouts([PromoterPayout.objects.create(promoter=self.promoter, amount=1,
+                                                                         payout_method='wise')])
+
+        class FailingSink(OutboxSink):
+            def publish(self, events):
+                raise RuntimeError('unavailable')
+
+        with self.assertRaises(RuntimeError):
+            outbox_service.relay(FailingSink(), batch_size=2)
+        self.assertEqual(OutboxEvent.objects.filter(published_at__isnull=True).count(), 5)
+
+        stream = StringIO()
+        with track_queries() as stats:
+            published = outbox_service.relay(StreamSink(stream), batch_size=2)
+
+        self.assertEqual(published, 5)
+        # Per batch: the SELECT and the acknowledging UPDATE in a transaction, plus the final empty SELECT.
+        self.assertLessEqual(stats.count, 3 * 4)
+        events = [json.loads(line) for line in stream.getvalue().splitlines()]
+        self.assertEqual([event['type'] for event in events], ['commission.created'] + ['payout.created'] * 4)
+        self.assertEqual([event['id'] for event in events], sorted(event['id'] for event in events))
+        self.assertFalse(OutboxEvent.objects.filter(published_at__isnull=True).exists())
+        self.assertEqual(outbox_service.relay(StreamSink(stream)), 0)
+
+    def test_relay_outbox_events_command_appends_jsonl(self):
+        outbox_service.record_payouts([PromoterPayout.objects.create(promoter=self.promoter, amount=1,
+                                                                     payout_method='wise')])
+
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            path = os.path.join(tmp_dir, 'events.jsonl')
+            call_command('relay_outbox_events', '--sink', 'jsonl', '--path', path, stderr=StringIO())
+            with open(path) as events_file:
+                events = [json.loads(line) for line in events_file]
+
+        self.assertEqual([event['type'] for event in events], ['payout.created'])
+
+        with self.assertRaises(CommandError):
+            call_command('relay_outbox_events', '--sink', 'webhook', stderr=StringIO())
+
+
+class ClickIngestionTestCase(APITestCase):
+    def setUp(self):
+        self.promoters = [
+            promoter_service.create_new_promoter(User.objects.create(username=f'p{i}', email=f'p{i}@example.com'))
+            for i in range(3)
+        ]
+        Promoter.objects.filter(pk=self.promoters[2].pk).update(legacy_referral_token='LEGACY')
+        self.tokens = [promoter.referral_token for promoter in self.promoters]
+
+    def _link_clicked(self):
+        return list(Promoter.objects.order_by('id').values_list('link_clicked', flat=True))
+
+    def test_clicks_are_added_with_one_update_per_distinct_count(self):
+        forged = f'{self.tokens[0][:-4]}AAAA'
+        clicks = [(token, None, None) for token in [self.tokens[0], self.tokens[1], 'LEGACY', 'LEGACY', 'LEGACY',
+                                                    forged, 'UNKNOWN']]
+
+        with track_queries() as stats:
+            counts = click_ingestion_service.ingest(clicks)
+
+        self.assertEqual(counts, {'received': 7, 'counted': 5, 'rejected': 2})
+        self.assertEqual(self._link_clicked(), [1, 1, 3])
+        # The legacy token lookup, one UPDATE for the promoters clicked once and one for the one clicked three
+        # times, plus the transaction.
+        self.assertLessEqual(stats.count, 5)
+
+    def test_legacy_tokens_are_rejected_when_disabled(self):
+        with mock.patch.object(config, 'ACCEPT_LEGACY_REFERRAL_TOKENS', False):
+            counts = click_ingestion_service.ingest([('LEGACY', None, None), (self.tokens[0], None, None)])
+
+        self.assertEqual(counts['counted'], 1)
+        self.assertEqual(self._link_clicked(), [1, 0, 0])
+
+    def test_ingest_clicks_api(self):
+        url = reverse('referrals-ingest-clicks')
+        clicks = [[self.tokens[0], '2026-10-19T10:00:00Z', 'link'], [self.tokens[0], None, 'email'], [self.tokens[1]]]
+
+        self.client.force_authenticate(self.promoters[0].user)
+        self.assertEqual(self.client.post(url, {'clicks': clicks}, format='json').status_code,
+                         status.HTTP_403_FORBIDDEN)
+
+        self.client.force_authenticate(User.objects.create(username='staff', email='staff@example.com',
+                                                           is_staff=True))
+        response = self.client.post(url, {'clicks': clicks}, format='json')
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data, {'received': 3, 'counted': 3, 'rejected': 0})
+        self.assertEqual(self._link_clicked(), [2, 1, 0])
+
+        for invalid in ([], [[self.tokens[0], 'yesterday']], [{'referral_token': self.tokens[0]}], [[]]):
+            response = self.client.post(url, {'clicks': invalid}, format='json')
+            self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_import_click_logs_command(self):
+        link = referral_service.generate_referral_link('https://example.com/signup', self.tokens[1])
+        lines = [
+            f'203.0.113.1 - - [18/Oct/2026:23:59:59 +0000] "GET /?ref={self.tokens[0]} HTTP/1.1" 200 512',
+            f'203.0.113.2 - - [19/Oct/2026:08:00:00 +0000] "GET /?ref={self.tokens[0]}&ref-source=email HTTP/1.1" 200 '
+            f'512 "-" "Mozilla/5.0"',
+            f'203.0.113.3 - - [19/Oct/2026:09:00:00 +0000] "GET {link[len("https://example.com"):]} HTTP/2.0" 302 0',
+            '203.0.113.4 - - [19/Oct/2026:09:30:00 +0000] "GET /?ref=LEGACY HTTP/1.1" 200 512',
+            '203.0.113.5 - - [19/Oct/2026:10:00:00 +0000] "GET /pricing HTTP/1.1" 200 2048',
+        ]
+
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            path, empty_path = os.path.join(tmp_dir, 'access.log'), os.path.join(tmp_dir, 'empty.log')
+            with open(path, 'w') as log_file:
+                log_file.write('\n'.join(lines))
+            open(empty_path, 'w').close()
+
+            self.assertEqual(
+                list(click_ingestion_service.read_access_log(path))[:2],
+                [(self.tokens[0], None, None), (self.tokens[0], None, 'email')],
+            )
+
+            out = StringIO()
+            call_command('import_click_logs', path, empty_path, '--since', '2026-10-19', '--chunk-size', '2',
+                         stdout=out)
+
+            with self.assertRaises(CommandError):
+                call_command('import_click_logs', os.path.join(tmp_dir, 'missing.log'), stdout=StringIO())
+
+        self.assertIn('Counted 3 link clicks, rejected 0 hits.', out.getvalue())
+        self.assertEqual(self._link_clicked(), [1, 1, 1])
+
+
+class PromoterSummaryTestCase(APITestCase):
+    def setUp(self):
+        cache.clear()
+        self.addCleanup(cache.clear)
+        ReferralProgram.objects.create(name='Program', commission_rate=Decimal('10.00'), is_active=True)
+        self.promoter = promoter_service.create_new_promoter(
+            User.objects.create(username='promoter', email='promoter@example.com')
+        )
+        Promoter.objects.filter(pk=self.promoter.pk).update(link_clicked=12)
+        statuses = [ReferralStateChoices.SIGNUP, ReferralStateChoices.ACTIVE, ReferralStateChoices.ACTIVE,
+                    ReferralStateChoices.REFUND]
+        methods = [InvitationMethodChoices.LINK, InvitationMethodChoices.EMAIL, InvitationMethodChoices.LINK,
+                   InvitationMethodChoices.LINK]
+        referrals = [
+            Referral.objects.create(user=User.objects.create(username=f'user{i}', email=f'user{i}@example.com'),
+                                    promoter=self.promoter, status=status_, invitation_method=method)
+            for i, (status_, method) in enumerate(zip(statuses, methods))
+        ]
+        for amount, commission_status in ((10, PromoterCommissionStatusChoices.PAID),
+                                          (20, PromoterCommissionStatusChoices.MATURED),
+                                          (30, PromoterCommissionStatusChoices.PENDING),
+                                          (-5, PromoterCommissionStatusChoices.REFUND)):
+            PromoterCommission.objects.create(promoter=self.promoter, referral=referrals[1], amount=amount,
+                                              status=commission_status)
+        PromoterCommission.objects.filter(amount=10).update(created=timezone.now() - timedelta(days=30))
+        self.payout = PromoterPayout.objects.create(promoter=self.promoter, amount=10, payout_method='wise')
+        self.client.force_authenticate(self.promoter.user)
+
+    def test_summary_is_computed_with_grouped_queries(self):
+        url = reverse('referrals-summary')
+
+        with track_queries() as stats:
+            response = self.client.get(url)
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        # The promoter lookup with its payout totals, the referral counts and the commission totals.
+        self.assertEqual(stats.count, 3)
+
+        data = response.data
+        self.assertEqual(data['link_clicked'], 12)
+        self.assertEqual(data['referrals'], {
+            'total': 4,
+            'by_status': {'signup': 1, 'active': 2, 'refund': 1},
+            'by_invitation_method': {'email': 1, 'link': 3},
+        })
+        self.assertEqual(data['commissions'], {
+            'total': 55,
+            'by_status': {'pending': 30, 'matured': 20, 'paid': 10, 'failed': 0, 'refund': -5, 'flagged': 0},
+        })
+        self.assertEqual(data['payouts'], {'total': 10, 'count': 1, 'last_payout_at': self.payout.created})
+        self.assertEqual((data['balance'], data['payable_balance']), (45, 15))
+        self.assertEqual(len(data['recent_earnings']), 7)
+        self.assertEqual(data['recent_earnings'][-1], {'day': timezone.localdate().strftime('%a')[:2], 'value': 45})
+
+        with track_queries() as stats:
+            cached = self.client.get(url)
+        self.assertEqual(stats.count, 0)
+        self.assertEqual(cached.data, data)
+
+    def test_summary_is_not_cached_when_disabled(self):
+        with mock.patch.object(config, 'PROMOTER_SUMMARY_CACHE_SECONDS', 0):
+            self.client.get(reverse('referrals-summary'))
+            PromoterPayout.objects.create(promoter=self.promoter, amount=5, payout_method='wise')
+            response = self.client.get(reverse('referrals-summary'))
+
+        self.assertEqual(response.data['payouts']['count'], 2)
+
+    def test_summary_creates_the_promoter(self):
+        user = User.objects.create(username='new', email='new@example.com')
+        self.client.force_authenticate(user)
+
+        response = self.client.get(reverse('referrals-summary'))
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['promoter_id'], user.promoter.id)
+        self.assertEqual(response.data['referrals']['total'], 0)
+        self.assertEqual(response.data['payouts'], {'total': 0, 'count': 0, 'last_payout_at': None})
+
+
+class MultipleReferralProgramsTestCase(APITestCase):
+    def setUp(self):
+        cache.clear()
+        self.addCleanup(cache.clear)
+        self.default = ReferralProgram.objects.create(name='default', commission_rate=Decimal('10.00'),
+                                                      min_withdrawal_balance=Decimal('5.00'), commission_hold_days=30)
+        self.partners = ReferralProgram.objects.create(name='partners', commission_rate=Decimal('25.00'),
+                                                       min_withdrawal_balance=Decimal('50.00'))
+        ReferralProgramLevel.objects.create(program=self.default, level=2, commission_rate=Decimal('3.00'))
+        ReferralProgramLevel.objects.create(program=self.partners, level=2, commission_rate=Decimal('5.00'))
+
+        self.users = {name: User.objects.create(username=name, email=f'{name}@example.com') for name in 'abcd'}
+        self.regular = Promoter.objects.create(user=self.users['a'], referral_token='token-a')
+        self.partner = Promoter.objects.create(user=self.users['b'], referral_token='token-b', program=self.partners)
+
+    def test_the_first_active_program_is_the_default(self):
+        self.assertTrue(ReferralProgram.objects.get(pk=self.default.pk).is_default)
+        self.assertEqual(ReferralProgram.get_active_referral_program(), self.default)
+
+        call_command('create_referral_program', name='spring', commission_rate=Decimal('12.00'), default=True,
+                     stdout=StringIO())
+
+        self.assertEqual(list(ReferralProgram.objects.filter(is_default=True).values_list('name', flat=True)),
+                         ['spring'])
+        self.assertEqual(ReferralProgram.resolve().name, 'spring')
+        self.assertEqual(ReferralProgram.resolve(self.partners.id), self.partners)
+
+    def test_referrals_copy_the_rate_of_their_promoters_program_without_queries(self):
+        self.assertEqual(self.regular.min_withdrawal_balance, Decimal('5.00'))
+        self.assertEqual(self.partner.min_withdrawal_balance, Decimal('50.00'))
+
+        ReferralProgram.resolve()  # warm the program cache
+        with CaptureQueriesContext(connection) as queries:
+            regular_referral = Referral.objects.create(user=self.users['c'], promoter=self.regular)
+            partner_referral = Referral.objects.create(user=self.users['d'], promoter=self.partner)
+
+        self.assertEqual(regular_referral.commission_rate, Decimal('10.00'))
+        self.assertEqual(partner_referral.commission_rate, Decimal('25.00'))
+        self.assertFalse([query for query in queries if 'referrals_referralprogram' in query['sql']])
+
+        self.partners.commission_rate = Decimal('30.00')
+        self.partners.save()
+        self.assertEqual(ReferralProgram.resolve(self.partners.id).commission_rate, Decimal('30.00'))
+
+    def test_promoter_serializer_returns_the_program_rate(self):
+        self.client.force_authenticate(self.users['b'])
+
+        response = self.client.get(reverse('referrals-retrieve-promoter'))
+
+        self.assertEqual(response.data['commissionRate'], Decimal('25.00'))
+
+    def test_upline_earns_the_level_rate_of_its_own_program(self):
+        # b (partners) -> c -> d, a (default) -> ... -> d
+        promoter_c = Promoter.objects.create(user=self.users['c'], referral_token='token-c')
+        Referral.objects.create(user=self.users['c'], promoter=self.partner)
+        referral = Referral.objects.create(user=self.users['d'], promoter=promoter_c)
+
+        commissions = promoter_payout_service.create_level_commissions(referral, amount_paid=10000)
+
+        self.assertEqual([(c.promoter_id, c.level, c.amount) for c in commissions],
+                         [(promoter_c.id, 1, 10), (self.partner.id, 2, 5)])
+
+    def test_program_changes_are_propagated_in_background(self):
+        Promoter.objects.filter(pk=self.partner.pk).update(min_withdrawal_balance=Decimal('0.00'))
+        BulkActionJob.objects.all().delete()
+
+        self.partners.min_withdrawal_balance = Decimal('75.00')
+        self.partners.save()
+        self.default.min_withdrawal_balance = Decimal('20.00')
+        self.default.save()
+
+        self.assertEqual(list(BulkActionJob.objects.values_list('action', 'object_ids')),
+                         [('sync_program', [self.partners.id]), ('sync_program', [self.default.id])])
+        self.assertEqual(Promoter.objects.get(pk=self.partner.pk).min_withdrawal_balance, Decimal('0.00'))
+
+        call_command('run_bulk_action_jobs', stdout=StringIO())
+
+        self.assertEqual(Promoter.objects.get(pk=self.partner.pk).min_withdrawal_balance, Decimal('75.00'))
+        self.assertEqual(Promoter.objects.get(pk=self.regular.pk).min_withdrawal_balance, Decimal('20.00'))
+        self.assertEqual(list(BulkActionJob.objects.values_list('status', 'processed')), [('done', 1), ('done', 1)])
+
+    def test_assigning_a_program_raises_the_min_withdrawal_balance(self):
+        promoter = Promoter.objects.get(pk=self.regular.pk)
+        promoter.program = self.partners
+        promoter.save()
+
+        self.assertEqual(Promoter.objects.get(pk=self.regular.pk).min_withdrawal_balance, Decimal('50.00'))
+
+    def test_commissions_mature_after_the_hold_period_of_their_program(self):
+        referral = Referral.objects.create(user=self.users['c'], promoter=self.regular)
+        regular_commission = PromoterCommission.objects.create(promoter=self.regular, referral=referral, amount=10)
+        partner_commission = PromoterCommission.objects.create(promoter=self.partner, referral=referral, amount=10)
+
+        commission_maturation_service.mature_due_commissions(now=timezone.now() + timedelta(seconds=1))
+
+        regular_commission.refresh_from_db()
+        partner_commission.refresh_from_db()
+        self.assertEqual(regular_commission.status, PromoterCommissionStatusChoices.PENDING)
+        self.assertEqual(partner_commission.status, PromoterCommissionStatusChoices.MATURED)
+
+
+class VolumeTierTestCase(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.addCleanup(cache.clear)
+        self.program = ReferralProgram.objects.create(name='default', commission_rate=Decimal('10.00'))
+        ReferralProgramTier.objects.create(program=self.program, min_active_referrals=2,
+                                           commission_rate=Decimal('15.00'))
+        ReferralProgramTier.objects.create(program=self.program, min_active_referrals=4,
+                                           commission_rate=Decimal('20.00'))
+        BulkActionJob.objects.all().delete()
+
+        self.users = [User.objects.create(username=f'user-{i}', email=f'user-{i}@example.com') for i in range(5)]
+        self.promoter = Promoter.objects.create(user=self.users[0], referral_token='token')
+        self.referrals = [Referral.objects.create(user=user, promoter=self.promoter, status=ReferralStateChoices.SIGNUP)
+                          for user in self.users[1:]]
+
+    def test_get_tier_rate(self):
+        tiers = ReferralProgram.get_tiers()
+
+        self.assertEqual(tiers, [(2, Decimal('15.00')), (4, Decimal('20.00'))])
+        self.assertEqual([commission_tier_service.get_tier_rate(tiers, count) for count in range(6)],
+                         [None, None, Decimal('15.00'), Decimal('15.00'), Decimal('20.00'), Decimal('20.00')])
+
+    def test_activations_move_the_promoter_up_a_tier(self):
+        first = referral_service.handle_purchase_subscription(self.users[1], amount_paid=10000)
+        second = referral_service.handle_purchase_subscription(self.users[2], amount_paid=10000)
+
+        self.promoter.refresh_from_db()
+        self.assertEqual(self.promoter.active_referrals_count, 2)
+        self.assertEqual(self.promoter.tier_commission_rate, Decimal('15.00'))
+        self.assertEqual((first.amount, second.amount), (10, 15))
+
+    def test_tier_update_reads_the_new_count(self):
+        ReferralProgram.get_tiers()  # warm the program cache
+
+        with CaptureQueriesContext(connection) as queries:
+            commission_tier_service.record_active_referral(self.promoter)
+
+        # The count and then the tier, so the tier never depends on the order of SET assignments (MySQL).
+        self.assertEqual([query['sql'].split()[0] for query in queries], ['UPDATE', 'UPDATE'])
+
+    def test_refund_moves_the_promoter_down_a_tier(self):
+        for user in self.users[1:3]:
+            referral_service.handle_purchase_subscription(user, amount_paid=10000)
+
+        referral_service.handle_user_refund(self.users[2], amount_refunded=10000, amount_paid=10000)
+
+        self.promoter.refresh_from_db()
+        self.assertEqual(self.promoter.active_referrals_count, 1)
+        self.assertIsNone(self.promoter.tier_commission_rate)
+
+    def test_tier_changes_are_propagated_in_background(self):
+        Promoter.objects.filter(pk=self.promoter.pk).update(active_referrals_count=2)
+
+        ReferralProgramTier.objects.create(program=self.program, min_active_referrals=1,
+                                           commission_rate=Decimal('12.00'))
+
+        self.assertEqual(list(BulkActionJob.objects.values_list('action', 'object_ids')),
+                         [('sync_program', [self.program.id])])
+        call_command('run_bulk_action_jobs', stdout=StringIO())
+        self.assertEqual(Promoter.objects.get(pk=self.promoter.pk).tier_commission_rate, Decimal('15.00'))
+
+    def test_changing_the_program_recomputes_the_tier(self):
+        partners = ReferralProgram.objects.create(name='partners', commission_rate=Decimal('10.00'))
+        ReferralProgramTier.objects.create(program=partners, min_active_referrals=1, commission_rate=Decimal('30.00'))
+        Promoter.objects.filter(pk=self.promoter.pk).update(active_referrals_count=2)
+        promoter = Promoter.objects.get(pk=self.promoter.pk)
+
+        promoter.program = partners
+        promoter.save()
+        self.assertEqual(Promoter.objects.get(pk=promoter.pk).tier_commission_rate, Decimal('30.00'))
+
+        promoter.program = None
+        promoter.save()
+        self.assertEqual(Promoter.objects.get(pk=promoter.pk).tier_commission_rate, Decimal('15.00'))
+
+    def test_deactivating_a_program_syncs_the_default_program(self):
+        partners = ReferralProgram.objects.create(name='partners', commission_rate=Decimal('10.00'))
+        ReferralProgramTier.objects.create(program=partners, min_active_referrals=1, commission_rate=Decimal('30.00'))
+        Promoter.objects.filter(pk=self.promoter.pk).update(program=partners, active_referrals_count=4,
+                                                            tier_commission_rate=Decimal('30.00'))
+        BulkActionJob.objects.all().delete()
+
+        partners.is_active = False
+        partners.save()
+
+        self.assertEqual(list(BulkActionJob.objects.values_list('action', 'object_ids')),
+                         [('sync_program', [self.program.id])])
+        call_command('run_bulk_action_jobs', stdout=StringIO())
+        self.assertEqual(Promoter.objects.get(pk=self.promoter.pk).tier_commission_rate, Decimal('20.00'))
+
+    def test_recompute_recounts_bulk_changed_referrals(self):
+        Referral.objects.filter(promoter=self.promoter).update(status=ReferralStateChoices.ACTIVE)
+
+        call_command('recompute_promoter_tiers', recount=True, stdout=StringIO())
+
+        self.promoter.refresh_from_db()
+        self.assertEqual(self.promoter.active_referrals_count, 4)
+        self.assertEqual(self.promoter.tier_commission_rate, Decimal('20.00'))
+
+        commissions = batch_commission_service.create_commissions(self.referrals[:1], [10000])
+        self.assertEqual(commissions[0].amount, 20)
+
+
+class MultiCurrencyTestCase(APITestCase):
+    def setUp(self):
+        fx_rate_service.invalidate()
+        self.addCleanup(fx_rate_service.invalidate)
+        ReferralProgram.objects.create(name='default', commission_rate=Decimal('10.00'))
+        FxRate.objects.create(currency='EUR', rate=Decimal('1.10'))
+        FxRate.objects.create(currency='GBP', rate=Decimal('1.25'))
+
+        self.user = User.objects.create(username='promoter', email='promoter@example.com', first_name='Promoter')
+        self.payout_method = PayoutMethod.objects.create(method='wise', payment_address='promoter@example.com',
+                                                         currency='EUR')
+        self.promoter = Promoter.objects.create(user=self.user, referral_token='token',
+                                                active_payout_method=self.payout_method)
+        self.referred = User.objects.create(username='referred', email='referred@example.com')
+        self.referral = Referral.objects.create(user=self.referred, promoter=self.promoter,
+                                                status=ReferralStateChoices.SIGNUP)
+
+    def test_load_fx_rates(self):
+        with tempfile.NamedTemporaryFile('w', suffix='.csv', delete=False) as file:
+            file.write('currency,rate\neur,1.08\nCHF,1.12\n')
+        self.addCleanup(os.remove, file.name)
+
+        call_command('load_fx_rates', file.name, rate=['JPY=0.0067'], stdout=StringIO())
+
+        self.assertEqual(fx_rate_service.get_rates(), {
+            'EUR': Decimal('1.08'), 'GBP': Decimal('1.25'), 'CHF': Decimal('1.12'), 'JPY': Decimal('0.0067'),
+        })
+        with self.assertNumQueries(0):
+            self.assertEqual(fx_rate_service.get_rate('CHF'), Decimal('1.12'))
+            self.assertEqual(fx_rate_service.get_rate(config.BASE_CURRENCY), Decimal(1))
+        with self.assertRaises(CommandError):
+            call_command('load_fx_rates', rate=['EURO=1'], stdout=StringIO())
+
+    def test_commissions_keep_their_billing_currency(self):
+        commission = referral_service.handle_purchase_subscription(self.referred, amount_paid=20000, currency='EUR')
+
+        self.assertEqual((commission.currency, commission.original_amount, commission.amount), ('EUR', 20, 22))
+
+        refund = referral_service.handle_user_refund(self.referred, amount_refunded=10000, amount_paid=20000)
+        self.assertEqual((refund.currency, refund.original_amount, refund.amount), ('EUR', -10, -11))
+
+    def test_commissions_are_rounded_once(self):
+        FxRate.objects.create(currency='CAD', rate=Decimal('1.27'))
+        fx_rate_service.invalidate()
+
+        commission = referral_service.handle_purchase_subscription(self.referred, amount_paid=19900, currency='CAD')
+        batch_commission = batch_commission_service.create_commissions([self.referral], [19900], currencies=['CAD'])[0]
+
+        # 19.90 CAD at 1.27 is 25.27 USD, not 19 * 1.27.
+        self.assertEqual((commission.original_amount, commission.amount), (19, 25))
+        self.assertEqual((batch_commission.original_amount, batch_commission.amount), (19, 25))
+
+    def test_unknown_currency_is_rejected(self):
+        with self.assertRaises(ValueError):
+            referral_service.handle_purchase_subscription(self.referred, amount_paid=20000, currency='CHF')
+
+        self.assertEqual(Referral.objects.get(pk=self.referral.pk).status, ReferralStateChoices.SIGNUP)
+
+    def test_batch_commissions_match_the_single_path(self):
+        referrals = [self.referral, self.referral, self.referral]
+
+        commissions = batch_commission_service.create_commissions(
+            referrals, [20000, 20000, 99999], currencies=['EUR', 'GBP', 'USD']
+        )
+
+        self.assertEqual([(c.currency, c.original_amount, c.amount) for c in commissions],
+                         [('EUR', 20, 22), ('GBP', 20, 25), ('USD', 99, 99)])
+
+    def test_wise_payouts_are_converted_to_the_payee_currency(self):
+        PromoterCommission.objects.create(promoter=self.promoter, referral=self.referral, amount=100,
+                                          status=PromoterCommissionStatusChoices.MATURED)
+
+        csv = promoter_payout_service.send_wise_csv_for_promoters_payouts()
+
+        self.assertEqual(csv.splitlines()[1:], ['Promoter,promoter@example.com,90.0,USD,EUR,target,EMAIL'])
+        payout = PromoterPayout.objects.get(promoter=self.promoter)
+        self.assertEqual((payout.amount, payout.currency, payout.target_amount), (100, 'EUR', 90))
+
+    def test_payees_without_a_rate_are_skipped(self):
+        other = Promoter.objects.create(
+            user=User.objects.create(username='other', email='other@example.com', first_name='Other'),
+            referral_token='other-token',
+            active_payout_method=PayoutMethod.objects.create(method='wise', payment_address='other@example.com',
+                                                             currency='CHF'),
+        )
+        for promoter in (self.promoter, other):
+            PromoterCommission.objects.create(promoter=promoter, referral=self.referral, amount=100,
+                                              status=PromoterCommissionStatusChoices.MATURED)
+
+        csv = promoter_payout_service.send_wise_csv_for_promoters_payouts(chunk_size=1)
+
+        self.assertEqual(len(csv.splitlines()), 2)
+        self.assertEqual(list(PromoterPayout.objects.values_list('promoter_id', flat=True)), [self.promoter.id])
+        self.assertEqual(promoter_payout_service.pay_promoters([other.id]), 0)
+        self.assertEqual(Promoter.objects.get(pk=other.pk).payable_balance, 100)
+
+    def test_set_payout_method_currency(self):
+        self.client.force_authenticate(self.user)
+        url = reverse('referrals-set-payout-method')
+
+        response = self.client.patch(url, {'method': 'wise', 'payment_address': 'p@example.com', 'currency': 'chf'},
+                                     format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+        response = self.client.patch(url, {'method': 'wise', 'payment_address': 'p@example.com', 'currency': 'gbp'},
+                                     format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(PayoutMethod.objects.get(pk=self.payout_method.pk).currency, 'GBP')
+
+
+class FraudDetectionTestCase(APITestCase):
+    def setUp(self):
+        patcher = mock.patch.object(config, 'FRAUD_DETECTION_ENABLED', True)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        ReferralProgram.objects.create(name='default', commission_rate=Decimal('10.00'), commission_hold_days=0)
+
+        self.user = User.objects.create(username='promoter', email='promoter@example.com', first_name='Promoter')
+        self.promoter = Promoter.objects.create(
+            user=self.user, referral_token='token',
+            active_payout_method=PayoutMethod.objects.create(method='wise', payment_address='promoter@example.com'),
+        )
+        self.referred = [
+            User.objects.create(username=f'referred{index}', email=f'referred{index}@example.com')
+            for index in range(3)
+        ]
+
+    def _sign_up(self, user, ip_address, device=''):
+        response = self.client.post(reverse('referrals-list'), {'email': user.email, 'referral_token': 'token'},
+                                    format='json', REMOTE_ADDR=ip_address, HTTP_X_DEVICE_FINGERPRINT=device)
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        return Referral.objects.get(user=user)
+
+    def test_signup_from_the_promoter_device_is_flagged(self):
+        self.client.force_authenticate(self.user)
+        self.client.get(reverse('referrals-get-referral-link'), REMOTE_ADDR='10.0.0.1',
+                        HTTP_X_DEVICE_FINGERPRINT='device-1')
+        self.client.force_authenticate(None)
+
+        referral = self._sign_up(self.referred[0], '10.0.0.2', device=' DEVICE-1')
+
+        self.assertTrue(referral.is_flagged)
+        self.assertEqual(referral.flag_reason, FraudFlagReasonChoices.SELF_REFERRAL)
+        self.assertFalse(ReferralFingerprint.objects.filter(value_hash__in=['10.0.0.1', 'device-1']).exists())
+
+    def test_signup_from_the_promoter_ip_address_alone_is_not_flagged(self):
+        self.client.force_authenticate(self.user)
+        self.client.get(reverse('referrals-get-referral-link'), REMOTE_ADDR='10.0.0.9',
+                        HTTP_X_DEVICE_FINGERPRINT='device-7')
+        self.client.force_authenticate(None)
+
+        same_network = self._sign_up(self.referred[0], '10.0.0.9', device='device-8')
+        without_device = self._sign_up(self.referred[1], '10.0.0.9')
+
+        self.assertFalse(same_network.is_flagged)
+        self.assertFalse(without_device.is_flagged)
+
+    def test_duplicate_accounts_are_flagged(self):
+        first = self._sign_up(self.referred[0], '10.0.0.3', device='device-2')
+        duplicate = self._sign_up(self.referred[1], '10.0.0.4', device='device-2')
+        same_network = self._sign_up(self.referred[2], '10.0.0.3', device='device-3')
+
+        self.assertFalse(first.is_flagged)
+        self.assertEqual((duplicate.is_flagged, duplicate.flag_reason),
+                         (True, FraudFlagReasonChoices.DUPLICATE_ACCOUNT))
+        self.assertFalse(same_network.is_flagged)
+
+    def test_fingerprints_are_recorded_once_per_user(self):
+        for _ in range(2):
+            response = self.client.post(reverse('referrals-increment-link-clicked'), {'referral_token': 'token'},
+                                        format='json', REMOTE_ADDR='10.0.0.6', HTTP_X_DEVICE_FINGERPRINT='device-5')
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            fraud_service.screen_signup(self.promoter, self.referred[0].id, {'device': 'device-5'})
+
+        self.assertEqual(sorted(ReferralClickFingerprint.objects.values_list('kind', 'promoter_id')),
+                         [('device', self.promoter.id), ('ip', self.promoter.id)])
+        self.assertEqual(list(ReferralFingerprint.objects.values_list('event', 'user_id')),
+                         [('signup', self.referred[0].id)])
+
+    def test_signup_from_a_device_the_promoter_clicked_its_link_on_is_flagged(self):
+        self.client.force_authenticate(self.user)
+        for _ in range(2):
+            self.client.post(reverse('referrals-increment-link-clicked'), {'referral_token': 'token'},
+                             format='json', REMOTE_ADDR='10.0.0.7', HTTP_X_DEVICE_FINGERPRINT='device-6')
+        self.client.force_authenticate(None)
+
+        referral = self._sign_up(self.referred[0], '10.0.0.8', device='device-6')
+
+        self.assertEqual((referral.is_flagged, referral.flag_reason), (True, FraudFlagReasonChoices.SELF_REFERRAL))
+        self.assertEqual(ReferralFingerprint.objects.filter(event='click', user=self.user).count(), 2)
+        self.assertFalse(ReferralClickFingerprint.objects.exists())
+
+    def test_signup_check_is_a_single_lookup(self):
+        fingerprints = {'ip': '10.0.0.5', 'device': 'device-4'}
+
+        with self.assertNumQueries(2):
+            self.assertIsNone(fraud_service.screen_signup(self.promoter, self.referred[0].id, fingerprints))
+
+        with mock.patch.object(config, 'FRAUD_DETECTION_ENABLED', False), self.assertNumQueries(0):
+            fraud_service.screen_signup(self.promoter, self.referred[1].id, fingerprints)
+
+    def test_flagged_commissions_are_not_paid_out(self):
+        for user in self.referred[:2]:
+            Referral.objects.create(user=user, promoter=self.promoter, status=ReferralStateChoices.SIGNUP)
+        referral_service.handle_purchase_subscription(self.referred[0], amount_paid=20000, payment_fingerprint='card')
+        commission = referral_service.handle_purchase_subscription(self.referred[1], amount_paid=30000,
+                                                                   payment_fingerprint='CARD')
+
+        referral = Referral.objects.get(user=self.referred[1])
+        self.assertEqual(referral.flag_reason, FraudFlagReasonChoices.DUPLICATE_ACCOUNT)
+        self.assertEqual(commission.status, PromoterCommissionStatusChoices.FLAGGED)
+
+        self.assertEqual(promoter_payout_service.pay_promoters([self.promoter.id]), 1)
+        self.assertEqual(PromoterPayout.objects.get(promoter=self.promoter).amount, 20)
+
+        refund = referral_service.handle_user_refund(self.referred[1], amount_refunded=15000, amount_paid=30000)
+        self.assertEqual((refund.amount, refund.status), (-15, PromoterCommissionStatusChoices.FLAGGED))
+
+        self.assertEqual(fraud_service.clear_flags([referral.id]), 1)
+        self.assertEqual(
+            sorted(PromoterCommission.objects.filter(referral=referral).values_list('amount', 'status')),
+            [(-15, PromoterCommissionStatusChoices.REFUND), (30, PromoterCommissionStatusChoices.PENDING)],
+        )
+        self.assertFalse(Referral.objects.get(pk=referral.pk).is_flagged)
+
+    def test_flagging_keeps_the_refunds_of_paid_commissions(self):
+        paid, unpaid = [
+            Referral.objects.create(user=user, promoter=self.promoter, status=ReferralStateChoices.SIGNUP)
+            for user in self.referred[:2]
+        ]
+        referral_service.handle_purchase_subscription(self.referred[0], amount_paid=100000)
+        promoter_payout_service.pay_promoters([self.promoter.id])
+        referral_service.handle_user_refund(self.referred[0], amount_refunded=50000, amount_paid=100000)
+        referral_service.handle_purchase_subscription(self.referred[1], amount_paid=20000)
+        referral_service.handle_user_refund(self.referred[1], amount_refunded=10000, amount_paid=20000)
+        self.assertEqual(Promoter.objects.get(pk=self.promoter.pk).payable_balance, -60)
+
+        fraud_service.flag_referrals([paid.id, unpaid.id])
+
+        self.assertEqual(
+            sorted(PromoterCommission.objects.values_list('referral_id', 'amount', 'status')),
+            sorted([(paid.id, 100, PromoterCommissionStatusChoices.PAID),
+                    (paid.id, -50, PromoterCommissionStatusChoices.REFUND),
+                    (unpaid.id, 20, PromoterCommissionStatusChoices.FLAGGED),
+                    (unpaid.id, -10, PromoterCommissionStatusChoices.FLAGGED)]),
+        )
+        self.assertEqual(Promoter.objects.get(pk=self.promoter.pk).payable_balance, -50)
+
+    def test_detect_referral_fraud_command(self):
+        for index, user in enumerate(self.referred):
+            promoter = Promoter.objects.create(
+                user=User.objects.create(username=f'other{index}', email=f'other{index}@example.com'),
+                referral_token=f'token-{index}',
+            )
+            Referral.objects.create(user=user, promoter=promoter, status=ReferralStateChoices.SIGNUP)
+            self.assertIsNone(fraud_service.screen_signup(promoter, user.id, {'device': 'shared-device'}))
+        with tempfile.NamedTemporaryFile(suffix='.csv', delete=False) as file:
+            pass
+        self.addCleanup(os.remove, file.name)
+
+        out = StringIO()
+        call_command('detect_referral_fraud', '--min-accounts', '3', '--output', file.name, stdout=out)
+
+        self.assertIn('Found 3 clustered accounts of 3 promoters, flagged 3 referrals.', out.getvalue())
+        self.assertEqual(Referral.objects.filter(flag_reason=FraudFlagReasonChoices.FINGERPRINT_CLUSTER).count(), 3)
+        with open(file.name) as report:
+            self.assertEqual(len(list(csv.DictReader(report))), 3)
+
+        call_command('detect_referral_fraud', '--min-accounts', '4', stdout=out)
+        self.assertIn('Found 0 clustered accounts', out.getvalue())
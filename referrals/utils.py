@@ -1,6 +1,9 @@
-from typing import Any, Dict
+from datetime import date, datetime, time, timedelta
+from typing import Any, Dict, Optional, Union
 from urllib.parse import urlencode, urlparse, urlunparse, parse_qs
 
+from django.utils import timezone
+
 
 def append_query_params(url: str, params: Dict[str, Any]) -> str:
     """
@@ -26,3 +29,44 @@ def append_query_params(url: str, params: Dict[str, Any]) -> str:
 
     url_parts[4] = urlencode(query, doseq=True)
     return urlunparse(url_parts)
+
+
+def get_date_range_filters(field: str, date_from: Optional[date] = None, date_to: Optional[date] = None) -> Dict[str, datetime]:
+    """
+    Builds queryset filter kwargs that limit a datetime field to an inclusive range of dates.
+
+    The bounds are expressed as aware datetimes (instead of `__date` lookups) so the database can
+    use an index on the field.
+
+    Args:
+        field (str): The name of the datetime field to filter on.
+        date_from (Optional[date]): The first day of the range, inclusive.
+        date_to (Optional[date]): The last day of the range, inclusive.
+
+    Returns:
+        Dict[str, datetime]: Filter kwargs to pass to `QuerySet.filter`.
+    """
+    filters = {}
+    if date_from:
+        filters[f"{field}__gte"] = timezone.make_aware(datetime.combine(date_from, time.min))
+    if date_to:
+        filters[f"{field}__lt"] = timezone.make_aware(datetime.combine(date_to + timedelta(days=1), time.min))
+    return filters
+
+
+def get_as_of_datetime(value: Union[date, datetime]) -> datetime:
+    """
+    Converts a point in time for ledger queries to an aware datetime.
+
+    A date means "as of the end of that day", so it is converted to the start of the next day and
+    ledger rows created strictly before the returned datetime are included.
+
+    Args:
+        value (Union[date, datetime]): A date or a datetime.
+
+    Returns:
+        datetime: An aware datetime to use as an exclusive upper bound.
+    """
+    if isinstance(value, datetime):
+        return value if timezone.is_aware(value) else timezone.make_aware(value)
+    return timezone.make_aware(datetime.combine(value + timedelta(days=1), time.min))
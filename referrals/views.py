@@ -1,6 +1,8 @@
 import logging
 
 from django.contrib.auth.models import User
+from django.db import transaction
+from django.http import Http404, HttpResponse, StreamingHttpResponse
 from rest_framework import permissions, status, viewsets
 from rest_framework.decorators import action
 from rest_framework.pagination import PageNumberPagination
@@ -8,10 +10,14 @@ from rest_framework.response import Response
 from rest_framework.status import HTTP_200_OK, HTTP_201_CREATED
 
 from referrals.choices import (
+    FingerprintKindChoices,
     InvitationMethodChoices,
     ReferralStateChoices,
 )
+from referrals.config import config
+from referrals.db_router import read_replica
 from referrals.exceptions import ViewException
+from referrals.instrumentation import PROMETHEUS_CONTENT_TYPE, QueryInstrumentationMixin, metrics_registry
 from referrals.models import PayoutMethod, PromoterPayout, ReferralProgram
 from referrals.repositories.promoter_repository import promoter_repository
 from referrals.repositories.referral_repository import referral_repository
@@ -19,13 +25,26 @@ from referrals.serializers import (
     PayoutMethodSerializer,
     PromoterPayoutsSerializer,
     PromoterSerializer,
-    ReferralSerializer, MinWithdrawalBalanceSerializer,
+    ReferralSerializer, MinWithdrawalBalanceSerializer, FunnelQuerySerializer, ExportQuerySerializer,
+    BalancesAsOfQuerySerializer, OnboardPromotersSerializer, IngestClicksSerializer,
 )
-from referrals.services import promoter_service, referral_service
+from referrals.services import balance_snapshot_service, click_ingestion_service, fraud_service, \
+    funnel_analytics_service, fx_rate_service, outbox_service, promoter_service, promoter_summary_service, \
+    referral_service, referral_tree_service
+from referrals.services.export_service import CONTENT_TYPES, export_service
 
 logger = logging.getLogger(__name__)
 
 
+def _get_request_fingerprints(request) -> dict:
+    """The raw IP address and device fingerprints of a request, hashed by `fraud_service` before storing."""
+    ip_address = request.META.get(config.FRAUD_IP_HEADER, "").split(",")[0]
+    return {
+        FingerprintKindChoices.IP: ip_address,
+        FingerprintKindChoices.DEVICE: request.headers.get("X-Device-Fingerprint", ""),
+    }
+
+
 class ReferralsPagination(PageNumberPagination):
     page_size = 10
     page_size_query_param = "page_size"
@@ -41,6 +60,7 @@ class ReferralsPagination(PageNumberPagination):
 
 
 class ReferralProgramViewSet(
+    QueryInstrumentationMixin,
     viewsets.GenericViewSet,
 ):
     pagination_class = ReferralsPagination
@@ -60,6 +80,7 @@ class ReferralProgramViewSet(
     def get_referral_link(self, request, *args, **kwargs):
         user = request.user
         promoter = promoter_service.get_or_create_promoter(user=user)
+        fraud_service.record_promoter(promoter, _get_request_fingerprints(request))
         return Response({"referralLink": promoter.referral_link}, status=HTTP_200_OK)
 
     @action(detail=False, methods=["GET"], url_path="promoter")
@@ -79,13 +100,20 @@ class ReferralProgramViewSet(
 
         method = serializer.validated_data.get("method")
         payment_address = serializer.validated_data.get("payment_address")
+        currency = serializer.validated_data.get("currency")
+        if currency and not fx_rate_service.is_supported(currency):
+            return Response({"currency": [f"Payouts in {currency} are not supported."]},
+                            status=status.HTTP_400_BAD_REQUEST)
 
         if promoter.active_payout_method:
             promoter.active_payout_method.method = method
             promoter.active_payout_method.payment_address = payment_address
+            if currency:
+                promoter.active_payout_method.currency = currency
             promoter.active_payout_method.save()
         else:
-            payout_method = PayoutMethod.objects.create(method=method, payment_address=payment_address)
+            payout_method = PayoutMethod.objects.create(method=method, payment_address=payment_address,
+                                                        **({"currency": currency} if currency else {}))
             promoter.active_payout_method = payout_method
             promoter.save()
 
@@ -102,7 +130,7 @@ class ReferralProgramViewSet(
             return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
         min_withdrawal_balance = serializer.validated_data.get("min_withdrawal_balance")
-        program_min_withdrawal_balance = ReferralProgram.get_active_referral_program().min_withdrawal_balance
+        program_min_withdrawal_balance = ReferralProgram.resolve(promoter.program_id).min_withdrawal_balance
 
         if min_withdrawal_balance < program_min_withdrawal_balance:
             raise ViewException(
@@ -116,6 +144,7 @@ class ReferralProgramViewSet(
         return Response(promoter_serializer.data, status=status.HTTP_200_OK)
 
     @action(detail=False, methods=["GET"], url_path="promoter-recent-earnings")
+    @read_replica()
     def promoter_recent_earnings(self, request, *args, **kwargs):
         user = request.user
 
@@ -123,7 +152,14 @@ class ReferralProgramViewSet(
         result = referral_service.get_last_7_days_earnings(earnings)
         return Response(result, status=HTTP_200_OK)
 
+    @action(detail=False, methods=["GET"], url_path="summary")
+    @read_replica()
+    def summary(self, request, *args, **kwargs):
+        """Headline numbers of the promoter dashboard in one response, cached per promoter."""
+        return Response(promoter_summary_service.get_summary(request.user), status=HTTP_200_OK)
+
     @action(detail=False, methods=["GET"], url_path="payouts")
+    @read_replica()
     def promoter_payment_history(self, request, *args, **kwargs):
         user = request.user
 
@@ -131,6 +167,77 @@ class ReferralProgramViewSet(
         serializer = PromoterPayoutsSerializer(payouts, many=True)
         return Response(serializer.data)
 
+    @action(detail=False, methods=["GET"], url_path="downline")
+    @read_replica()
+    def downline(self, request, *args, **kwargs):
+        """Size of the promoter's multi-level downline, in total and per level."""
+        promoter = promoter_service.get_or_create_promoter(user=request.user)
+        return Response(referral_tree_service.get_downline(promoter.id), status=HTTP_200_OK)
+
+    @action(detail=False, methods=["GET"], url_path="funnel")
+    @read_replica()
+    def funnel(self, request, *args, **kwargs):
+        """Conversion funnel of the promoter's referrals, or of the whole program for staff users."""
+        serializer = FunnelQuerySerializer(data=request.query_params)
+        if not serializer.is_valid():
+            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
+        promoter_id = None
+        if not request.user.is_staff:
+            promoter_id = promoter_service.get_or_create_promoter(user=request.user).id
+
+        result = funnel_analytics_service.get_funnel(promoter_id=promoter_id, **serializer.validated_data)
+        return Response(result, status=HTTP_200_OK)
+
+    @action(detail=False, methods=["GET"], url_path="export", permission_classes=[permissions.IsAdminUser])
+    @read_replica()
+    def export(self, request, *args, **kwargs):
+        """Streams an accounting export of commissions, payouts or referrals for staff users."""
+        serializer = ExportQuerySerializer(data=request.query_params)
+        if not serializer.is_valid():
+            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
+        params = serializer.validated_data
+        dataset, file_format, compress = params.pop("dataset"), params.pop("file_format"), params.pop("gzip")
+
+        response = StreamingHttpResponse(
+            export_service.stream(dataset, file_format=file_format, compress=compress, **params),
+            content_type="application/gzip" if compress else CONTENT_TYPES[file_format],
+        )
+        filename = export_service.get_filename(dataset, file_format, compress)
+        response["Content-Disposition"] = f'attachment; filename="{filename}"'
+        return response
+
+    @action(detail=False, methods=["GET"], url_path="balances-as-of", permission_classes=[permissions.IsAdminUser])
+    @read_replica()
+    def balances_as_of(self, request, *args, **kwargs):
+        """Paginated balances of all promoters at the end of the given date, for staff users."""
+        serializer = BalancesAsOfQuerySerializer(data=request.query_params)
+        if not serializer.is_valid():
+            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
+        promoter_ids = self.paginate_queryset(promoter_repository.get_all().order_by("id").values_list("id", flat=True))
+        balances = balance_snapshot_service.get_balances_as_of(serializer.validated_data["date"], list(promoter_ids))
+        return self.get_paginated_response(balances)
+
+    @action(detail=False, methods=["POST"], url_path="onboard-promoters", permission_classes=[permissions.IsAdminUser])
+    def onboard_promoters(self, request, *args, **kwargs):
+        """Enrolls up to 10000 users as promoters in bulk, for staff users. Larger user bases use the
+        `onboard_promoters` management command."""
+        serializer = OnboardPromotersSerializer(data=request.data)
+        if not serializer.is_valid():
+            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
+        user_ids = serializer.validated_data["user_ids"]
+        created = promoter_service.onboard_promoters(user_ids)
+        return Response({"processed": len(user_ids), "created": created}, status=HTTP_201_CREATED)
+
+    @action(detail=False, methods=["GET"], url_path="metrics", permission_classes=[permissions.IsAdminUser])
+    def metrics(self, request, *args, **kwargs):
+        """Latency histograms and query counters of this process in the Prometheus text format, for staff users."""
+        return HttpResponse(metrics_registry.render(), content_type=PROMETHEUS_CONTENT_TYPE)
+
+    @read_replica()
     def list(self, request, *args, **kwargs):
         """List referrals objects"""
         queryset = self.get_queryset()
@@ -150,25 +257,44 @@ class ReferralProgramViewSet(
 
         referral_token: str = request.data.get("referral_token")
         invitation_method: str = request.data.get("referral_source", InvitationMethodChoices.LINK.value)
-        promoter = promoter_repository.get_object_or_404(referral_token=referral_token)
+        promoter_id = promoter_service.resolve_referral_token(referral_token)
+        if promoter_id is None:
+            raise Http404("No Promoter matches the given query.")
+        promoter = promoter_repository.get_object_or_404(pk=promoter_id)
 
-        if promoter.user == user:
+        if promoter.user_id == user.id:
             raise ViewException("You can't refer to yourself.", status_code=400)
 
-        referral = referral_repository.create(
-            user=user,
-            promoter=promoter,
-            invitation_method=invitation_method if invitation_method else InvitationMethodChoices.LINK.value,
-            status=ReferralStateChoices.SIGNUP.value,
-        )
+        with transaction.atomic():
+            flag_reason = fraud_service.screen_signup(promoter, user.id, _get_request_fingerprints(request))
+            referral = referral_repository.create(
+                user=user,
+                promoter=promoter,
+                invitation_method=invitation_method if invitation_method else InvitationMethodChoices.LINK.value,
+                status=ReferralStateChoices.SIGNUP.value,
+                is_flagged=bool(flag_reason),
+                flag_reason=flag_reason or "",
+            )
+            outbox_service.record_referral(referral)
         serializer = self.get_serializer(referral)
         return Response(serializer.data, status=HTTP_201_CREATED)
 
     @action(detail=False, methods=["POST"], url_path="increment-link-clicked")
     def increment_link_clicked(self, request, *args, **kwargs):
-        referral_token = request.data.get("referral_token")
-        promoter = promoter_repository.get_object_or_404(referral_token=referral_token)
+        promoter_id = promoter_service.resolve_referral_token(request.data.get("referral_token"))
+        if promoter_id is None or not promoter_repository.increment_link_clicked(promoter_id):
+            raise Http404("No Promoter matches the given query.")
+        fraud_service.record_click(promoter_id, _get_request_fingerprints(request), request.user.id)
 
-        promoter.link_clicked = promoter.link_clicked + 1
-        promoter.save()
         return Response({"message": "Link clicked count incremented successfully"}, status=status.HTTP_200_OK)
+
+    @action(detail=False, methods=["POST"], url_path="ingest-clicks", permission_classes=[permissions.IsAdminUser])
+    def ingest_clicks(self, request, *args, **kwargs):
+        """Counts up to 10000 referral link clicks at once, for staff users and edge log shippers. Whole access
+        logs are counted with the `import_click_logs` management command."""
+        serializer = IngestClicksSerializer(data=request.data)
+        if not serializer.is_valid():
+            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
+        counts = click_ingestion_service.ingest(serializer.validated_data["clicks"])
+        return Response(counts, status=HTTP_200_OK)